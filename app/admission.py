@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from .scheduling import PRIORITY_BULK, FairQueue, parse_weights
+from .stats import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class OverloadedError(Exception):
+    """Raised when a request cannot be admitted; retry_after is a hint in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _ModelLimiter:
+    """Concurrency slots and fair-queued waiters for one model"""
+
+    __slots__ = ("active", "waiters", "avg_service_time")
+
+    def __init__(self, waiters: FairQueue):
+        self.active = 0
+        self.waiters = waiters
+        self.avg_service_time = 1.0  # EWMA of slot hold time, seconds
+
+
+class AdmissionController:
+    """
+    Per-model concurrency limiter with a bounded, weighted-fair wait queue.
+    Requests beyond max_concurrency wait up to max_wait seconds for a slot and are
+    served by priority class weight, then fairly across users within a class.
+    Once max_queue requests of a class are waiting, new ones are rejected immediately.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 64, max_wait: float = 30.0,
+                 class_weights: Optional[Dict[str, float]] = None,
+                 user_weights: Optional[Dict[str, float]] = None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.class_weights = class_weights
+        self.user_weights = user_weights
+        self._limiters: Dict[str, _ModelLimiter] = {}
+
+        # Metrics, per priority class
+        self.wait_histograms: Dict[str, Histogram] = {}
+        self.admitted: Dict[str, int] = {}
+        self.rejected: Dict[str, int] = {}
+        self.timeouts = 0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_concurrency=int(os.getenv("LLM_ADMISSION_MAX_CONCURRENCY", "4")),
+            max_queue=int(os.getenv("LLM_ADMISSION_MAX_QUEUE", "64")),
+            max_wait=float(os.getenv("LLM_ADMISSION_MAX_WAIT", "30")),
+            class_weights=parse_weights(os.getenv("LLM_SCHEDULER_CLASS_WEIGHTS")) or None,
+            user_weights=parse_weights(os.getenv("LLM_SCHEDULER_USER_WEIGHTS"))
+        )
+
+    def _limiter(self, model: str) -> _ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limiter = self._limiters[model] = _ModelLimiter(FairQueue(self.class_weights, self.user_weights))
+        return limiter
+
+    def _retry_after(self, limiter: _ModelLimiter) -> int:
+        """Seconds until the current queue is expected to drain"""
+        backlog = len(limiter.waiters) + limiter.active
+        return max(1, math.ceil(backlog * limiter.avg_service_time / self.max_concurrency))
+
+    def _must_wait(self, limiter: _ModelLimiter) -> bool:
+        """A new request would queue rather than take a slot straight away"""
+        return limiter.active >= self.max_concurrency or bool(limiter.waiters)
+
+    def check(self, model: str, priority: str = PRIORITY_BULK):
+        """Reject up front when the request would have to queue and the class's queue is full"""
+        limiter = self._limiter(model)
+        if self._must_wait(limiter) and limiter.waiters.class_size(priority) >= self.max_queue:
+            self.rejected[priority] = self.rejected.get(priority, 0) + 1
+            raise OverloadedError(f"Too many queued requests for model {model}", self._retry_after(limiter))
+
+    def saturation(self) -> float:
+        """Fill level (0..1) of the fullest per-class wait queue across models"""
+        fullest = 0.0
+        for limiter in self._limiters.values():
+            for priority in limiter.waiters.class_weights:
+                queued = limiter.waiters.class_size(priority)
+                if queued:
+                    fullest = max(fullest, min(1.0, queued / self.max_queue) if self.max_queue else 1.0)
+        return fullest
+
+    def in_flight(self, model: str) -> int:
+        """Requests holding or waiting for one of the model's slots"""
+        limiter = self._limiters.get(model)
+        return limiter.active + len(limiter.waiters) if limiter else 0
+
+    @asynccontextmanager
+    async def admit(self, model: str, priority: str = PRIORITY_BULK, user_id: Optional[str] = None):
+        """Hold one of the model's concurrency slots for the duration of the block"""
+        limiter = self._limiter(model)
+        start = time.time()
+        await self._acquire(model, limiter, priority, user_id)
+        self.admitted[priority] = self.admitted.get(priority, 0) + 1
+        histogram = self.wait_histograms.get(priority)
+        if histogram is None:
+            histogram = self.wait_histograms[priority] = Histogram()
+        histogram.observe(time.time() - start)
+
+        acquired_at = time.time()
+        try:
+            yield
+        finally:
+            held = time.time() - acquired_at
+            limiter.avg_service_time = 0.8 * limiter.avg_service_time + 0.2 * held
+            self._release(limiter)
+
+    async def _acquire(self, model: str, limiter: _ModelLimiter, priority: str, user_id: Optional[str]):
+        if not self._must_wait(limiter):
+            limiter.active += 1
+            return
+
+        self.check(model, priority)
+        waiter = asyncio.get_running_loop().create_future()
+        limiter.waiters.push(waiter, priority, user_id)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.rejected[priority] = self.rejected.get(priority, 0) + 1
+            raise OverloadedError(
+                f"Timed out after {self.max_wait:.0f}s waiting for model {model}",
+                self._retry_after(limiter)
+            )
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the caller went away
+            if waiter.done() and not waiter.cancelled():
+                self._release(limiter)
+            raise
+        finally:
+            limiter.waiters.remove(waiter, priority, user_id)
+
+    def _release(self, limiter: _ModelLimiter):
+        # Hand the slot straight to the next live waiter in fair order
+        while limiter.waiters:
+            waiter, _ = limiter.waiters.pop()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        limiter.active -= 1
+
+    def get_stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_depth": sum(len(limiter.waiters) for limiter in self._limiters.values()),
+            "active": sum(limiter.active for limiter in self._limiters.values()),
+            "models": {
+                model: {
+                    "active": limiter.active,
+                    "queued": {priority: limiter.waiters.class_size(priority) for priority in limiter.waiters.class_weights}
+                }
+                for model, limiter in self._limiters.items()
+            },
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "timeouts": self.timeouts,
+            "wait_seconds": {priority: histogram.snapshot() for priority, histogram in self.wait_histograms.items()},
+        }
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from .stats import Histogram
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+SendBatch = Callable[[Hashable, List[Any]], Awaitable[List[Any]]]
+
+
+class _PendingBatch:
+    __slots__ = ("items", "futures", "enqueued_at", "timer")
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.futures: List[asyncio.Future] = []
+        self.enqueued_at: List[float] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests that share a key (e.g. model and parameters) and
+    sends them upstream as one call. A batch is flushed when it reaches
+    max_batch_size or window_ms after its first item arrived, whichever comes first.
+    send_batch receives the key and the items and returns one result per item.
+    """
+
+    def __init__(self, send_batch: SendBatch, max_batch_size: int = 8, window_ms: float = 10.0):
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000.0
+        self._pending: Dict[Hashable, _PendingBatch] = {}
+
+        # Metrics
+        self.batch_size_histogram = Histogram(buckets=BATCH_SIZE_BUCKETS)
+        self.wait_histogram = Histogram()
+        self.batches_sent = 0
+        self.batch_errors = 0
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        """Queue one item and wait for its share of the batched result"""
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _PendingBatch()
+            batch.timer = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+
+        future = asyncio.get_running_loop().create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        batch.enqueued_at.append(time.time())
+        if len(batch.items) >= self.max_batch_size:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: Hashable):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        asyncio.ensure_future(self._send(key, batch))
+
+    async def _send(self, key: Hashable, batch: _PendingBatch):
+        now = time.time()
+        for enqueued_at in batch.enqueued_at:
+            self.wait_histogram.observe(now - enqueued_at)
+        self.batch_size_histogram.observe(len(batch.items))
+        self.batches_sent += 1
+
+        try:
+            results = await self.send_batch(key, batch.items)
+            if len(results) != len(batch.items):
+                raise ValueError(f"Batch of {len(batch.items)} items returned {len(results)} results")
+        except Exception as e:
+            self.batch_errors += 1
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000.0,
+            "batches_sent": self.batches_sent,
+            "batch_errors": self.batch_errors,
+            "pending_batches": len(self._pending),
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "wait_seconds": self.wait_histogram.snapshot(),
+        }
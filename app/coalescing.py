@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def generation_key(provider: str, model: str, prompt: str, context: str) -> str:
+    """Fingerprint of everything that determines an upstream generation"""
+    digest = hashlib.sha256()
+    for part in (provider, model, prompt, context):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class _Broadcast:
+    """Buffered fan-out of one upstream stream to any number of subscribers"""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.pump: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, item: Any):
+        self.items.append(item)
+        self._notify()
+
+    def close(self, error: Optional[BaseException] = None):
+        self.finished = True
+        self.error = error
+        self._notify()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        """Replay buffered items, then follow the live stream"""
+        index = 0
+        while True:
+            if index < len(self.items):
+                yield self.items[index]
+                index += 1
+            elif self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._changed.wait()
+
+
+class _Call:
+    """One shared call and the number of callers still waiting for it"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical generations so they share one upstream call.
+    The first caller for a key runs the work; later callers await the same result.
+    The shared work is cancelled once every caller has gone away.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+
+        # Metrics
+        self.calls_total = 0
+        self.calls_coalesced = 0
+        self.calls_abandoned = 0
+        self.streams_total = 0
+        self.streams_coalesced = 0
+        self.streams_abandoned = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() once per key among concurrent callers and share its result"""
+        self.calls_total += 1
+        call = self._calls.get(key)
+        if call is not None:
+            self.calls_coalesced += 1
+        else:
+            call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda done, key=key: self._finish_call(key, done))
+
+        call.waiters += 1
+        try:
+            # Shield so that one caller going away does not cancel the shared call
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is left to receive the result
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+                self.calls_abandoned += 1
+
+    def _finish_call(self, key: str, task: asyncio.Future):
+        call = self._calls.get(key)
+        if call is not None and call.task is task:
+            del self._calls[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Coalesced call failed: {task.exception()}")
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Share one upstream stream among concurrent callers with the same key"""
+        self.streams_total += 1
+        broadcast = self._streams.get(key)
+        if broadcast is not None:
+            self.streams_coalesced += 1
+        else:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            broadcast.pump = asyncio.ensure_future(self._pump(key, broadcast, fn()))
+
+        broadcast.subscribers += 1
+        try:
+            async for item in broadcast.subscribe():
+                yield item
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.finished:
+                # Stop the upstream stream once the last subscriber has left
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+                broadcast.pump.cancel()
+                self.streams_abandoned += 1
+
+    async def _pump(self, key: str, broadcast: _Broadcast, source: AsyncIterator[Any]):
+        try:
+            async for item in source:
+                broadcast.publish(item)
+            broadcast.close()
+        except Exception as e:
+            broadcast.close(e)
+        finally:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+
+    def get_stats(self) -> dict:
+        return {
+            "in_flight_calls": len(self._calls),
+            "in_flight_streams": len(self._streams),
+            "calls_total": self.calls_total,
+            "calls_coalesced": self.calls_coalesced,
+            "calls_abandoned": self.calls_abandoned,
+            "streams_total": self.streams_total,
+            "streams_coalesced": self.streams_coalesced,
+            "streams_abandoned": self.streams_abandoned,
+        }
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .conversation_store import Message
+
+logger = logging.getLogger(__name__)
+
+# English text averages roughly four characters per token for LLaMA-style tokenizers
+CHARS_PER_TOKEN = 4
+
+# Context window sizes (tokens) of the models in LLMService.AVAILABLE_MODELS
+MODEL_CONTEXT_TOKENS = {
+    "tinyllama": 2048,
+    "phi": 2048,
+    "llama2": 4096,
+    "deepseek-coder": 16384,
+    "codellama": 16384,
+    "mistral": 8192,
+    "neural-chat": 8192,
+}
+DEFAULT_CONTEXT_TOKENS = 2048
+
+
+def approx_token_count(text: str) -> int:
+    """Cheap token estimate; never undercounts non-empty text as zero"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class ContextWindow:
+    """
+    Chooses which history messages fit a model's prompt budget.
+    The budget is the model's context size minus room reserved for the reply.
+    """
+
+    def __init__(self, budget_override: Optional[int] = None, response_reserve: int = 512,
+                 summary_max_tokens: int = 256):
+        self.budget_override = budget_override
+        self.response_reserve = response_reserve
+        self.summary_max_tokens = summary_max_tokens
+
+    @classmethod
+    def from_env(cls) -> "ContextWindow":
+        override = os.getenv("LLM_CONTEXT_TOKEN_BUDGET")
+        return cls(
+            budget_override=int(override) if override else None,
+            response_reserve=int(os.getenv("LLM_CONTEXT_RESPONSE_RESERVE", "512")),
+            summary_max_tokens=int(os.getenv("LLM_CONTEXT_SUMMARY_MAX_TOKENS", "256"))
+        )
+
+    def budget_for(self, model_name: str) -> int:
+        """Prompt token budget for a model"""
+        if self.budget_override is not None:
+            return self.budget_override
+        total = MODEL_CONTEXT_TOKENS.get(model_name.split(":")[0], DEFAULT_CONTEXT_TOKENS)
+        return max(256, total - self.response_reserve)
+
+    @staticmethod
+    def select(messages: Sequence[Message], budget: int) -> Tuple[List[Message], List[Message]]:
+        """
+        Split messages (oldest first) into the newest ones that fit the budget and
+        the older overflow. The newest message is always kept.
+        """
+        used = 0
+        start = len(messages)
+        for index in range(len(messages) - 1, -1, -1):
+            cost = approx_token_count(messages[index].content) + 2  # role prefix and newline
+            if used + cost > budget and start < len(messages):
+                break
+            used += cost
+            start = index
+        return list(messages[start:]), list(messages[:start])
+
+    def truncate_summary(self, text: str) -> str:
+        """Keep the most recent part of a summary within its token cap"""
+        max_chars = self.summary_max_tokens * CHARS_PER_TOKEN
+        if len(text) <= max_chars:
+            return text
+        return text[-max_chars:]
+
+
+class BackgroundSummarizer:
+    """
+    Runs conversation compaction jobs off the request path.
+    At most one job per conversation is pending, and max_concurrency jobs run at once.
+    """
+
+    def __init__(self, max_concurrency: int = 1):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Dict[Optional[str], asyncio.Task] = {}
+
+        # Metrics
+        self.scheduled = 0
+        self.completed = 0
+        self.failed = 0
+
+    def schedule(self, conversation_id: Optional[str], job: Callable[[], Awaitable[None]]) -> bool:
+        """Start a job unless one is already pending for this conversation"""
+        if conversation_id in self._tasks:
+            return False
+        self.scheduled += 1
+        self._tasks[conversation_id] = asyncio.ensure_future(self._run(conversation_id, job))
+        return True
+
+    async def _run(self, conversation_id: Optional[str], job: Callable[[], Awaitable[None]]):
+        try:
+            async with self._semaphore:
+                await job()
+            self.completed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Summarization failed for conversation {conversation_id}: {e}")
+        finally:
+            self._tasks.pop(conversation_id, None)
+
+    async def close(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        self._tasks.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": len(self._tasks),
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,411 @@
+import itertools
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from .redis_client import RedisClient, RedisError
+
+logger = logging.getLogger(__name__)
+
+# Approximate fixed cost of one stored message (slots object, float, deque slot)
+MESSAGE_OVERHEAD_BYTES = 120
+# Approximate fixed cost of one conversation (deque, record, OrderedDict node)
+CONVERSATION_OVERHEAD_BYTES = 800
+
+
+class Message:
+    """Compact record for one conversation message"""
+
+    __slots__ = ("role", "content", "timestamp")
+
+    def __init__(self, role: str, content: str, timestamp: Optional[float] = None):
+        self.role = role
+        self.content = content
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    @property
+    def size(self) -> int:
+        return len(self.content) + MESSAGE_OVERHEAD_BYTES
+
+    def to_dict(self) -> dict:
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat()
+        }
+
+
+class _Conversation:
+    __slots__ = ("messages", "state", "last_access", "size")
+
+    def __init__(self, max_messages: int):
+        self.messages: Deque[Message] = deque(maxlen=max_messages)
+        self.state: Optional[Dict[str, bytes]] = None
+        self.last_access = time.monotonic()
+        self.size = CONVERSATION_OVERHEAD_BYTES
+
+
+class ConversationStore:
+    """
+    In-memory conversation history with bounded memory.
+
+    Each conversation keeps at most max_messages (oldest dropped first).
+    Whole conversations are evicted when idle for longer than idle_timeout
+    seconds, or least recently used first when the store exceeds max_bytes.
+    """
+
+    def __init__(self, max_messages: int = 50, max_bytes: int = 64 * 1024 * 1024,
+                 idle_timeout: float = 1800.0):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self._conversations: "OrderedDict[Optional[str], _Conversation]" = OrderedDict()
+        self.current_bytes = 0
+
+        # Metrics
+        self.messages_dropped = 0
+        self.lru_evictions = 0
+        self.idle_evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "ConversationStore":
+        return cls(
+            max_messages=int(os.getenv("LLM_CONVERSATION_MAX_MESSAGES", "50")),
+            max_bytes=int(os.getenv("LLM_CONVERSATION_STORE_MAX_BYTES", str(64 * 1024 * 1024))),
+            idle_timeout=float(os.getenv("LLM_CONVERSATION_IDLE_TIMEOUT", "1800"))
+        )
+
+    async def append(self, conversation_id: Optional[str], role: str, content: str):
+        """Append a message to a conversation, creating it if needed"""
+        self._append(conversation_id, Message(role, content))
+
+    def _append(self, conversation_id: Optional[str], message: Message):
+        conversation = self._get_or_create(conversation_id)
+
+        if len(conversation.messages) == conversation.messages.maxlen:
+            dropped = conversation.messages[0]
+            conversation.size -= dropped.size
+            self.current_bytes -= dropped.size
+            self.messages_dropped += 1
+        conversation.messages.append(message)
+        conversation.size += message.size
+        self.current_bytes += message.size
+
+        self.evict()
+
+    async def recent(self, conversation_id: Optional[str], limit: Optional[int] = None) -> List[Message]:
+        """Get the most recent messages of a conversation, oldest first"""
+        conversation = self._touch(conversation_id)
+        if conversation is None:
+            return []
+        if limit is None or limit >= len(conversation.messages):
+            return list(conversation.messages)
+        newest_first = itertools.islice(reversed(conversation.messages), limit)
+        return list(newest_first)[::-1]
+
+    async def has_history(self, conversation_id: Optional[str]) -> bool:
+        conversation = self._conversations.get(conversation_id)
+        return conversation is not None and len(conversation.messages) > 0
+
+    async def get_state(self, conversation_id: Optional[str], name: str) -> Optional[bytes]:
+        """Get an opaque per-conversation value stored alongside the history"""
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None or conversation.state is None:
+            return None
+        return conversation.state.get(name)
+
+    async def set_state(self, conversation_id: Optional[str], name: str, value: Optional[bytes]):
+        """Store (or with None, delete) an opaque per-conversation value"""
+        conversation = self._get_or_create(conversation_id)
+        if conversation.state is None:
+            conversation.state = {}
+        previous = conversation.state.pop(name, None)
+        if previous is not None:
+            conversation.size -= len(previous)
+            self.current_bytes -= len(previous)
+        if value is not None:
+            conversation.state[name] = value
+            conversation.size += len(value)
+            self.current_bytes += len(value)
+            self.evict()
+
+    async def delete(self, conversation_id: Optional[str]):
+        if conversation_id in self._conversations:
+            self._remove(conversation_id)
+
+    async def clear(self):
+        self._conversations.clear()
+        self.current_bytes = 0
+
+    async def close(self):
+        await self.clear()
+
+    def _get_or_create(self, conversation_id: Optional[str]) -> _Conversation:
+        conversation = self._touch(conversation_id)
+        if conversation is None:
+            conversation = _Conversation(self.max_messages)
+            self._conversations[conversation_id] = conversation
+            self.current_bytes += conversation.size
+        return conversation
+
+    def _touch(self, conversation_id: Optional[str]) -> Optional[_Conversation]:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is not None:
+            conversation.last_access = time.monotonic()
+            self._conversations.move_to_end(conversation_id)
+        return conversation
+
+    def _remove(self, conversation_id: Optional[str]):
+        conversation = self._conversations.pop(conversation_id)
+        self.current_bytes -= conversation.size
+
+    def evict(self) -> int:
+        """Evict idle conversations, then LRU conversations until under the memory cap"""
+        evicted = 0
+        # Conversations are kept in access order, so idle ones are at the front
+        idle_before = time.monotonic() - self.idle_timeout
+        while self._conversations:
+            oldest_id, oldest = next(iter(self._conversations.items()))
+            if oldest.last_access >= idle_before:
+                break
+            self._remove(oldest_id)
+            self.idle_evictions += 1
+            evicted += 1
+
+        while self.current_bytes > self.max_bytes and len(self._conversations) > 1:
+            oldest_id = next(iter(self._conversations))
+            self._remove(oldest_id)
+            self.lru_evictions += 1
+            evicted += 1
+
+        if evicted:
+            logger.debug(f"Evicted {evicted} conversations from the store")
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "conversations": len(self._conversations),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "max_messages_per_conversation": self.max_messages,
+            "messages_dropped": self.messages_dropped,
+            "lru_evictions": self.lru_evictions,
+            "idle_evictions": self.idle_evictions,
+        }
+
+
+class _CachedConversation:
+    __slots__ = ("fetched_at", "messages", "state")
+
+    def __init__(self, fetched_at: float, messages: Deque[Message], state: Dict[str, bytes]):
+        self.fetched_at = fetched_at
+        self.messages = messages
+        self.state = state
+
+
+class RedisConversationStore:
+    """
+    Conversation history shared by all replicas through a Redis-compatible server.
+
+    Each conversation is a capped Redis list plus a hash of opaque state values
+    (summary, KV context), both expiring when idle. Writes are pipelined (RPUSH +
+    LTRIM + EXPIRE in one round trip) and written through to a small local cache.
+    A cache miss fetches the history and all state in one round trip, and reads
+    are served locally for a short TTL, so a context build (history, summary and
+    KV context) costs at most one round trip instead of one per value.
+    """
+
+    def __init__(self, client: RedisClient, max_messages: int = 50, idle_timeout: float = 1800.0,
+                 key_prefix: str = "llm-chatbot:conv:", local_cache_size: int = 1024,
+                 local_cache_ttl: float = 1.0):
+        self.client = client
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.key_prefix = key_prefix
+        self.local_cache_size = local_cache_size
+        self.local_cache_ttl = local_cache_ttl
+        self._local: "OrderedDict[Optional[str], _CachedConversation]" = OrderedDict()
+
+        # Metrics
+        self.local_hits = 0
+        self.local_misses = 0
+        self.backend_errors = 0
+
+    @classmethod
+    def from_env(cls) -> "RedisConversationStore":
+        client = RedisClient(
+            os.getenv("LLM_REDIS_URL", "redis://localhost:6379/0"),
+            pool_size=int(os.getenv("LLM_REDIS_POOL_SIZE", "4")),
+            timeout=float(os.getenv("LLM_REDIS_TIMEOUT", "2.0"))
+        )
+        return cls(
+            client,
+            max_messages=int(os.getenv("LLM_CONVERSATION_MAX_MESSAGES", "50")),
+            idle_timeout=float(os.getenv("LLM_CONVERSATION_IDLE_TIMEOUT", "1800")),
+            local_cache_size=int(os.getenv("LLM_REDIS_LOCAL_CACHE_SIZE", "1024")),
+            local_cache_ttl=float(os.getenv("LLM_REDIS_LOCAL_CACHE_TTL", "1.0"))
+        )
+
+    def _key(self, conversation_id: Optional[str]) -> str:
+        return f"{self.key_prefix}{conversation_id}"
+
+    def _state_key(self, conversation_id: Optional[str]) -> str:
+        return f"{self.key_prefix}{conversation_id}:state"
+
+    @staticmethod
+    def _encode(message: Message) -> str:
+        return json.dumps([message.role, message.content, message.timestamp], separators=(",", ":"))
+
+    @staticmethod
+    def _decode(raw: bytes) -> Message:
+        role, content, timestamp = json.loads(raw)
+        return Message(role, content, timestamp)
+
+    def _cache(self, conversation_id: Optional[str], entry: _CachedConversation):
+        self._local[conversation_id] = entry
+        self._local.move_to_end(conversation_id)
+        while len(self._local) > self.local_cache_size:
+            self._local.popitem(last=False)
+
+    async def _load(self, conversation_id: Optional[str]) -> _CachedConversation:
+        """History and state of a conversation, from the local cache while it is fresh"""
+        cached = self._local.get(conversation_id)
+        now = time.monotonic()
+        if cached is not None and now - cached.fetched_at < self.local_cache_ttl:
+            self.local_hits += 1
+            self._local.move_to_end(conversation_id)
+            return cached
+
+        self.local_misses += 1
+        try:
+            raw_messages, raw_state = await self.client.pipeline([
+                ("LRANGE", self._key(conversation_id), -self.max_messages, -1),
+                ("HGETALL", self._state_key(conversation_id)),
+            ])
+            for reply in (raw_messages, raw_state):
+                if isinstance(reply, RedisError):
+                    raise reply
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Conversation store read failed for {conversation_id}: {e}")
+            if cached is not None:
+                return cached
+            return _CachedConversation(now, deque(maxlen=self.max_messages), {})
+
+        fields = raw_state or []
+        entry = _CachedConversation(
+            now,
+            deque((self._decode(raw) for raw in raw_messages or []), maxlen=self.max_messages),
+            {fields[i].decode("utf-8"): fields[i + 1] for i in range(0, len(fields), 2)}
+        )
+        self._cache(conversation_id, entry)
+        return entry
+
+    async def append(self, conversation_id: Optional[str], role: str, content: str):
+        """Append a message in one pipelined round trip"""
+        message = Message(role, content)
+        key = self._key(conversation_id)
+
+        cached = self._local.get(conversation_id)
+        if cached is not None:
+            cached.messages.append(message)
+
+        try:
+            await self.client.pipeline([
+                ("RPUSH", key, self._encode(message)),
+                ("LTRIM", key, -self.max_messages, -1),
+                ("EXPIRE", key, int(self.idle_timeout)),
+                ("EXPIRE", self._state_key(conversation_id), int(self.idle_timeout)),
+            ])
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Conversation store write failed for {conversation_id}: {e}")
+            if cached is None:
+                # Keep at least this pod's view of the conversation
+                self._cache(conversation_id, _CachedConversation(
+                    time.monotonic(), deque([message], maxlen=self.max_messages), {}
+                ))
+
+    async def recent(self, conversation_id: Optional[str], limit: Optional[int] = None) -> List[Message]:
+        """Get the most recent messages, served from the local cache while it is fresh"""
+        messages = (await self._load(conversation_id)).messages
+        if limit is None or limit >= len(messages):
+            return list(messages)
+        return list(itertools.islice(reversed(messages), limit))[::-1]
+
+    async def has_history(self, conversation_id: Optional[str]) -> bool:
+        return len(await self.recent(conversation_id, 1)) > 0
+
+    async def get_state(self, conversation_id: Optional[str], name: str) -> Optional[bytes]:
+        """Fetched together with the history, so usually served from the local cache"""
+        return (await self._load(conversation_id)).state.get(name)
+
+    async def set_state(self, conversation_id: Optional[str], name: str, value: Optional[bytes]):
+        """Write through: update the local cache, then the shared hash in one round trip"""
+        key = self._state_key(conversation_id)
+        cached = self._local.get(conversation_id)
+        if cached is not None:
+            if value is None:
+                cached.state.pop(name, None)
+            else:
+                cached.state[name] = value
+        try:
+            if value is None:
+                await self.client.execute("HDEL", key, name)
+            else:
+                await self.client.pipeline([
+                    ("HSET", key, name, value),
+                    ("EXPIRE", key, int(self.idle_timeout)),
+                ])
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Conversation state write failed for {conversation_id}: {e}")
+
+    async def delete(self, conversation_id: Optional[str]):
+        self._local.pop(conversation_id, None)
+        await self.client.pipeline([
+            ("DEL", self._key(conversation_id)),
+            ("DEL", self._state_key(conversation_id)),
+        ])
+
+    async def clear(self):
+        """Drop the local cache; shared history is left to expire in Redis"""
+        self._local.clear()
+
+    async def close(self):
+        self._local.clear()
+        await self.client.close()
+
+    def __len__(self) -> int:
+        return len(self._local)
+
+    def get_stats(self) -> dict:
+        stats = {
+            "backend": "redis",
+            "local_cache_entries": len(self._local),
+            "local_cache_hits": self.local_hits,
+            "local_cache_misses": self.local_misses,
+            "backend_errors": self.backend_errors,
+            "max_messages_per_conversation": self.max_messages,
+        }
+        stats.update(self.client.get_stats())
+        return stats
+
+
+def create_conversation_store():
+    """Build the conversation store selected by LLM_CONVERSATION_STORE (memory or redis)"""
+    backend = os.getenv("LLM_CONVERSATION_STORE", "memory").lower()
+    if backend == "redis":
+        logger.info("Using Redis conversation store")
+        return RedisConversationStore.from_env()
+    if backend != "memory":
+        logger.warning(f"Unknown conversation store '{backend}', using in-memory store")
+    return ConversationStore.from_env()
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, Awaitable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+# Client-supplied request budget in seconds, e.g. "X-Request-Timeout: 30"
+DEADLINE_HEADER = "X-Request-Timeout"
+
+T = TypeVar("T")
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a request runs out of its time budget"""
+
+
+class DeadlinePolicy:
+    """
+    Turns a client's requested timeout into an absolute deadline (a time.time() value).
+    Requests that ask for nothing get default_timeout; requests may not ask for more
+    than max_timeout.
+    """
+
+    def __init__(self, default_timeout: float = 180.0, max_timeout: float = 600.0):
+        self.default_timeout = default_timeout
+        self.max_timeout = max_timeout
+
+    @classmethod
+    def from_env(cls) -> "DeadlinePolicy":
+        return cls(
+            default_timeout=float(os.getenv("LLM_REQUEST_TIMEOUT", "180")),
+            max_timeout=float(os.getenv("LLM_REQUEST_TIMEOUT_MAX", "600"))
+        )
+
+    def deadline(self, requested=None) -> float:
+        """Deadline for a request starting now; requested is the header value or a number of seconds"""
+        timeout = self.default_timeout
+        if requested not in (None, ""):
+            try:
+                timeout = float(requested)
+            except (TypeError, ValueError):
+                logger.warning(f"Ignoring invalid request timeout: {requested!r}")
+            else:
+                if timeout <= 0:
+                    timeout = self.default_timeout
+        return time.time() + min(timeout, self.max_timeout)
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left before the deadline (never negative), or None without a deadline"""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.time())
+
+
+def expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.time() >= deadline
+
+
+def timeout_for(deadline: Optional[float], default: float) -> float:
+    """Upstream timeout: the remaining budget, capped at the call's usual timeout"""
+    left = remaining(deadline)
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceededError("Request deadline exceeded")
+    return min(default, left)
+
+
+async def run_within(awaitable: Awaitable[T], deadline: Optional[float]) -> T:
+    """Await within the deadline; the work is cancelled when the deadline passes"""
+    try:
+        return await asyncio.wait_for(awaitable, remaining(deadline))
+    except asyncio.TimeoutError:
+        if expired(deadline):
+            raise DeadlineExceededError("Request deadline exceeded")
+        raise
+
+
+async def iterate_within(stream: AsyncIterator[T], deadline: Optional[float]) -> AsyncIterator[T]:
+    """Relay a stream until the deadline; a stalled stream is cancelled when it passes"""
+    iterator = stream.__aiter__()
+    try:
+        while True:
+            try:
+                item = await run_within(iterator.__anext__(), deadline)
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
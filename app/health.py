@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class HealthProber:
+    """
+    Checks upstream health on a fixed interval in the background so that probe
+    endpoints only read cached state.
+
+    - live: the probe loop itself is still ticking (the event loop is not wedged).
+      Upstream outages do not fail liveness; restarting the pod would not fix them.
+    - started: the service has initialized and one upstream check has succeeded.
+    - ready: started, fewer than failure_threshold consecutive failed checks, and
+      not saturated. Saturation (0..1) has hysteresis: the pod leaves rotation at
+      saturation_high and rejoins once it drops below saturation_low.
+    """
+
+    def __init__(self, check: Callable[[], Awaitable[bool]], is_initialized: Callable[[], bool],
+                 saturation: Optional[Callable[[], float]] = None, interval: float = 10.0,
+                 failure_threshold: int = 3, saturation_high: float = 0.8, saturation_low: float = 0.5):
+        self.check = check
+        self.is_initialized = is_initialized
+        self.saturation = saturation or (lambda: 0.0)
+        self.interval = interval
+        self.failure_threshold = failure_threshold
+        self.saturation_high = saturation_high
+        self.saturation_low = saturation_low
+
+        self.healthy: Optional[bool] = None
+        self.consecutive_failures = 0
+        self.last_check: Optional[float] = None
+        self.last_check_duration = 0.0
+        self.last_success: Optional[float] = None
+        self.last_tick: Optional[float] = None
+        self.started = False
+        self.saturated = False
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.checks = 0
+        self.check_failures = 0
+
+    @classmethod
+    def from_env(cls, check: Callable[[], Awaitable[bool]], is_initialized: Callable[[], bool],
+                 saturation: Optional[Callable[[], float]] = None) -> "HealthProber":
+        return cls(
+            check,
+            is_initialized,
+            saturation,
+            interval=float(os.getenv("LLM_HEALTH_INTERVAL", "10")),
+            failure_threshold=int(os.getenv("LLM_HEALTH_FAILURE_THRESHOLD", "3")),
+            saturation_high=float(os.getenv("LLM_READINESS_SATURATION_HIGH", "0.8")),
+            saturation_low=float(os.getenv("LLM_READINESS_SATURATION_LOW", "0.5"))
+        )
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self.last_tick = time.time()
+            await self.probe()
+            await asyncio.sleep(self.interval)
+
+    async def probe(self):
+        """Run one upstream check and update the cached state"""
+        start = time.time()
+        try:
+            healthy = await asyncio.wait_for(self.check(), self.interval)
+        except Exception as e:
+            logger.warning(f"Health check failed: {e}")
+            healthy = False
+        self.last_check = time.time()
+        self.last_check_duration = self.last_check - start
+        self.checks += 1
+
+        if healthy:
+            self.consecutive_failures = 0
+            self.last_success = self.last_check
+            if not self.started and self.is_initialized():
+                self.started = True
+                logger.info("Startup complete: first successful health check")
+        else:
+            self.consecutive_failures += 1
+            self.check_failures += 1
+        if healthy != self.healthy:
+            logger.info(f"Upstream health changed to {'healthy' if healthy else 'unhealthy'}")
+        self.healthy = healthy
+
+    def live(self) -> bool:
+        # Allow a slow check plus one interval before declaring the loop stuck
+        return self.last_tick is not None and time.time() - self.last_tick < 3 * self.interval
+
+    def ready(self) -> bool:
+        saturation = self.saturation()
+        if self.saturated and saturation < self.saturation_low:
+            self.saturated = False
+            logger.info(f"Saturation down to {saturation:.2f}, back in rotation")
+        elif not self.saturated and saturation >= self.saturation_high:
+            self.saturated = True
+            logger.warning(f"Saturation at {saturation:.2f}, leaving rotation")
+        return self.started and self.consecutive_failures < self.failure_threshold and not self.saturated
+
+    def get_stats(self) -> dict:
+        return {
+            "live": self.live(),
+            "started": self.started,
+            "ready": self.ready(),
+            "healthy": self.healthy,
+            "saturated": self.saturated,
+            "consecutive_failures": self.consecutive_failures,
+            "last_check_seconds_ago": time.time() - self.last_check if self.last_check else None,
+            "last_check_duration": self.last_check_duration,
+            "checks": self.checks,
+            "check_failures": self.check_failures,
+        }
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import math
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterator, Callable, List, Optional
+
+from .admission import OverloadedError
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp is not None else None
+
+
+class Job:
+    """One asynchronous generation and its progress"""
+
+    __slots__ = ("id", "message", "conversation_id", "user_id", "use_cache", "provider", "model_name", "status",
+                 "traceparent", "tokens", "token_count", "response", "error", "created_at", "started_at",
+                 "finished_at", "task", "_changed")
+
+    def __init__(self, message: str, conversation_id: Optional[str], user_id: Optional[str],
+                 use_cache: bool = True, provider: Optional[str] = None, model_name: Optional[str] = None,
+                 traceparent: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.message = message
+        self.conversation_id = conversation_id
+        self.user_id = user_id
+        self.use_cache = use_cache
+        self.provider = provider
+        self.model_name = model_name
+        # Trace context of the submitting request, continued by the job's own trace
+        self.traceparent = traceparent
+        self.status = JOB_QUEUED
+        self.tokens: List[str] = []
+        self.token_count = 0
+        self.response: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    def notify(self):
+        """Wake event subscribers; each wait gets a fresh event"""
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "conversation_id": self.conversation_id,
+            "response": self.response,
+            "error": self.error,
+            "tokens": self.token_count,
+            "created_at": _isoformat(self.created_at),
+            "started_at": _isoformat(self.started_at),
+            "finished_at": _isoformat(self.finished_at),
+        }
+
+    async def events(self) -> AsyncIterator[dict]:
+        """Status and token events from the start of the job, then live until it finishes"""
+        sent_tokens = 0
+        sent_chars = 0
+        sent_status = None
+        while True:
+            changed = self._changed
+            if self.status != sent_status:
+                sent_status = self.status
+                yield {"type": "status", "status": self.status}
+            while sent_tokens < len(self.tokens):
+                token = self.tokens[sent_tokens]
+                sent_tokens += 1
+                sent_chars += len(token)
+                yield {"type": "token", "token": token}
+            if self.finished:
+                # Tokens are released when the job finishes; send what this subscriber missed in one piece
+                if self.response and sent_chars < len(self.response):
+                    yield {"type": "token", "token": self.response[sent_chars:]}
+                yield {"type": "done", **self.to_dict()}
+                return
+            await changed.wait()
+
+
+class JobManager:
+    """
+    Runs chat generations in the background so clients can poll or follow progress
+    instead of holding a connection open. At most max_running jobs generate at once;
+    at most max_jobs are retained, and finished jobs are dropped after retention_seconds.
+    """
+
+    def __init__(self, run: Callable[[Job], AsyncIterator[dict]], max_jobs: int = 1000,
+                 max_running: int = 4, retention_seconds: float = 3600):
+        self.run = run
+        self.max_jobs = max_jobs
+        self.retention_seconds = retention_seconds
+        self.max_running = max_running
+        self._running = asyncio.Semaphore(max_running)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+        # Metrics
+        self.submitted = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.expired = 0
+
+    @classmethod
+    def from_env(cls, run: Callable[[Job], AsyncIterator[dict]]) -> "JobManager":
+        return cls(
+            run,
+            max_jobs=int(os.getenv("LLM_JOBS_MAX_JOBS", "1000")),
+            max_running=int(os.getenv("LLM_JOBS_MAX_RUNNING", "4")),
+            retention_seconds=float(os.getenv("LLM_JOBS_RETENTION_SECONDS", "3600"))
+        )
+
+    def submit(self, message: str, conversation_id: Optional[str] = None, user_id: Optional[str] = None,
+               use_cache: bool = True, provider: Optional[str] = None, model_name: Optional[str] = None,
+               traceparent: Optional[str] = None) -> Job:
+        """Create a job and start it in the background"""
+        self._expire()
+        if len(self._jobs) >= self.max_jobs and not self._evict_finished():
+            self.rejected += 1
+            raise OverloadedError(f"Too many unfinished jobs (limit {self.max_jobs})", self._retry_after())
+
+        job = Job(message, conversation_id, user_id, use_cache, provider, model_name, traceparent)
+        self._jobs[job.id] = job
+        self.submitted += 1
+        job.task = asyncio.ensure_future(self._execute(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    async def _execute(self, job: Job):
+        try:
+            async with self._running:
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+                job.notify()
+                async for event in self.run(job):
+                    if event["type"] == "token":
+                        job.tokens.append(event["token"])
+                        job.token_count += 1
+                    elif event["type"] == "done":
+                        job.response = event["response"]
+                    job.notify()
+            job.status = JOB_SUCCEEDED
+            self.succeeded += 1
+        except asyncio.CancelledError:
+            job.status = JOB_FAILED
+            job.error = "Job cancelled"
+            self.failed += 1
+            raise
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            job.status = JOB_FAILED
+            job.error = str(e)
+            self.failed += 1
+        finally:
+            job.finished_at = time.time()
+            job.task = None
+            # Only the final response is retained; late subscribers get it in the done event
+            job.tokens = []
+            job.notify()
+
+    def _expire(self):
+        """Drop finished jobs past their retention; jobs are kept in creation order"""
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+            self.expired += 1
+
+    def _evict_finished(self) -> bool:
+        """Make room by dropping the oldest finished job"""
+        for job_id, job in self._jobs.items():
+            if job.finished:
+                del self._jobs[job_id]
+                self.expired += 1
+                return True
+        return False
+
+    def _retry_after(self) -> int:
+        """Rough wait until the current backlog drains, from retained job durations"""
+        durations = [job.finished_at - job.started_at for job in self._jobs.values()
+                     if job.finished and job.started_at is not None]
+        average = sum(durations) / len(durations) if durations else 10.0
+        return max(1, math.ceil(len(self._jobs) / self.max_running * average))
+
+    async def close(self):
+        for job in self._jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+        self._jobs.clear()
+
+    def get_stats(self) -> dict:
+        self._expire()
+        statuses = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_SUCCEEDED: 0, JOB_FAILED: 0}
+        for job in self._jobs.values():
+            statuses[job.status] += 1
+        return {
+            "retained": len(self._jobs),
+            "max_jobs": self.max_jobs,
+            **statuses,
+            "submitted_total": self.submitted,
+            "rejected_total": self.rejected,
+            "succeeded_total": self.succeeded,
+            "failed_total": self.failed,
+            "expired_total": self.expired,
+        }
@@ -2,13 +2,79 @@ import asyncio
 import time
 import logging
 import os
-from typing import Dict, Optional, List
+from typing import AsyncIterator, Dict, Optional, List, Tuple
 from datetime import datetime
-import httpx
 import json
+from contextlib import nullcontext
+
+from .admission import AdmissionController, OverloadedError
+from .batching import MicroBatcher
+from .coalescing import SingleFlight, generation_key
+from .context_window import BackgroundSummarizer, ContextWindow, approx_token_count
+from .conversation_store import Message, create_conversation_store
+from .deadlines import DeadlineExceededError, expired, iterate_within, run_within, timeout_for
+from .model_registry import ModelRegistry, ModelUnavailableError, UnknownModelError, model_key
+from .ollama_context import pack_context, unpack_context
+from .resilience import CircuitBreaker, CircuitOpenError, parse_provider_chain
+from .response_cache import ResponseCache, normalize_message
+from .scheduling import PRIORITY_BACKGROUND, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from .semantic_cache import HashedNgramVectorizer, OllamaEmbedder, SemanticCache
+from .stats import TOKENS_PER_SECOND_BUCKETS, Histogram, HistogramFamily
+from .tracing import Span, Trace, traced_span, upstream_options
+from .upstream import UpstreamClientManager, UpstreamPool
 
 logger = logging.getLogger(__name__)
 
+HUGGINGFACE_API_URL = "https://api-inference.huggingface.co"
+
+
+class ProviderUnavailableError(Exception):
+    """Raised when a provider cannot generate; carries the reply to show the user instead"""
+    
+    def __init__(self, fallback_response: str):
+        super().__init__(fallback_response)
+        self.fallback_response = fallback_response
+
+
+class _CacheLookup:
+    """Result of consulting the response caches for one request"""
+    
+    __slots__ = ("key", "scope", "embedding", "response", "source")
+    
+    def __init__(self):
+        self.key = None
+        self.scope = None
+        self.embedding = None
+        self.response = None
+        self.source = None
+
+
+# Model used for a provider in the failover chain when the chain entry names none
+DEFAULT_PROVIDER_MODELS = {"ollama": "phi", "huggingface": "microsoft/DialoGPT-medium", "mock": "mock"}
+
+GENERATION_STAGES = ("load", "prefill", "decode")
+
+# Priority classes from most to least urgent; a shared micro-batch queues at its most urgent member's
+_URGENCY = {PRIORITY_INTERACTIVE: 0, PRIORITY_BULK: 1, PRIORITY_BACKGROUND: 2}
+
+
+def ollama_generation_stages(result: dict) -> Optional[dict]:
+    """Model load, prefill and decode timing from an Ollama response (durations are nanoseconds)"""
+    if "eval_duration" not in result and "prompt_eval_duration" not in result:
+        return None
+    decode_seconds = result.get("eval_duration", 0) / 1e9
+    completion_tokens = result.get("eval_count", 0)
+    return {
+        "load_seconds": result.get("load_duration", 0) / 1e9,
+        "prefill_seconds": result.get("prompt_eval_duration", 0) / 1e9,
+        "prompt_tokens": result.get("prompt_eval_count", 0),
+        "decode_seconds": decode_seconds,
+        "completion_tokens": completion_tokens,
+        "tokens_per_second": completion_tokens / decode_seconds if decode_seconds > 0 else None,
+        "upstream_seconds": result.get("total_duration", 0) / 1e9,
+    }
+
+
 class LLMService:
     """
     Enhanced LLM Service supporting multiple free model providers.
@@ -38,23 +104,131 @@ class LLMService:
         self.model_provider = os.getenv("LLM_MODEL_PROVIDER", "ollama")  # ollama, huggingface, mock
         self.model_name = os.getenv("LLM_MODEL_NAME", "phi")
         self.base_url = os.getenv("LLM_BASE_URL", "http://localhost:11434")
+        # Continue conversations from Ollama's returned KV context instead of re-sending the transcript
+        self.reuse_ollama_context = os.getenv("LLM_OLLAMA_REUSE_CONTEXT", "true").lower() == "true"
+        self.ollama_keep_alive = os.getenv("LLM_OLLAMA_KEEP_ALIVE", "30m")
         self.hf_api_token = os.getenv("HF_API_TOKEN")  # Optional for higher rate limits
         
         # Service metrics
         self.start_time = time.time()
         self.message_count = 0
         self.total_response_time = 0.0
+        self.response_time_histogram = Histogram()
+        self.time_to_first_token_histogram = Histogram()
+        # Prefill (prompt evaluation) time per turn, split by how the prompt was built
+        self.prefill_histograms = {"kv_context": Histogram(), "text": Histogram()}
+        self.prefill_tokens = {"kv_context": 0, "text": 0}
+        # Requests stopped early, by reason, and how long they had been running
+        self.cancelled_requests = {"deadline_exceeded": 0, "client_disconnected": 0}
+        self.cancelled_after_histogram = Histogram()
         self.is_initialized = False
-        self.conversations: Dict[str, list] = {}
+        self.conversation_store = create_conversation_store()
+        
+        # Token-budgeted prompt history; overflow is compacted by a background summarizer
+        self.context_window = ContextWindow.from_env()
+        self.summarizer = BackgroundSummarizer(
+            max_concurrency=int(os.getenv("LLM_SUMMARIZER_CONCURRENCY", "1"))
+        )
+        self.context_tokens_histogram = Histogram(buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384))
         
         # Model status
         self.model_loaded = False
         self.last_health_check = None
         self.current_model_info = None
         
+        # Model switches warm the new model first and drain the old one afterwards
+        self._switch_lock = asyncio.Lock()
+        self._retiring: Dict[asyncio.Future, str] = {}
+        self.switch_drain_timeout = float(os.getenv("LLM_SWITCH_DRAIN_TIMEOUT", "300"))
+        self.model_switches = {"succeeded": 0, "failed": 0}
+        self.switch_duration_histogram = Histogram(buckets=(1, 5, 10, 30, 60, 120, 300, 600))
+        
+        # Pooled upstream clients, one per provider endpoint
+        self.upstreams = UpstreamClientManager()
+        # LLM_BASE_URLS lists several Ollama endpoints to balance across
+        base_urls = [url.strip() for url in os.getenv("LLM_BASE_URLS", "").split(",") if url.strip()]
+        if len(base_urls) > 1:
+            self.upstreams.register_pool("ollama", base_urls)
+        else:
+            self.upstreams.register("ollama", base_urls[0] if base_urls else self.base_url)
+        hf_headers = {"Content-Type": "application/json"}
+        if self.hf_api_token:
+            hf_headers["Authorization"] = f"Bearer {self.hf_api_token}"
+        self.upstreams.register("huggingface", HUGGINGFACE_API_URL, headers=hf_headers)
+        
+        # Failover: after the configured provider, try these in order (e.g. "huggingface,mock")
+        self.provider_chain = parse_provider_chain(os.getenv("LLM_PROVIDER_CHAIN"))
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # Race a second Ollama endpoint when a request outlives the pool's p95 latency
+        self.hedge_requests = os.getenv("LLM_HEDGE_REQUESTS", "false").lower() == "true"
+        
+        # Bounded concurrency and wait queue per model; overflow is rejected with a retry hint
+        self.admission = AdmissionController.from_env()
+        
+        # Models requested per message are kept warm alongside the default, within a memory budget
+        self.model_registry = ModelRegistry.from_env(
+            self._prewarm_model,
+            self._unload_model,
+            is_busy=lambda model: self.admission.in_flight(model) > 0
+        )
+        # Per-model latency and streaming decode rate, keyed "provider:model"
+        self.model_response_time = HistogramFamily()
+        self.model_time_to_first_token = HistogramFamily()
+        self.model_tokens_per_second = HistogramFamily(buckets=TOKENS_PER_SECOND_BUCKETS)
+        # Upstream-reported generation stages per model, where the provider reports them (Ollama)
+        self.model_stage_times = {stage: HistogramFamily() for stage in GENERATION_STAGES}
+        
+        # Optional micro-batching of concurrent Hugging Face requests; each flushed batch
+        # takes one admission slot, so a batch is not capped by the model's concurrency
+        self.hf_batcher: Optional[MicroBatcher] = None
+        if os.getenv("LLM_MICROBATCH_ENABLED", "false").lower() == "true":
+            self.hf_batcher = MicroBatcher(
+                self._send_huggingface_microbatch,
+                max_batch_size=int(os.getenv("LLM_MICROBATCH_MAX_SIZE", "8")),
+                window_ms=float(os.getenv("LLM_MICROBATCH_WINDOW_MS", "10"))
+            )
+        
+        # Identical concurrent generations share one upstream call
+        self.coalesce_requests = os.getenv("LLM_COALESCE_REQUESTS", "true").lower() == "true"
+        self.single_flight = SingleFlight()
+        
+        # Optional response cache for repeated prompts
+        self.response_cache: Optional[ResponseCache] = None
+        if os.getenv("LLM_RESPONSE_CACHE_ENABLED", "false").lower() == "true":
+            self.response_cache = ResponseCache(
+                max_bytes=int(os.getenv("LLM_RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+                ttl_seconds=float(os.getenv("LLM_RESPONSE_CACHE_TTL", "600"))
+            )
+        
+        # Optional similarity cache so paraphrased questions reuse an answer
+        self.semantic_cache: Optional[SemanticCache] = None
+        self.embedder = None
+        if os.getenv("LLM_SEMANTIC_CACHE_ENABLED", "false").lower() == "true":
+            self._setup_semantic_cache()
+        
+    def _setup_semantic_cache(self):
+        """Configure the embedder and the vector index for the semantic cache"""
+        embedder = os.getenv("LLM_SEMANTIC_CACHE_EMBEDDER", "hashed")  # hashed, ollama
+        if embedder == "ollama":
+            self.embedder = OllamaEmbedder(
+                self.upstreams.get("ollama"),
+                os.getenv("LLM_SEMANTIC_CACHE_EMBED_MODEL", "nomic-embed-text")
+            )
+            dim = int(os.getenv("LLM_SEMANTIC_CACHE_DIM", "768"))
+        else:
+            dim = int(os.getenv("LLM_SEMANTIC_CACHE_DIM", "1024"))
+            self.embedder = HashedNgramVectorizer(dim=dim)
+        self.semantic_cache = SemanticCache(
+            dim=dim,
+            capacity=int(os.getenv("LLM_SEMANTIC_CACHE_CAPACITY", "2048")),
+            threshold=float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", "0.9")),
+            ttl_seconds=float(os.getenv("LLM_RESPONSE_CACHE_TTL", "600"))
+        )
+    
     async def initialize(self):
         """Initialize the LLM service with selected provider"""
         try:
+            await self.upstreams.start()
             logger.info(f"Initializing LLM service with provider: {self.model_provider}, model: {self.model_name}")
             
             if self.model_provider == "ollama":
@@ -67,6 +241,7 @@ class LLMService:
                 
             self.is_initialized = True
             self.model_loaded = True
+            self.model_registry.register(self.model_provider, self.model_name, self.current_model_info or {}, pin=True)
             logger.info("LLM service initialized successfully")
             
         except Exception as e:
@@ -78,39 +253,39 @@ class LLMService:
     async def _initialize_ollama(self):
         """Initialize Ollama with selected model"""
         try:
-            async with httpx.AsyncClient() as client:
-                # Check if Ollama is running
-                response = await client.get(f"{self.base_url}/api/version", timeout=10.0)
-                if response.status_code == 200:
-                    logger.info("Ollama service is running")
+            client = self.upstreams.get("ollama")
+            # Check if Ollama is running
+            response = await client.get("/api/version", timeout=10.0)
+            if response.status_code == 200:
+                logger.info("Ollama service is running")
+                
+                # Check available models
+                models_response = await client.get("/api/tags")
+                if models_response.status_code == 200:
+                    models = models_response.json()
+                    available_models = [model['name'] for model in models.get('models', [])]
                     
-                    # Check available models
-                    models_response = await client.get(f"{self.base_url}/api/tags")
-                    if models_response.status_code == 200:
-                        models = models_response.json()
-                        available_models = [model['name'] for model in models.get('models', [])]
-                        
-                        # Check if exact model is available
-                        model_found = False
-                        for available_model in available_models:
-                            if self.model_name in available_model or available_model.startswith(self.model_name):
-                                self.model_name = available_model  # Use exact model name
-                                model_found = True
-                                break
-                        
-                        if model_found:
-                            logger.info(f"Model {self.model_name} is available")
-                            self.current_model_info = self.AVAILABLE_MODELS["ollama"].get(self.model_name.split(':')[0], {
-                                "name": self.model_name,
-                                "display_name": self.model_name,
-                                "size": "Unknown"
-                            })
-                        else:
-                            logger.warning(f"Model {self.model_name} not found. Available models: {available_models}")
-                            logger.info("Attempting to pull model...")
-                            await self._pull_ollama_model()
-                else:
-                    raise Exception("Ollama service not accessible")
+                    # Check if exact model is available
+                    model_found = False
+                    for available_model in available_models:
+                        if self.model_name in available_model or available_model.startswith(self.model_name):
+                            self.model_name = available_model  # Use exact model name
+                            model_found = True
+                            break
+                    
+                    if model_found:
+                        logger.info(f"Model {self.model_name} is available")
+                        self.current_model_info = self.AVAILABLE_MODELS["ollama"].get(self.model_name.split(':')[0], {
+                            "name": self.model_name,
+                            "display_name": self.model_name,
+                            "size": "Unknown"
+                        })
+                    else:
+                        logger.warning(f"Model {self.model_name} not found. Available models: {available_models}")
+                        logger.info("Attempting to pull model...")
+                        await self._pull_ollama_model()
+            else:
+                raise Exception("Ollama service not accessible")
                     
         except Exception as e:
             logger.error(f"Ollama initialization failed: {e}")
@@ -139,22 +314,22 @@ class LLMService:
     async def _pull_ollama_model(self):
         """Pull Ollama model if not available"""
         try:
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                pull_data = {"name": self.model_name}
-                response = await client.post(
-                    f"{self.base_url}/api/pull",
-                    json=pull_data
-                )
-                
-                if response.status_code == 200:
-                    logger.info(f"Successfully pulled model {self.model_name}")
-                    self.current_model_info = self.AVAILABLE_MODELS["ollama"].get(self.model_name.split(':')[0], {
-                        "name": self.model_name,
-                        "display_name": self.model_name,
-                        "size": "Unknown"
-                    })
-                else:
-                    raise Exception(f"Failed to pull model: {response.text}")
+            pull_data = {"name": self.model_name}
+            response = await self.upstreams.get("ollama").post(
+                "/api/pull",
+                json=pull_data,
+                timeout=300.0
+            )
+            
+            if response.status_code == 200:
+                logger.info(f"Successfully pulled model {self.model_name}")
+                self.current_model_info = self.AVAILABLE_MODELS["ollama"].get(self.model_name.split(':')[0], {
+                    "name": self.model_name,
+                    "display_name": self.model_name,
+                    "size": "Unknown"
+                })
+            else:
+                raise Exception(f"Failed to pull model: {response.text}")
                     
         except Exception as e:
             logger.error(f"Model pull failed: {e}")
@@ -172,216 +347,875 @@ class LLMService:
             "ollama": list(self.AVAILABLE_MODELS["ollama"].values()),
             "huggingface": list(self.AVAILABLE_MODELS["huggingface"].values()),
             "current_provider": self.model_provider,
-            "current_model": self.current_model_info
+            "current_model": self.current_model_info,
+            "loaded_models": list(self.model_registry.get_stats()["loaded"])
         }
     
     async def switch_model(self, provider: str, model_name: str) -> bool:
-        """Switch to a different model"""
-        try:
-            logger.info(f"Switching to {provider}:{model_name}")
-            
-            # Validate provider and model
-            if provider not in ["ollama", "huggingface", "mock"]:
-                raise ValueError(f"Unsupported provider: {provider}")
-            
-            if provider != "mock":
-                # For model validation, check both exact name and base name (without version)
-                model_found = False
-                if provider in self.AVAILABLE_MODELS:
-                    available_models = self.AVAILABLE_MODELS[provider]
-                    
-                    # Check exact match first
-                    if model_name in available_models:
-                        model_found = True
-                    else:
-                        # Check if any of the available models match the requested name
-                        for key, model_info in available_models.items():
-                            if (model_info["name"] == model_name or 
-                                key == model_name.split(':')[0] or  # Match base name
-                                model_name.startswith(key)):
-                                model_found = True
-                                break
-                
-                if not model_found:
-                    raise ValueError(f"Model {model_name} not available for provider {provider}")
-            
-            # Update configuration
-            old_provider = self.model_provider
-            old_model = self.model_name
-            
-            self.model_provider = provider
-            self.model_name = model_name
-            self.model_loaded = False
-            
-            # Reinitialize with new model
+        """
+        Switch to a different model without interrupting traffic.
+        The new model is pulled and warmed up while the current one keeps serving;
+        the switch itself is a single step, and requests already running on the old
+        model finish on it before it is unloaded.
+        """
+        async with self._switch_lock:
             try:
-                await self.initialize()
-                logger.info(f"Successfully switched to {provider}:{model_name}")
+                logger.info(f"Switching to {provider}:{model_name}")
+                start = time.time()
+                
+                # Load the new model alongside the current one (a no-op if it is already warm)
+                catalogue_info = self._validate_model(provider, model_name, allow_unlisted_tags=True)
+                entry = await self.model_registry.ensure(provider, model_name, catalogue_info)
+                
+                # Swap in one step; no request can see a half-switched service
+                old_provider, old_model = self.model_provider, self.model_name
+                self.model_registry.register(provider, entry.model, entry.info, pin=True)
+                self.model_provider = provider
+                self.model_name = model_name = entry.model
+                self.current_model_info = entry.info
+                self.model_loaded = True
+                
+                self.model_switches["succeeded"] += 1
+                self.switch_duration_histogram.observe(time.time() - start)
+                logger.info(f"Switched to {provider}:{model_name} in {time.time() - start:.1f}s")
+                
+                if (old_provider, old_model) != (provider, model_name):
+                    self.model_registry.unpin(old_provider, old_model)
+                    task = asyncio.ensure_future(self._retire_model(old_provider, old_model))
+                    self._retiring[task] = f"{old_provider}:{old_model}"
+                    task.add_done_callback(self._retiring.pop)
                 return True
+                
             except Exception as e:
-                # Rollback on failure
-                self.model_provider = old_provider
-                self.model_name = old_model
-                await self.initialize()
-                logger.error(f"Failed to switch model, rolled back: {e}")
+                # Nothing was changed, so the current model keeps serving
+                self.model_switches["failed"] += 1
+                logger.error(f"Model switch failed: {e}")
                 return False
-                
-        except Exception as e:
-            logger.error(f"Model switch failed: {e}")
-            return False
     
-    async def process_message(self, message: str, conversation_id: str = None) -> str:
-        """Process a chat message and return response"""
+    def _catalogue_entry(self, provider: str, model_name: str) -> Optional[dict]:
+        """The catalogue entry for exactly this model: its key, its full tag, or the key with ":latest" """
+        for key, model_info in self.AVAILABLE_MODELS.get(provider, {}).items():
+            if model_name in (key, model_info["name"], f"{key}:latest"):
+                return model_info
+        return None
+    
+    def _validate_model(self, provider: str, model_name: str, allow_unlisted_tags: bool = False) -> dict:
+        """
+        Check that the provider offers the model; returns its catalogue entry.
+        Messages may only name catalogue models, since naming one can pull and load it.
+        The admin switch (allow_unlisted_tags) may also name another tag of a catalogued
+        family, e.g. "llama2:13b"; it gets an empty entry, so its memory is estimated
+        from the tag rather than from the family's catalogue size.
+        """
+        if provider not in ["ollama", "huggingface", "mock"]:
+            raise UnknownModelError(f"Unsupported provider: {provider}")
+        if provider == "mock":
+            return {}
+        
+        model_info = self._catalogue_entry(provider, model_name)
+        if model_info is not None:
+            return model_info
+        base_name, _, tag = model_name.partition(":")
+        if allow_unlisted_tags and tag and base_name in self.AVAILABLE_MODELS.get(provider, {}):
+            return {}
+        raise UnknownModelError(f"Model {model_name} not available for provider {provider}")
+    
+    async def _prewarm_model(self, provider: str, model_name: str) -> Tuple[str, dict, Optional[int]]:
+        """Make a model ready to serve; returns its resolved name, display info and size in bytes if known"""
+        if provider == "ollama":
+            client = self.upstreams.get("ollama")
+            clients = [endpoint.client for endpoint in client.endpoints] if isinstance(client, UpstreamPool) else [client]
+            resolved = await asyncio.gather(*(self._prewarm_ollama_model(c, model_name) for c in clients))
+            model_name, size_bytes = resolved[0]
+            return model_name, self._catalogue_entry("ollama", model_name) or {
+                "name": model_name,
+                "display_name": model_name,
+                "size": "Unknown"
+            }, size_bytes
+        elif provider == "huggingface":
+            # Ask the Inference API to load the model and wait for it instead of answering 503
+            response = await self.upstreams.get("huggingface").post(
+                f"/models/{model_name}",
+                json={"inputs": "Hello", "options": {"wait_for_model": True}},
+                timeout=120.0
+            )
+            if response.status_code != 200:
+                raise Exception(f"Hugging Face warm-up failed: {response.status_code}")
+            return model_name, self.AVAILABLE_MODELS["huggingface"].get(
+                model_name, {"name": model_name, "display_name": model_name, "size": "Unknown"}
+            ), 0
+        return "mock", {"name": "mock", "display_name": "Mock Model", "size": "Test"}, 0
+    
+    async def _prewarm_ollama_model(self, client, model_name: str) -> Tuple[str, Optional[int]]:
+        """
+        Pull the model if the endpoint lacks it, then load it with a one-token generation.
+        Returns the endpoint's name for the model and its size as listed by Ollama, if known.
+        """
+        tags = await client.get("/api/tags", timeout=10.0)
+        if tags.status_code != 200:
+            raise Exception("Ollama service not accessible")
+        listed = {model["name"]: model.get("size") for model in tags.json().get("models", [])}
+        # Only the exact tag (or an untagged name's :latest) counts; "llama2" must not pick up "llama2:70b"
+        resolved = next((name for name in (model_name, f"{model_name}:latest") if name in listed), None)
+        if resolved is None:
+            logger.info(f"Pulling {model_name} before switching to it")
+            response = await client.post("/api/pull", json={"name": model_name, "stream": False}, timeout=300.0)
+            if response.status_code != 200:
+                raise Exception(f"Failed to pull model: {response.text}")
+            resolved = model_name
+        
+        # keep_alive keeps the weights resident until the first real request arrives
+        response = await client.post(
+            "/api/generate",
+            json={
+                "model": resolved,
+                "prompt": "Hello",
+                "stream": False,
+                "keep_alive": self.ollama_keep_alive,
+                "options": {"num_predict": 1}
+            },
+            timeout=300.0
+        )
+        if response.status_code != 200:
+            raise Exception(f"Warm-up generation failed: {response.status_code}")
+        return resolved, listed.get(resolved)
+    
+    async def _retire_model(self, provider: str, model_name: str):
+        """
+        Wait for in-flight requests on a replaced model to finish. It then stays warm
+        for per-request use if the model memory budget allows, or is unloaded.
+        """
+        deadline = time.time() + self.switch_drain_timeout
+        while self.admission.in_flight(model_name) and time.time() < deadline:
+            await asyncio.sleep(0.1)
+        remaining = self.admission.in_flight(model_name)
+        if remaining:
+            logger.warning(f"Retiring {provider}:{model_name} with {remaining} requests still in flight")
+        
+        if self.model_registry.get(provider, model_name) is not None:
+            await self.model_registry.enforce_budget()
+        elif (provider, model_name) != (self.model_provider, self.model_name):
+            try:
+                await self._unload_model(provider, model_name)
+            except Exception as e:
+                logger.warning(f"Failed to unload {model_name}: {e}")
+    
+    async def _unload_model(self, provider: str, model_name: str):
+        """Free a model's memory on every Ollama endpoint; remote providers need nothing"""
+        if provider != "ollama":
+            return
+        client = self.upstreams.get("ollama")
+        clients = [endpoint.client for endpoint in client.endpoints] if isinstance(client, UpstreamPool) else [client]
+        for endpoint_client in clients:
+            # keep_alive 0 evicts the model from the endpoint's memory
+            await endpoint_client.post(
+                "/api/generate", json={"model": model_name, "keep_alive": 0}, timeout=30.0
+            )
+        logger.info(f"Unloaded model {model_name}")
+    
+    async def process_message(self, message: str, conversation_id: str = None, use_cache: bool = True,
+                              user_id: Optional[str] = None, priority: str = PRIORITY_BULK,
+                              deadline: Optional[float] = None, provider: Optional[str] = None,
+                              model: Optional[str] = None, metadata: Optional[dict] = None,
+                              trace: Optional[Trace] = None) -> str:
+        """
+        Process a chat message and return response.
+        user_id and priority decide the message's place in the admission queue.
+        Generation is cancelled when the deadline (a time.time() value) passes.
+        provider and model pick a model for this message instead of the service default.
+        metadata, if given, is filled with the serving model, cache source, total time
+        and upstream generation stages.
+        trace, if given, receives a span per stage and is propagated to the upstream.
+        """
         start_time = time.time()
         
         try:
-            # Get or create conversation history
-            if conversation_id not in self.conversations:
-                self.conversations[conversation_id] = []
+            target = await run_within(self._select_model(provider, model), deadline)
+            # Look up the response caches before the new message joins the history
+            with traced_span(trace, "cache"):
+                lookup = await self._cache_lookup(message, conversation_id, use_cache, target)
+            if lookup.response is None:
+                self.admission.check(target[1], priority)
             
             # Add user message to history
-            self.conversations[conversation_id].append({
-                "role": "user",
-                "content": message,
-                "timestamp": datetime.now().isoformat()
-            })
+            with traced_span(trace, "history"):
+                await self._add_to_history(conversation_id, "user", message)
             
-            # Generate response based on model type
-            if self.model_provider == "ollama":
-                response = await self._process_ollama_message(message, conversation_id)
-            elif self.model_provider == "huggingface":
-                response = await self._process_huggingface_message(message, conversation_id)
+            served = {}
+            if lookup.response is not None:
+                response = lookup.response
             else:
-                response = await self._process_mock_message(message, conversation_id)
+                try:
+                    response = await run_within(
+                        self._generate(message, conversation_id, user_id, priority, served, deadline, target, trace),
+                        deadline
+                    )
+                    if self._served_by_primary(served, target):
+                        self._cache_store(lookup, response)
+                except ProviderUnavailableError as e:
+                    response = e.fallback_response
             
             # Add assistant response to history
-            self.conversations[conversation_id].append({
-                "role": "assistant",
-                "content": response,
-                "timestamp": datetime.now().isoformat()
-            })
+            with traced_span(trace, "history"):
+                await self._add_to_history(conversation_id, "assistant", response)
             
             # Update metrics
             response_time = time.time() - start_time
-            self.message_count += 1
-            self.total_response_time += response_time
+            self._record_response_time(response_time, target)
+            
+            if metadata is not None:
+                metadata.update(self._response_metadata(served, target, lookup.source, response_time))
             
             logger.info(f"Processed message in {response_time:.2f}s")
             return response
             
+        except (OverloadedError, ModelUnavailableError, UnknownModelError):
+            raise
+        except DeadlineExceededError:
+            self._record_cancellation("deadline_exceeded", start_time)
+            raise
+        except asyncio.CancelledError:
+            self._record_cancellation("client_disconnected", start_time)
+            raise
         except Exception as e:
             logger.error(f"Error processing message: {e}")
             return f"I apologize, but I encountered an error processing your message: {str(e)}"
     
-    async def _process_ollama_message(self, message: str, conversation_id: str) -> str:
+    async def stream_message(self, message: str, conversation_id: str = None,
+                             use_cache: bool = True, user_id: Optional[str] = None,
+                             priority: str = PRIORITY_BULK, deadline: Optional[float] = None,
+                             provider: Optional[str] = None, model: Optional[str] = None,
+                             trace: Optional[Trace] = None) -> AsyncIterator[dict]:
+        """
+        Process a chat message and yield events as tokens arrive.
+        Yields {"type": "token", "token": ...} events followed by one
+        {"type": "done", "response": ..., "metadata": ...} event.
+        The upstream stream is cancelled when the deadline passes or the consumer goes away.
+        trace, if given, receives a span per stage and its timings are added to the metadata.
+        """
+        start_time = time.time()
+        first_token_time = None
+        tokens = []
+        
+        target = await run_within(self._select_model(provider, model), deadline)
+        with traced_span(trace, "cache"):
+            lookup = await self._cache_lookup(message, conversation_id, use_cache, target)
+        cacheable = lookup.response is None
+        if cacheable:
+            self.admission.check(target[1], priority)
+        
+        with traced_span(trace, "history"):
+            await self._add_to_history(conversation_id, "user", message)
+        
+        served = {}
+        if lookup.response is not None:
+            token_stream = self._replay_cached(lookup.response)
+        elif self.coalesce_requests:
+            token_stream = self.single_flight.stream(
+                await self._generation_key(message, conversation_id, target),
+                lambda: self._dispatch_stream(message, conversation_id, user_id, priority, served, deadline, target, trace)
+            )
+        else:
+            token_stream = self._dispatch_stream(
+                message, conversation_id, user_id, priority, served, deadline, target, trace
+            )
+        
+        try:
+            async for token in iterate_within(token_stream, deadline):
+                if first_token_time is None:
+                    first_token_time = time.time() - start_time
+                    self.time_to_first_token_histogram.observe(first_token_time)
+                    self.model_time_to_first_token.labels(model_key(*target)).observe(first_token_time)
+                tokens.append(token)
+                yield {"type": "token", "token": token}
+        except ProviderUnavailableError as e:
+            cacheable = False
+            tokens.append(e.fallback_response)
+            yield {"type": "token", "token": e.fallback_response}
+        except DeadlineExceededError:
+            self._record_cancellation("deadline_exceeded", start_time)
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            self._record_cancellation("client_disconnected", start_time)
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming message: {e}")
+            raise
+        
+        response = "".join(tokens)
+        if trace is not None and first_token_time is not None and trace.last("decode") is None:
+            # Upstreams that report no decode time: measured from the first token on
+            trace.record("decode", start_time + first_token_time, time.time())
+        if cacheable and self._served_by_primary(served, target):
+            self._cache_store(lookup, response)
+        with traced_span(trace, "history"):
+            await self._add_to_history(conversation_id, "assistant", response)
+        
+        response_time = time.time() - start_time
+        self._record_response_time(response_time, target)
+        if served and "generation" not in served and len(tokens) > 1 and response_time > first_token_time:
+            # Providers without upstream timing: decode rate after the first token, so prefill
+            # and queueing are not counted. Coalesced followers (served empty) are not recorded twice.
+            self.model_tokens_per_second.labels(model_key(*target)).observe(
+                (len(tokens) - 1) / (response_time - first_token_time)
+            )
+        
+        logger.info(
+            f"Streamed message in {response_time:.2f}s "
+            f"(first token after {first_token_time or response_time:.2f}s)"
+        )
+        metadata = {
+            "time_to_first_token": first_token_time,
+            "tokens": len(tokens),
+            **self._response_metadata(served, target, lookup.source, response_time)
+        }
+        if trace is not None:
+            metadata["timings"] = trace.timings()
+        yield {"type": "done", "response": response, "metadata": metadata}
+    
+    async def _replay_cached(self, response: str) -> AsyncIterator[str]:
+        yield response
+    
+    async def _generate(self, message: str, conversation_id: str, user_id: Optional[str] = None,
+                        priority: str = PRIORITY_BULK, served: Optional[dict] = None,
+                        deadline: Optional[float] = None, target: Optional[Tuple[str, str]] = None,
+                        trace: Optional[Trace] = None) -> str:
+        """
+        Generate a response, sharing the upstream call with identical in-flight requests.
+        A shared call runs under the deadline, and is traced in the trace, of the request that started it.
+        """
+        if self.coalesce_requests:
+            return await self.single_flight.do(
+                await self._generation_key(message, conversation_id, target),
+                lambda: self._dispatch_message(message, conversation_id, user_id, priority, served, deadline, target,
+                                               trace)
+            )
+        return await self._dispatch_message(message, conversation_id, user_id, priority, served, deadline, target, trace)
+    
+    async def _dispatch_message(self, message: str, conversation_id: str, user_id: Optional[str] = None,
+                                priority: str = PRIORITY_BULK, served: Optional[dict] = None,
+                                deadline: Optional[float] = None, target: Optional[Tuple[str, str]] = None,
+                                trace: Optional[Trace] = None) -> str:
+        """
+        Generate a response, failing over along the provider chain.
+        The provider and model that answered are written to served, if given.
+        """
+        last_error: Optional[Exception] = None
+        for provider, model in self._provider_chain(target):
+            breaker = self._breaker(provider)
+            if not breaker.allow():
+                continue
+            start = None
+            queued = time.time()
+            try:
+                async with self._admission_slot(provider, model, priority, user_id):
+                    start = time.time()
+                    if trace is not None and not self._batched(provider):
+                        trace.record("queue", queued, start)
+                    response = await self._call_provider(provider, model, message, conversation_id, deadline, served,
+                                                         trace, priority)
+            except (OverloadedError, DeadlineExceededError, asyncio.CancelledError):
+                breaker.release()
+                raise
+            except Exception as e:
+                if expired(deadline):
+                    # Out of budget, not the provider's fault; no point trying the next one either
+                    breaker.release()
+                    raise DeadlineExceededError(f"Request deadline exceeded: {e}")
+                breaker.record(True, time.time() - (start or time.time()))
+                logger.warning(f"Provider {provider} ({model}) failed: {e}")
+                last_error = e
+                continue
+            breaker.record(False, time.time() - start)
+            if served is not None:
+                served.update(provider=provider, model=model)
+            return response
+        raise last_error or CircuitOpenError("All providers are unavailable (circuit open)")
+    
+    async def _dispatch_stream(self, message: str, conversation_id: str, user_id: Optional[str] = None,
+                               priority: str = PRIORITY_BULK, served: Optional[dict] = None,
+                               deadline: Optional[float] = None,
+                               target: Optional[Tuple[str, str]] = None,
+                               trace: Optional[Trace] = None) -> AsyncIterator[str]:
+        """
+        Open a token stream, holding an admission slot until it ends.
+        Failover along the provider chain is only possible before the first token.
+        """
+        last_error: Optional[Exception] = None
+        for provider, model in self._provider_chain(target):
+            breaker = self._breaker(provider)
+            if not breaker.allow():
+                continue
+            start = None
+            streaming = False
+            queued = time.time()
+            try:
+                async with self._admission_slot(provider, model, priority, user_id):
+                    start = time.time()
+                    if trace is not None and not self._batched(provider):
+                        trace.record("queue", queued, start)
+                    async for token in self._open_provider_stream(provider, model, message, conversation_id,
+                                                                  deadline, served, trace, priority):
+                        if not streaming:
+                            # Time to first token is the latency the breaker judges
+                            streaming = True
+                            breaker.record(False, time.time() - start)
+                            if served is not None:
+                                served.update(provider=provider, model=model)
+                        yield token
+                if not streaming:
+                    breaker.record(False, time.time() - start)
+                    if served is not None:
+                        served.update(provider=provider, model=model)
+                return
+            except (OverloadedError, DeadlineExceededError, asyncio.CancelledError, GeneratorExit):
+                if not streaming:
+                    breaker.release()
+                raise
+            except Exception as e:
+                if streaming:
+                    raise
+                if expired(deadline):
+                    breaker.release()
+                    raise DeadlineExceededError(f"Request deadline exceeded: {e}")
+                breaker.record(True, time.time() - (start or time.time()))
+                logger.warning(f"Provider {provider} ({model}) failed before streaming: {e}")
+                last_error = e
+        raise last_error or CircuitOpenError("All providers are unavailable (circuit open)")
+    
+    def _batched(self, provider: str) -> bool:
+        return provider == "huggingface" and self.hf_batcher is not None
+    
+    def _admission_slot(self, provider: str, model: str, priority: str, user_id: Optional[str]):
+        """
+        Hold one of the model's slots for a request. Micro-batched requests take none here:
+        their batch takes a single slot when it is sent (_send_huggingface_microbatch).
+        """
+        if self._batched(provider):
+            return nullcontext()
+        return self.admission.admit(model, priority, user_id)
+    
+    def _default_target(self) -> Tuple[str, str]:
+        return self.model_provider, self.model_name
+    
+    async def _select_model(self, provider: Optional[str], model: Optional[str]) -> Tuple[str, str]:
+        """The (provider, model) a request asked for, loaded and ready; the default if it named none"""
+        if provider is None and model is None:
+            return self._default_target()
+        provider = provider or self.model_provider
+        if model is None:
+            model = self.model_name if provider == self.model_provider else DEFAULT_PROVIDER_MODELS.get(provider, "")
+        if provider == self.model_provider and model in (self.model_name, self.model_name.split(":")[0]):
+            return self._default_target()
+        catalogue_info = self._validate_model(provider, model)
+        entry = await self.model_registry.ensure(provider, model, catalogue_info)
+        return provider, entry.model
+    
+    def _provider_chain(self, target: Optional[Tuple[str, str]] = None) -> List[Tuple[str, str]]:
+        """The requested (or configured) provider and model first, then the failover chain"""
+        primary_provider, primary_model = target or self._default_target()
+        chain = [(primary_provider, primary_model)]
+        for provider, model in self.provider_chain:
+            if provider == primary_provider and model in (None, primary_model):
+                continue
+            chain.append((provider, model or DEFAULT_PROVIDER_MODELS.get(provider, primary_model)))
+        return chain
+    
+    def _served_by_primary(self, served: dict, target: Optional[Tuple[str, str]] = None) -> bool:
+        """Only answers from the requested model may be cached under its keys"""
+        return (served.get("provider"), served.get("model")) == (target or self._default_target())
+    
+    def _breaker(self, provider: str) -> CircuitBreaker:
+        breaker = self.breakers.get(provider)
+        if breaker is None:
+            breaker = self.breakers[provider] = CircuitBreaker.from_env(provider)
+        return breaker
+    
+    async def _call_provider(self, provider: str, model: str, message: str, conversation_id: str,
+                             deadline: Optional[float] = None, served: Optional[dict] = None,
+                             trace: Optional[Trace] = None, priority: str = PRIORITY_BULK) -> str:
+        """Generate a response based on model type"""
+        if provider == "ollama":
+            return await self._process_ollama_message(message, conversation_id, model, deadline, served, trace)
+        elif provider == "huggingface":
+            return await self._process_huggingface_message(message, conversation_id, model, deadline, trace,
+                                                           priority)
+        else:
+            return await self._process_mock_message(message, conversation_id)
+    
+    def _open_provider_stream(self, provider: str, model: str, message: str, conversation_id: str,
+                              deadline: Optional[float] = None, served: Optional[dict] = None,
+                              trace: Optional[Trace] = None, priority: str = PRIORITY_BULK) -> AsyncIterator[str]:
+        """Open a token stream based on model type"""
+        if provider == "ollama":
+            return self._stream_ollama_message(message, conversation_id, model, deadline, served, trace)
+        elif provider == "huggingface":
+            return self._stream_huggingface_message(message, conversation_id, model, deadline, trace, priority)
+        else:
+            return self._stream_mock_message(message, conversation_id)
+    
+    async def _generation_key(self, message: str, conversation_id: str,
+                              target: Optional[Tuple[str, str]] = None) -> str:
+        """Key identifying requests that would produce the same upstream generation"""
+        provider, model = target or self._default_target()
+        return generation_key(
+            provider,
+            model,
+            message,
+            await self._get_conversation_context(conversation_id, model)
+        )
+    
+    async def _cache_lookup(self, message: str, conversation_id: str, use_cache: bool,
+                            target: Optional[Tuple[str, str]] = None) -> _CacheLookup:
+        """Consult the exact-match cache, then the similarity cache"""
+        lookup = _CacheLookup()
+        if not use_cache:
+            return lookup
+        
+        provider, model = target or self._default_target()
+        if self.response_cache is not None:
+            # Keyed on provider, model, normalized message and the prior conversation context
+            lookup.key = generation_key(
+                provider,
+                model,
+                normalize_message(message),
+                await self._get_conversation_context(conversation_id, model)
+            )
+            lookup.response = self.response_cache.get(lookup.key)
+            if lookup.response is not None:
+                lookup.source = "exact"
+                return lookup
+        
+        # Paraphrase matching only applies to opening questions, where no prior
+        # context can change what the right answer is
+        if self.semantic_cache is not None and not await self.conversation_store.has_history(conversation_id):
+            lookup.scope = model_key(provider, model)
+            try:
+                embedding = await self.embedder.embed(message)
+                lookup.embedding = embedding
+                match = self.semantic_cache.lookup(embedding, lookup.scope)
+                if match is not None:
+                    lookup.response = match[0]
+                    lookup.source = "semantic"
+                    logger.info(f"Semantic cache hit (similarity {match[1]:.3f})")
+            except Exception as e:
+                logger.warning(f"Semantic cache lookup failed: {e}")
+        return lookup
+    
+    def _cache_store(self, lookup: _CacheLookup, response: str):
+        """Store a freshly generated response in the caches consulted by the lookup"""
+        if lookup.key is not None:
+            self.response_cache.set(lookup.key, response)
+        if lookup.embedding is not None:
+            self.semantic_cache.insert(lookup.embedding, lookup.scope, response)
+    
+    async def _add_to_history(self, conversation_id: str, role: str, content: str):
+        """Append a message to the conversation history"""
+        await self.conversation_store.append(conversation_id, role, content)
+    
+    def _record_response_time(self, response_time: float, target: Optional[Tuple[str, str]] = None):
+        self.message_count += 1
+        self.total_response_time += response_time
+        self.response_time_histogram.observe(response_time)
+        self.model_response_time.labels(model_key(*(target or self._default_target()))).observe(response_time)
+    
+    def _response_metadata(self, served: dict, target: Tuple[str, str], cached: Optional[str],
+                           total_time: float) -> dict:
+        """Per-response details returned to the client alongside the text"""
+        metadata = {
+            "total_time": total_time,
+            "cached": cached,
+            "model": served.get("model", target[1])
+        }
+        if "generation" in served:
+            metadata["generation"] = served["generation"]
+        return metadata
+    
+    def _record_cancellation(self, reason: str, start_time: float):
+        elapsed = time.time() - start_time
+        self.cancelled_requests[reason] += 1
+        self.cancelled_after_histogram.observe(elapsed)
+        logger.info(f"Request cancelled ({reason}) after {elapsed:.2f}s")
+    
+    async def _process_ollama_message(self, message: str, conversation_id: str, model: str,
+                                      deadline: Optional[float] = None, served: Optional[dict] = None,
+                                      trace: Optional[Trace] = None) -> str:
         """Process message using Ollama"""
         try:
-            async with httpx.AsyncClient(timeout=180.0, http2=False) as client:
-                # Get conversation context
-                context = self._get_conversation_context(conversation_id)
-                
-                prompt_data = {
-                    "model": self.model_name,
-                    "prompt": f"Context: {context}\nUser: {message}\nAssistant:",
-                    "stream": False
-                }
-                
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json=prompt_data
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return result.get("response", "No response generated")
+            with traced_span(trace, "context"):
+                prompt_data = await self._build_ollama_request(message, conversation_id, model, stream=False)
+            
+            client = self.upstreams.get("ollama")
+            timeout = timeout_for(deadline, 180.0)
+            with traced_span(trace, "upstream", provider="ollama", model=model) as upstream:
+                if self.hedge_requests and isinstance(client, UpstreamPool):
+                    # Both hedged attempts share the traceparent; their connect/TTFB events would interleave
+                    response = await client.hedged_request(
+                        "POST", "/api/generate", json=prompt_data, timeout=timeout,
+                        **upstream_options(trace, upstream, timing=False)
+                    )
                 else:
-                    raise Exception(f"Ollama API error: {response.status_code}")
+                    response = await client.post(
+                        "/api/generate",
+                        json=prompt_data,
+                        timeout=timeout,
+                        **upstream_options(trace, upstream)
+                    )
+            
+            if response.status_code == 200:
+                result = response.json()
+                text = result.get("response", "No response generated")
+                stages = await self._record_ollama_result(conversation_id, prompt_data, result, text, served)
+                if trace is not None and stages is not None:
+                    self._trace_generation_stages(trace, stages, upstream)
+                return text
+            else:
+                raise Exception(f"Ollama API error: {response.status_code}")
                     
         except Exception as e:
             logger.error(f"Ollama processing error: {e}")
             raise
     
-    async def _process_huggingface_message(self, message: str, conversation_id: str) -> str:
+    async def _stream_ollama_message(self, message: str, conversation_id: str, model: str,
+                                     deadline: Optional[float] = None,
+                                     served: Optional[dict] = None,
+                                     trace: Optional[Trace] = None) -> AsyncIterator[str]:
+        """Stream tokens from Ollama's NDJSON generate API"""
+        with traced_span(trace, "context"):
+            prompt_data = await self._build_ollama_request(message, conversation_id, model, stream=True)
+        
+        upstream = trace.start_span("upstream", provider="ollama", model=model) if trace is not None else None
+        async with self.upstreams.get("ollama").stream(
+            "POST",
+            "/api/generate",
+            json=prompt_data,
+            timeout=timeout_for(deadline, 180.0),
+            **upstream_options(trace, upstream)
+        ) as response:
+            if response.status_code != 200:
+                raise Exception(f"Ollama API error: {response.status_code}")
+            
+            tokens = []
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise Exception(f"Ollama API error: {chunk['error']}")
+                token = chunk.get("response", "")
+                if token:
+                    tokens.append(token)
+                    yield token
+                if chunk.get("done"):
+                    # The final chunk carries the context array and timing fields
+                    stages = await self._record_ollama_result(
+                        conversation_id, prompt_data, chunk, "".join(tokens), served
+                    )
+                    if upstream is not None:
+                        upstream.finish()
+                        if stages is not None:
+                            self._trace_generation_stages(trace, stages, upstream)
+                    break
+    
+    async def _build_ollama_request(self, message: str, conversation_id: str, model: str, stream: bool) -> dict:
+        """Build the /api/generate payload, continuing from stored KV context when possible"""
+        request = {
+            "model": model,
+            "stream": stream,
+            "keep_alive": self.ollama_keep_alive
+        }
+        
+        if self.reuse_ollama_context:
+            context_tokens = await self._load_ollama_context(conversation_id, model)
+            if context_tokens:
+                # The context already holds the earlier turns, so only the new turn is sent
+                request["prompt"] = f"\nUser: {message}\nAssistant:"
+                request["context"] = context_tokens
+                return request
+        
+        # Fall back to rebuilding the transcript as text
+        context = await self._get_conversation_context(conversation_id, model)
+        request["prompt"] = f"Context: {context}\nUser: {message}\nAssistant:"
+        self.context_tokens_histogram.observe(approx_token_count(request["prompt"]))
+        return request
+    
+    def _ollama_context_state_key(self, model: str) -> str:
+        return f"ollama_context:{model}"
+    
+    async def _load_ollama_context(self, conversation_id: str, model: str) -> Optional[List[int]]:
+        """Stored KV context for this conversation, if it still matches the visible history"""
+        # The current user message is already in history; the context must end with the reply before it
+        recent = await self.conversation_store.recent(conversation_id, 2)
+        if len(recent) < 2 or recent[0].role != "assistant":
+            return None
+        data = await self.conversation_store.get_state(conversation_id, self._ollama_context_state_key(model))
+        tokens = unpack_context(data, recent[0].content)
+        if tokens and len(tokens) > self.context_window.budget_for(model):
+            # Let the budgeted (and summarized) text transcript replace an overgrown context
+            return None
+        return tokens
+    
+    async def _record_ollama_result(self, conversation_id: str, request: dict, result: dict, text: str,
+                                    served: Optional[dict] = None) -> Optional[dict]:
+        """
+        Keep the returned KV context for the next turn and record generation stage timing.
+        Returns the generation stages, if Ollama reported them.
+        """
+        mode = "kv_context" if "context" in request else "text"
+        prompt_eval_duration = result.get("prompt_eval_duration")
+        if prompt_eval_duration is not None:
+            prefill_seconds = prompt_eval_duration / 1e9
+            prompt_tokens = result.get("prompt_eval_count", 0)
+            self.prefill_histograms[mode].observe(prefill_seconds)
+            self.prefill_tokens[mode] += prompt_tokens
+            logger.info(f"Ollama prefill ({mode}): {prompt_tokens} tokens in {prefill_seconds:.3f}s")
+        
+        stages = ollama_generation_stages(result)
+        if stages is not None:
+            key = model_key("ollama", request["model"])
+            for stage in GENERATION_STAGES:
+                self.model_stage_times[stage].labels(key).observe(stages[f"{stage}_seconds"])
+            if stages["tokens_per_second"] is not None:
+                self.model_tokens_per_second.labels(key).observe(stages["tokens_per_second"])
+            if served is not None:
+                served["generation"] = stages
+        
+        if self.reuse_ollama_context:
+            context_tokens = result.get("context")
+            await self.conversation_store.set_state(
+                conversation_id,
+                self._ollama_context_state_key(request["model"]),
+                pack_context(text, context_tokens) if context_tokens else None
+            )
+        return stages
+    
+    def _trace_generation_stages(self, trace: Trace, stages: dict, upstream: Span):
+        """
+        Add Ollama's reported model load, prefill and decode times as children of the
+        upstream span. Ollama reports durations only, so they are laid out back to back
+        ending when the upstream call did.
+        """
+        end = upstream.end or time.time()
+        for stage in reversed(GENERATION_STAGES):
+            start = end - stages[f"{stage}_seconds"]
+            trace.record(stage, start, end, upstream, reported_by="ollama")
+            end = start
+    
+    async def _process_huggingface_message(self, message: str, conversation_id: str, model: str,
+                                           deadline: Optional[float] = None,
+                                           trace: Optional[Trace] = None,
+                                           priority: str = PRIORITY_BULK) -> str:
         """Process message using Hugging Face Inference API"""
         try:
-            async with httpx.AsyncClient() as client:
-                # Prepare headers
-                headers = {"Content-Type": "application/json"}
-                if self.hf_api_token:
-                    headers["Authorization"] = f"Bearer {self.hf_api_token}"
-                
-                # Build API URL
-                api_url = f"https://api-inference.huggingface.co/models/{self.model_name}"
-                
-                # Get conversation context
-                context = self._get_conversation_context(conversation_id)
-                
-                # Prepare payload based on model type
-                if "flan-t5" in self.model_name.lower():
-                    # For T5 models, format as question
-                    payload = {
-                        "inputs": f"Question: {message}",
-                        "parameters": {
-                            "max_length": 200,
-                            "temperature": 0.7,
-                            "do_sample": True
-                        }
+            # Build API URL (auth headers are set on the pooled client)
+            api_url = f"/models/{model}"
+            
+            # Get conversation context
+            with traced_span(trace, "context"):
+                context = await self._get_conversation_context(conversation_id, model)
+            
+            # Prepare payload based on model type
+            if "flan-t5" in model.lower():
+                # For T5 models, format as question
+                payload = {
+                    "inputs": f"Question: {message}",
+                    "parameters": {
+                        "max_length": 200,
+                        "temperature": 0.7,
+                        "do_sample": True
                     }
-                elif "dialogpt" in self.model_name.lower():
-                    # For DialoGPT, include conversation history
-                    full_context = f"{context}\nUser: {message}\nBot:" if context else f"User: {message}\nBot:"
-                    payload = {
-                        "inputs": full_context,
-                        "parameters": {
-                            "max_length": 100,
-                            "temperature": 0.7,
-                            "return_full_text": False
-                        }
+                }
+            elif "dialogpt" in model.lower():
+                # For DialoGPT, include conversation history
+                full_context = f"{context}\nUser: {message}\nBot:" if context else f"User: {message}\nBot:"
+                payload = {
+                    "inputs": full_context,
+                    "parameters": {
+                        "max_length": 100,
+                        "temperature": 0.7,
+                        "return_full_text": False
                     }
-                else:
-                    # Generic text generation
-                    payload = {
-                        "inputs": f"User: {message}\nAssistant:",
-                        "parameters": {
-                            "max_length": 150,
-                            "temperature": 0.7,
-                            "return_full_text": False
-                        }
+                }
+            else:
+                # Generic text generation
+                payload = {
+                    "inputs": f"User: {message}\nAssistant:",
+                    "parameters": {
+                        "max_length": 150,
+                        "temperature": 0.7,
+                        "return_full_text": False
                     }
-                
-                response = await client.post(
-                    api_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=30.0
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    
-                    # Handle different response formats
-                    if isinstance(result, list) and len(result) > 0:
-                        if "generated_text" in result[0]:
-                            generated_text = result[0]["generated_text"]
-                            # Clean up the response
-                            if full_context in generated_text:
-                                generated_text = generated_text.replace(full_context, "").strip()
-                            return generated_text or "I understand, but I don't have a specific response right now."
-                        else:
-                            return str(result[0])
-                    else:
-                        return "I received your message but couldn't generate a proper response."
-                        
-                elif response.status_code == 503:
-                    return "The model is currently loading. Please try again in a moment."
+                }
+            
+            with traced_span(trace, "upstream", provider="huggingface", model=model) as upstream:
+                if self.hf_batcher is not None:
+                    # Concurrent requests with the same model and parameters share one upstream call,
+                    # which belongs to no single trace; queueing for its slot is part of this span
+                    batch_key = (api_url, json.dumps(payload["parameters"], sort_keys=True), model)
+                    result = await self.hf_batcher.submit(batch_key, (priority, payload))
                 else:
-                    logger.error(f"HF API error {response.status_code}: {response.text}")
-                    raise Exception(f"Hugging Face API error: {response.status_code}")
-                    
+                    result = (await self._send_huggingface_batch((api_url, None), [payload], deadline,
+                                                                 upstream_options(trace, upstream)))[0]
+            
+            # Handle different response formats
+            if isinstance(result, list) and len(result) > 0:
+                if "generated_text" in result[0]:
+                    generated_text = result[0]["generated_text"]
+                    # Clean up the response
+                    if payload["inputs"] in generated_text:
+                        generated_text = generated_text.replace(payload["inputs"], "").strip()
+                    return generated_text or "I understand, but I don't have a specific response right now."
+                else:
+                    return str(result[0])
+            else:
+                return "I received your message but couldn't generate a proper response."
+                
+        except (ProviderUnavailableError, DeadlineExceededError):
+            raise
         except Exception as e:
+            if expired(deadline):
+                raise DeadlineExceededError(f"Request deadline exceeded: {e}")
             logger.error(f"Hugging Face processing error: {e}")
-            # Fallback to a generic response
-            return f"I apologize, but I'm having trouble processing your message right now. Error: {str(e)}"
+            # Fallback to a generic response, which must not be cached
+            raise ProviderUnavailableError(
+                f"I apologize, but I'm having trouble processing your message right now. Error: {str(e)}"
+            )
+    
+    async def _send_huggingface_microbatch(self, batch_key: tuple, items: List[Tuple[str, dict]]) -> List[object]:
+        """Send a flushed micro-batch under one admission slot, queued at its most urgent request's priority"""
+        priorities = [priority for priority, _ in items]
+        priority = min(priorities, key=lambda name: _URGENCY.get(name, len(_URGENCY)))
+        async with self.admission.admit(batch_key[2], priority):
+            return await self._send_huggingface_batch(batch_key, [payload for _, payload in items])
+    
+    async def _send_huggingface_batch(self, batch_key: tuple, payloads: List[dict],
+                                      deadline: Optional[float] = None,
+                                      request_options: Optional[dict] = None) -> List[object]:
+        """
+        Send one or more payloads for the same model in a single Inference API call.
+        A batch shared by several callers keeps the usual timeout; each caller still
+        stops waiting at its own deadline. request_options carries trace propagation.
+        """
+        api_url = batch_key[0]
+        if len(payloads) == 1:
+            body = payloads[0]
+        else:
+            body = {"inputs": [payload["inputs"] for payload in payloads], "parameters": payloads[0]["parameters"]}
+        
+        response = await self.upstreams.get("huggingface").post(
+            api_url, json=body, timeout=timeout_for(deadline, 30.0), **(request_options or {})
+        )
+        if response.status_code == 200:
+            result = response.json()
+            if len(payloads) == 1:
+                return [result]
+            # Batched calls return one entry per input, either a dict or a one-element list
+            return [item if isinstance(item, list) else [item] for item in result]
+        elif response.status_code == 503:
+            raise ProviderUnavailableError("The model is currently loading. Please try again in a moment.")
+        else:
+            logger.error(f"HF API error {response.status_code}: {response.text}")
+            raise Exception(f"Hugging Face API error: {response.status_code}")
     
     async def _process_mock_message(self, message: str, conversation_id: str) -> str:
         """Process message using mock responses for testing"""
@@ -399,44 +1233,120 @@ class LLMService:
         response_index = hash(message) % len(mock_responses)
         return mock_responses[response_index]
     
-    def _get_conversation_context(self, conversation_id: str) -> str:
-        """Get conversation context for Ollama prompts"""
-        conversation = self.conversations.get(conversation_id, [])
+    async def _stream_huggingface_message(self, message: str, conversation_id: str, model: str,
+                                          deadline: Optional[float] = None,
+                                          trace: Optional[Trace] = None,
+                                          priority: str = PRIORITY_BULK) -> AsyncIterator[str]:
+        """The Inference API returns complete generations, so emit them as one chunk"""
+        yield await self._process_huggingface_message(message, conversation_id, model, deadline, trace, priority)
+    
+    async def _stream_mock_message(self, message: str, conversation_id: str) -> AsyncIterator[str]:
+        """Stream a mock response word by word"""
+        response = await self._process_mock_message(message, conversation_id)
+        words = response.split(" ")
+        for index, word in enumerate(words):
+            yield word if index == len(words) - 1 else f"{word} "
+            await asyncio.sleep(0.01)
+    
+    async def _get_conversation_context(self, conversation_id: str, model: Optional[str] = None) -> str:
+        """Get conversation context for Ollama prompts, fitted to the model's token budget"""
+        conversation = await self.conversation_store.recent(conversation_id)
         if not conversation:
             return "This is the start of a new conversation."
         
-        # Format recent messages as context
+        model = model or self.model_name
+        summarized_through, summary = await self._load_summary(conversation_id)
+        pending = [msg for msg in conversation if msg.timestamp > summarized_through]
+        budget = self.context_window.budget_for(model) - approx_token_count(summary)
+        window, overflow = self.context_window.select(pending, budget)
+        if overflow:
+            # Compact the older turns off the request path; this turn just drops them
+            self.summarizer.schedule(conversation_id, lambda: self._summarize_conversation(conversation_id, model))
+        
+        # Format the summary and the messages that fit as context
         context_messages = []
-        for msg in conversation[-5:]:  # Last 5 messages
-            context_messages.append(f"{msg['role'].title()}: {msg['content']}")
+        if summary:
+            context_messages.append(f"Summary of earlier conversation: {summary}")
+        for msg in window:
+            context_messages.append(f"{msg.role.title()}: {msg.content}")
         
         return "\n".join(context_messages)
     
+    async def _load_summary(self, conversation_id: str) -> Tuple[float, str]:
+        """Stored summary and the timestamp of the last message it covers"""
+        data = await self.conversation_store.get_state(conversation_id, "summary")
+        if not data:
+            return 0.0, ""
+        summary = json.loads(data)
+        return summary["through"], summary["text"]
+    
+    async def _summarize_conversation(self, conversation_id: str, model: str):
+        """Fold history that no longer fits the conversation's model's budget into the stored summary"""
+        conversation = await self.conversation_store.recent(conversation_id)
+        summarized_through, summary = await self._load_summary(conversation_id)
+        pending = [msg for msg in conversation if msg.timestamp > summarized_through]
+        # Leave room for the summary this pass will write
+        budget = self.context_window.budget_for(model)
+        budget -= min(self.context_window.summary_max_tokens, budget // 2)
+        _, overflow = self.context_window.select(pending, budget)
+        if not overflow:
+            return
+        
+        text = self.context_window.truncate_summary(await self._summarize(summary, overflow, model))
+        await self.conversation_store.set_state(
+            conversation_id,
+            "summary",
+            json.dumps({"through": overflow[-1].timestamp, "text": text}).encode("utf-8")
+        )
+        logger.info(f"Summarized {len(overflow)} messages for conversation {conversation_id}")
+    
+    def _summarization_model(self, model: str) -> Optional[str]:
+        """The conversation's own Ollama model if it is loaded, else the default Ollama model if loaded"""
+        if self.model_registry.get("ollama", model) is not None:
+            return model
+        if self.model_provider == "ollama" and self.model_loaded:
+            return self.model_name
+        return None
+    
+    async def _summarize(self, summary: str, messages: List[Message], model: Optional[str] = None) -> str:
+        """Summarize with a local model, or extract the gist when no Ollama model is loaded"""
+        transcript = "\n".join(f"{msg.role.title()}: {msg.content}" for msg in messages)
+        summarizer_model = self._summarization_model(model or self.model_name)
+        if summarizer_model is not None:
+            response = await self.upstreams.get("ollama").post(
+                "/api/generate",
+                json={
+                    "model": summarizer_model,
+                    "prompt": (
+                        "Summarize this conversation in a few sentences, keeping names, facts "
+                        f"and open questions.\nPrevious summary: {summary or 'none'}\n{transcript}\nSummary:"
+                    ),
+                    "stream": False,
+                    "keep_alive": self.ollama_keep_alive
+                },
+                timeout=120.0
+            )
+            if response.status_code == 200:
+                return response.json().get("response", "").strip()
+            raise Exception(f"Ollama API error: {response.status_code}")
+        
+        # First sentence of each message is a reasonable stand-in without a model
+        gist = " ".join(f"{msg.role.title()}: {msg.content.split('. ')[0][:160]}" for msg in messages)
+        return f"{summary} {gist}".strip()
+    
     async def health_check(self) -> bool:
         """Check if the LLM service is healthy"""
         try:
             if self.model_provider == "ollama":
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(f"{self.base_url}/api/version", timeout=5.0)
-                    healthy = response.status_code == 200
+                response = await self.upstreams.get("ollama").get("/api/version", timeout=5.0)
+                healthy = response.status_code == 200
             elif self.model_provider == "huggingface":
-                # For HF, we can test with a simple inference call
-                async with httpx.AsyncClient() as client:
-                    headers = {"Content-Type": "application/json"}
-                    if self.hf_api_token:
-                        headers["Authorization"] = f"Bearer {self.hf_api_token}"
-                    
-                    api_url = f"https://api-inference.huggingface.co/models/{self.model_name}"
-                    test_payload = {"inputs": "Hello"}
-                    
-                    response = await client.post(
-                        api_url,
-                        headers=headers,
-                        json=test_payload,
-                        timeout=10.0
-                    )
-                    # 200 (OK) or 503 (model loading) are both acceptable
-                    healthy = response.status_code in [200, 503]
+                # The status endpoint reports the model's state without spending inference quota
+                response = await self.upstreams.get("huggingface").get(
+                    f"/status/{self.model_name}",
+                    timeout=10.0
+                )
+                healthy = response.status_code == 200
             else:
                 healthy = True  # Mock is always healthy
             
@@ -454,7 +1364,11 @@ class LLMService:
             "model_name": self.model_name,
             "model_loaded": self.model_loaded,
             "is_initialized": self.is_initialized,
-            "last_health_check": self.last_health_check.isoformat() if self.last_health_check else None
+            "last_health_check": self.last_health_check.isoformat() if self.last_health_check else None,
+            "switching": self._switch_lock.locked(),
+            "draining": sorted(self._retiring.values()),
+            "switches": dict(self.model_switches),
+            "switch_duration_seconds": self.switch_duration_histogram.snapshot()
         }
     
     async def is_model_loaded(self) -> bool:
@@ -475,8 +1389,102 @@ class LLMService:
             return 0.0
         return self.total_response_time / self.message_count
     
+    def get_average_time_to_first_token(self) -> float:
+        """Get average time to first token for streamed responses"""
+        return self.time_to_first_token_histogram.mean()
+    
+    def get_latency_stats(self) -> dict:
+        """Get total latency and time-to-first-token distributions"""
+        return {
+            "response_time_seconds": self.response_time_histogram.snapshot(),
+            "time_to_first_token_seconds": self.time_to_first_token_histogram.snapshot()
+        }
+    
+    def get_prefill_stats(self) -> dict:
+        """Get per-turn prefill time, split by KV context reuse vs. text rebuild"""
+        return {
+            mode: {**histogram.snapshot(), "prompt_tokens": self.prefill_tokens[mode]}
+            for mode, histogram in self.prefill_histograms.items()
+        }
+    
+    def get_context_window_stats(self) -> dict:
+        """Get prompt size distribution and background summarization counters"""
+        return {
+            "prompt_tokens": self.context_tokens_histogram.snapshot(),
+            "summarizer": self.summarizer.get_stats()
+        }
+    
+    def get_model_stats(self) -> dict:
+        """Get the warm model set and response time per model"""
+        return {
+            "registry": self.model_registry.get_stats(),
+            "response_time_seconds": self.model_response_time.snapshot(),
+            "time_to_first_token_seconds": self.model_time_to_first_token.snapshot(),
+            "tokens_per_second": self.model_tokens_per_second.snapshot(),
+            "stage_seconds": {stage: family.snapshot() for stage, family in self.model_stage_times.items()}
+        }
+    
+    def get_cancellation_stats(self) -> dict:
+        """Get requests cancelled by deadline or disconnect, and how long they had run"""
+        coalescing = self.single_flight.get_stats()
+        return {
+            **self.cancelled_requests,
+            "cancelled_after_seconds": self.cancelled_after_histogram.snapshot(),
+            "upstream_calls_abandoned": coalescing["calls_abandoned"] + coalescing["streams_abandoned"]
+        }
+    
+    def get_circuit_breaker_stats(self) -> dict:
+        """Get circuit state per provider"""
+        return {provider: breaker.get_stats() for provider, breaker in self.breakers.items()}
+    
+    def get_saturation(self) -> float:
+        """How full the fullest admission queue is, from 0 to 1"""
+        return self.admission.saturation()
+    
+    def get_admission_stats(self) -> dict:
+        """Get queue depth, per-class wait time and rejection counts"""
+        return self.admission.get_stats()
+    
+    def get_batching_stats(self) -> Optional[dict]:
+        """Get micro-batch size and wait distributions, or None when batching is disabled"""
+        if self.hf_batcher is None:
+            return None
+        return self.hf_batcher.get_stats()
+    
+    def get_coalescing_stats(self) -> dict:
+        """Get single-flight coalescing statistics"""
+        return self.single_flight.get_stats()
+    
+    def get_cache_stats(self) -> Optional[dict]:
+        """Get response cache statistics, or None when the cache is disabled"""
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get_stats()
+    
+    def get_semantic_cache_stats(self) -> Optional[dict]:
+        """Get similarity cache statistics, or None when the cache is disabled"""
+        if self.semantic_cache is None:
+            return None
+        return self.semantic_cache.get_stats()
+    
+    def get_conversation_store_stats(self) -> dict:
+        """Get conversation store size and eviction statistics"""
+        return self.conversation_store.get_stats()
+    
+    def get_pool_stats(self) -> dict:
+        """Get upstream connection pool statistics"""
+        return self.upstreams.get_stats()
+    
     async def cleanup(self):
         """Cleanup resources"""
         logger.info("Cleaning up LLM service resources")
-        self.conversations.clear()
+        for task in list(self._retiring):
+            task.cancel()
+        await self.summarizer.close()
+        await self.upstreams.close()
+        await self.conversation_store.close()
+        if self.response_cache is not None:
+            self.response_cache.clear()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
         self.is_initialized = False 
\ No newline at end of file
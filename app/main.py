@@ -1,6 +1,8 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import hmac
 import json
 import logging
 import os
@@ -9,8 +11,17 @@ import asyncio
 from datetime import datetime
 from pydantic import BaseModel
 
-from .models import ChatMessage, ChatResponse
+from .models import ChatBatchRequest, ChatMessage, ChatResponse
+from .admission import OverloadedError
+from .deadlines import DEADLINE_HEADER, DeadlineExceededError, DeadlinePolicy
+from .health import HealthProber
+from .jobs import JobManager
 from .llm_service import LLMService
+from .metrics import HTTPMetrics, HTTPMetricsMiddleware, ServiceCollector, create_registry
+from .model_registry import ModelUnavailableError, UnknownModelError
+from .profiling import ProfileInProgressError, Profiler
+from .scheduling import PRIORITY_BACKGROUND, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from .tracing import Trace, Tracer, TracingMiddleware
 from .connection_manager import ConnectionManager
 
 # Configure logging
@@ -32,9 +43,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request counts and latency per route, exported on /metrics
+http_metrics = HTTPMetrics()
+app.add_middleware(HTTPMetricsMiddleware, metrics=http_metrics)
+
+# Per-request stage spans: Server-Timing headers, traceparent propagation, optional export
+tracer = Tracer.from_env()
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
 # Initialize services
 llm_service = LLMService()
 connection_manager = ConnectionManager()
+async def run_job(job):
+    """Generate a job's response under its own trace, continuing the submitting request's"""
+    trace = tracer.start_trace("job", job.traceparent)
+    trace.root.attributes["job_id"] = job.id
+    try:
+        async for event in llm_service.stream_message(
+            job.message,
+            job.conversation_id,
+            use_cache=job.use_cache,
+            user_id=job.user_id,
+            priority=PRIORITY_BACKGROUND,
+            provider=job.provider,
+            model=job.model_name,
+            trace=trace
+        ):
+            yield event
+    finally:
+        trace.finish()
+        tracer.export(trace)
+
+# Background generations share the admission queue at the lowest priority
+job_manager = JobManager.from_env(run_job)
+metrics_registry = create_registry(
+    ServiceCollector(llm_service, http_metrics, connection_manager.get_connection_count, job_manager.get_stats)
+)
+
+# Upstream health is checked in the background; probe endpoints read the cached state
+health_prober = HealthProber.from_env(
+    llm_service.health_check,
+    lambda: llm_service.is_initialized,
+    llm_service.get_saturation
+)
+
+# Per-request time budget, from the X-Request-Timeout header or the server default
+deadline_policy = DeadlinePolicy.from_env()
+
+# Bulk chat limits
+BATCH_MAX_CONCURRENCY = int(os.getenv("LLM_BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("LLM_BATCH_MAX_ITEMS", "1000"))
+
+# On-demand CPU and memory profiling behind /admin, enabled by setting LLM_ADMIN_TOKEN
+profiler = Profiler.from_env()
 
 # New models for model management
 class ModelSwitchRequest(BaseModel):
@@ -51,14 +112,21 @@ class ModelSwitchResponse(BaseModel):
 async def startup_event():
     """Initialize services on startup"""
     logger.info("Starting LLM Chatbot Service...")
+    # Probe from the start so liveness holds while a model is still being pulled
+    health_prober.start()
+    tracer.start()
     await llm_service.initialize()
+    await health_prober.probe()
     logger.info("LLM Service initialized successfully")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down LLM Chatbot Service...")
+    await health_prober.close()
+    await job_manager.close()
     await llm_service.cleanup()
+    await tracer.close()
 
 @app.get("/")
 async def read_root():
@@ -73,17 +141,37 @@ async def read_root():
 
 @app.get("/health")
 async def health_check():
-    """Kubernetes health check endpoint"""
-    try:
-        # Check if LLM service is responsive
-        is_healthy = await llm_service.health_check()
-        if is_healthy:
-            return {"status": "healthy", "timestamp": datetime.now().isoformat()}
-        else:
-            raise HTTPException(status_code=503, detail="LLM service not available")
-    except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
+    """Upstream health from the last background check"""
+    if health_prober.healthy:
+        return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    raise HTTPException(status_code=503, detail="LLM service not available")
+
+@app.get("/livez")
+async def liveness():
+    """Kubernetes liveness probe: the process and its event loop are running"""
+    if health_prober.live():
+        return {"status": "alive"}
+    raise HTTPException(status_code=503, detail="Health prober stalled")
+
+@app.get("/startupz")
+async def startup_probe():
+    """Kubernetes startup probe: initialized and the upstream answered once"""
+    if health_prober.started:
+        return {"status": "started"}
+    raise HTTPException(status_code=503, detail="Still starting")
+
+@app.get("/readyz")
+async def readiness():
+    """Kubernetes readiness probe: upstream healthy and admission queues not saturated"""
+    if health_prober.ready():
+        return {"status": "ready"}
+    stats = health_prober.get_stats()
+    raise HTTPException(status_code=503, detail={
+        "status": "not ready",
+        "started": stats["started"],
+        "healthy": stats["healthy"],
+        "saturated": stats["saturated"]
+    })
 
 @app.get("/models")
 async def get_available_models():
@@ -145,58 +233,299 @@ async def get_current_model():
 
 @app.get("/metrics")
 async def get_metrics():
-    """Basic metrics endpoint for monitoring"""
+    """Prometheus exposition of request, latency and queue metrics"""
+    return Response(generate_latest(metrics_registry), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/metrics/json")
+async def get_metrics_json():
+    """Detailed service statistics as JSON"""
     return {
         "active_connections": connection_manager.get_connection_count(),
         "total_messages_processed": llm_service.get_message_count(),
         "uptime_seconds": llm_service.get_uptime(),
-        "model_status": await llm_service.get_model_status()
+        "model_status": await llm_service.get_model_status(),
+        "latency": llm_service.get_latency_stats(),
+        "prefill": llm_service.get_prefill_stats(),
+        "context_window": llm_service.get_context_window_stats(),
+        "admission": llm_service.get_admission_stats(),
+        "health": health_prober.get_stats(),
+        "models": llm_service.get_model_stats(),
+        "circuit_breakers": llm_service.get_circuit_breaker_stats(),
+        "cancellations": llm_service.get_cancellation_stats(),
+        "batching": llm_service.get_batching_stats(),
+        "jobs": job_manager.get_stats(),
+        "coalescing": llm_service.get_coalescing_stats(),
+        "response_cache": llm_service.get_cache_stats(),
+        "semantic_cache": llm_service.get_semantic_cache_stats(),
+        "conversation_store": llm_service.get_conversation_store_stats(),
+        "upstream_pools": llm_service.get_pool_stats(),
+        "profiler": profiler.get_stats(),
+        "tracing": tracer.get_stats()
     }
 
+def require_admin(request: Request):
+    """Admin endpoints need "Authorization: Bearer <LLM_ADMIN_TOKEN>" and are off without a token"""
+    admin_token = os.getenv("LLM_ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (LLM_ADMIN_TOKEN is not set)")
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), admin_token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/admin/profile")
+async def profile_endpoint(request: Request, seconds: float = 10.0, all_threads: bool = False):
+    """
+    Sample the event loop for a number of seconds (capped by LLM_PROFILE_MAX_SECONDS) and
+    return collapsed stacks for flamegraph.pl or speedscope.
+    """
+    require_admin(request)
+    try:
+        result = await profiler.profile(seconds, all_threads)
+    except ProfileInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(result.collapsed(), headers={
+        "X-Profile-Samples": str(result.samples),
+        "X-Profile-Duration": f"{result.duration:.3f}",
+        "X-Profile-Overhead": f"{result.overhead:.4f}"
+    })
+
+@app.get("/admin/profile/memory")
+async def memory_profile_endpoint(request: Request, seconds: float = 10.0, limit: int = 25, frames: int = 1):
+    """Allocation growth by source line over a window, from a tracemalloc snapshot diff"""
+    require_admin(request)
+    try:
+        return PlainTextResponse(await profiler.memory_diff(seconds, limit, frames))
+    except ProfileInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+async def cancel_on_disconnect(request: Request, work):
+    """Await work, cancelling it if the client closes the connection first"""
+    async def disconnected():
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+    
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if not task.done():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # Nginx's "client closed request"; nobody is listening for the reply
+        raise HTTPException(status_code=499, detail="Client closed request")
+    return task.result()
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(message: ChatMessage):
+async def chat_endpoint(message: ChatMessage, request: Request):
     """REST endpoint for chat messages"""
+    trace = request.state.trace
     try:
-        response = await llm_service.process_message(message.message, message.conversation_id)
+        metadata = {}
+        with trace.span("handler"):
+            response = await cancel_on_disconnect(request, llm_service.process_message(
+                message.message,
+                message.conversation_id,
+                use_cache=not message.bypass_cache,
+                user_id=message.user_id,
+                priority=PRIORITY_BULK,
+                deadline=deadline_policy.deadline(request.headers.get(DEADLINE_HEADER)),
+                provider=message.provider,
+                model=message.model_name,
+                metadata=metadata,
+                trace=trace
+            ))
         return ChatResponse(
             response=response,
             conversation_id=message.conversation_id,
-            timestamp=datetime.now().isoformat()
+            timestamp=datetime.now().isoformat(),
+            metadata=metadata
         )
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except UnknownModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ModelUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing chat message: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(message: ChatMessage, request: Request):
+    """
+    Streaming chat endpoint: newline-delimited JSON events, one per token.
+    The generation stops if the client disconnects mid-stream.
+    Complete stage timings arrive in the done event's metadata; the headers go out with the first token.
+    """
+    events = llm_service.stream_message(
+        message.message,
+        message.conversation_id,
+        use_cache=not message.bypass_cache,
+        user_id=message.user_id,
+        priority=PRIORITY_BULK,
+        deadline=deadline_policy.deadline(request.headers.get(DEADLINE_HEADER)),
+        provider=message.provider,
+        model=message.model_name,
+        trace=request.state.trace
+    )
+    # Wait for the first event so an overloaded service can still answer with a 429
+    try:
+        first_event = await cancel_on_disconnect(request, events.__anext__())
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except UnknownModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ModelUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        raise
+    except StopAsyncIteration:
+        first_event = None
+    except Exception as e:
+        logger.error(f"Error streaming chat message: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
+    
+    async def with_first_event():
+        if first_event is not None:
+            yield first_event
+            async for event in events:
+                yield event
+    
+    async def event_stream():
+        try:
+            async for event in with_first_event():
+                if event["type"] == "done":
+                    event["conversation_id"] = message.conversation_id
+                    event["timestamp"] = datetime.now().isoformat()
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming chat message: {e}")
+            yield json.dumps({"type": "error", "error": f"Error processing message: {str(e)}"}) + "\n"
+    
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(batch: ChatBatchRequest, request: Request):
+    """
+    Bulk chat endpoint: messages run concurrently (up to the concurrency cap) and each
+    result is streamed back as one NDJSON line as soon as it completes, tagged with its index.
+    The request timeout applies to each message from the moment it starts.
+    """
+    requested_timeout = request.headers.get(DEADLINE_HEADER)
+    if len(batch.messages) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} messages")
+    semaphore = asyncio.Semaphore(min(batch.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    trace = request.state.trace
+    
+    async def run(index: int, message: ChatMessage) -> dict:
+        async with semaphore:
+            result = {"index": index, "conversation_id": message.conversation_id}
+            metadata = {}
+            # Items run concurrently, so each records its stages in its own child trace
+            item_trace = trace.child("batch item", index=index)
+            try:
+                result["response"] = await llm_service.process_message(
+                    message.message,
+                    message.conversation_id,
+                    use_cache=not message.bypass_cache,
+                    user_id=message.user_id,
+                    priority=PRIORITY_BULK,
+                    deadline=deadline_policy.deadline(requested_timeout),
+                    provider=message.provider,
+                    model=message.model_name,
+                    metadata=metadata,
+                    trace=item_trace
+                )
+                result["metadata"] = metadata
+            except OverloadedError as e:
+                result.update(error=str(e), status=429, retry_after=e.retry_after)
+            except DeadlineExceededError as e:
+                result.update(error=str(e), status=504)
+            except UnknownModelError as e:
+                result.update(error=str(e), status=400)
+            except ModelUnavailableError as e:
+                result.update(error=str(e), status=503)
+            finally:
+                item_trace.finish()
+                tracer.export(item_trace)
+            result["timestamp"] = datetime.now().isoformat()
+            return result
+    
+    async def result_stream():
+        tasks = [asyncio.ensure_future(run(index, message)) for index, message in enumerate(batch.messages)]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                yield json.dumps(await completed) + "\n"
+        finally:
+            # Stop outstanding work if the client goes away
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+@app.post("/jobs", status_code=202)
+async def create_job(message: ChatMessage, request: Request):
+    """Start a background generation and return its job id immediately"""
+    try:
+        job = job_manager.submit(
+            message.message,
+            message.conversation_id,
+            user_id=message.user_id,
+            use_cache=not message.bypass_cache,
+            provider=message.provider,
+            model_name=message.model_name,
+            traceparent=request.state.trace.traceparent()
+        )
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return JSONResponse(job.to_dict(), status_code=202, headers={"Location": f"/jobs/{job.id}"})
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Poll a job's status; the response is included once it has succeeded"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Follow a job as NDJSON: status changes, tokens so far and then live, and a final done event"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    
+    async def event_stream():
+        async for event in job.events():
+            yield json.dumps(event) + "\n"
+    
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     """WebSocket endpoint for real-time chat"""
     await connection_manager.connect(websocket, client_id)
     logger.info(f"Client {client_id} connected via WebSocket")
     
+    # Messages are answered one at a time by a worker while this loop keeps reading,
+    # so a disconnect is noticed (and the generation in flight cancelled) immediately
+    inbox: asyncio.Queue = asyncio.Queue()
+    worker = asyncio.ensure_future(
+        answer_websocket_messages(inbox, client_id, websocket.headers.get("traceparent"))
+    )
     try:
         while True:
             # Receive message from client
             data = await websocket.receive_text()
-            message_data = json.loads(data)
-            
-            # Process message with LLM
-            response = await llm_service.process_message(
-                message_data.get("message", ""),
-                message_data.get("conversation_id", client_id)
-            )
-            
-            # Send response back to client
-            response_data = {
-                "response": response,
-                "timestamp": datetime.now().isoformat(),
-                "conversation_id": message_data.get("conversation_id", client_id)
-            }
-            
-            await connection_manager.send_personal_message(
-                json.dumps(response_data), client_id
-            )
-            
-            logger.info(f"Processed message for client {client_id}")
+            await inbox.put(json.loads(data))
             
     except WebSocketDisconnect:
         connection_manager.disconnect(client_id)
@@ -204,6 +533,160 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
     except Exception as e:
         logger.error(f"WebSocket error for client {client_id}: {e}")
         connection_manager.disconnect(client_id)
+    finally:
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+async def answer_websocket_messages(inbox: asyncio.Queue, client_id: str, traceparent: str = None):
+    """
+    Process queued WebSocket messages in order and send the replies. Each message is its
+    own trace, continuing the message's "traceparent" field or else the handshake's header.
+    """
+    while True:
+        message_data = await inbox.get()
+        trace = tracer.start_trace("WS message", message_data.get("traceparent") or traceparent)
+        trace.root.attributes["client_id"] = client_id
+        try:
+            await answer_websocket_message(message_data, client_id, trace)
+        except Exception as e:
+            logger.error(f"WebSocket error for client {client_id}: {e}")
+        finally:
+            trace.finish()
+            tracer.export(trace)
+
+async def answer_websocket_message(message_data: dict, client_id: str, trace: Trace = None):
+    """Reply to one WebSocket chat message"""
+    conversation_id = message_data.get("conversation_id", client_id)
+    # WebSocket frames carry no headers, so the budget comes from the message itself
+    deadline = deadline_policy.deadline(message_data.get("timeout"))
+    
+    if message_data.get("stream"):
+        # Forward tokens as they arrive, then the complete response
+        await stream_to_websocket(
+            message_data.get("message", ""),
+            conversation_id,
+            client_id,
+            use_cache=not message_data.get("bypass_cache", False),
+            user_id=message_data.get("user_id", client_id),
+            deadline=deadline,
+            provider=message_data.get("provider"),
+            model_name=message_data.get("model_name"),
+            trace=trace
+        )
+        logger.info(f"Streamed message for client {client_id}")
+        return
+    
+    # Process message with LLM
+    metadata = {}
+    try:
+        response = await llm_service.process_message(
+            message_data.get("message", ""),
+            conversation_id,
+            use_cache=not message_data.get("bypass_cache", False),
+            user_id=message_data.get("user_id", client_id),
+            priority=PRIORITY_INTERACTIVE,
+            deadline=deadline,
+            provider=message_data.get("provider"),
+            model=message_data.get("model_name"),
+            metadata=metadata,
+            trace=trace
+        )
+    except OverloadedError as e:
+        await connection_manager.send_personal_message(
+            json.dumps(overloaded_frame(e, conversation_id)), client_id
+        )
+        return
+    except DeadlineExceededError as e:
+        await connection_manager.send_personal_message(
+            json.dumps(deadline_frame(e, conversation_id)), client_id
+        )
+        return
+    except (UnknownModelError, ModelUnavailableError) as e:
+        await connection_manager.send_personal_message(
+            json.dumps(model_error_frame(e, conversation_id)), client_id
+        )
+        return
+    
+    # Send response back to client
+    response_data = {
+        "response": response,
+        "timestamp": datetime.now().isoformat(),
+        "conversation_id": conversation_id,
+        "metadata": metadata
+    }
+    
+    await connection_manager.send_personal_message(
+        json.dumps(response_data), client_id
+    )
+    
+    logger.info(f"Processed message for client {client_id}")
+
+async def stream_to_websocket(message: str, conversation_id: str, client_id: str, use_cache: bool = True,
+                              user_id: str = None, deadline: float = None, provider: str = None,
+                              model_name: str = None, trace: Trace = None):
+    """Send incremental token frames for one message over a WebSocket"""
+    try:
+        async for event in llm_service.stream_message(
+            message,
+            conversation_id,
+            use_cache=use_cache,
+            user_id=user_id,
+            priority=PRIORITY_INTERACTIVE,
+            deadline=deadline,
+            provider=provider,
+            model=model_name,
+            trace=trace
+        ):
+            if event["type"] == "done":
+                event["conversation_id"] = conversation_id
+                event["timestamp"] = datetime.now().isoformat()
+            await connection_manager.send_personal_message(json.dumps(event), client_id)
+    except OverloadedError as e:
+        await connection_manager.send_personal_message(json.dumps(overloaded_frame(e, conversation_id)), client_id)
+    except DeadlineExceededError as e:
+        await connection_manager.send_personal_message(json.dumps(deadline_frame(e, conversation_id)), client_id)
+    except (UnknownModelError, ModelUnavailableError) as e:
+        await connection_manager.send_personal_message(json.dumps(model_error_frame(e, conversation_id)), client_id)
+    except Exception as e:
+        logger.error(f"Error streaming message for client {client_id}: {e}")
+        error_data = {
+            "type": "error",
+            "error": f"Error processing message: {str(e)}",
+            "timestamp": datetime.now().isoformat(),
+            "conversation_id": conversation_id
+        }
+        await connection_manager.send_personal_message(json.dumps(error_data), client_id)
+
+def overloaded_frame(error: OverloadedError, conversation_id: str) -> dict:
+    """WebSocket equivalent of a 429 response"""
+    return {
+        "type": "error",
+        "error": str(error),
+        "status": 429,
+        "retry_after": error.retry_after,
+        "timestamp": datetime.now().isoformat(),
+        "conversation_id": conversation_id
+    }
+
+def deadline_frame(error: DeadlineExceededError, conversation_id: str) -> dict:
+    """WebSocket equivalent of a 504 response"""
+    return {
+        "type": "error",
+        "error": str(error),
+        "status": 504,
+        "timestamp": datetime.now().isoformat(),
+        "conversation_id": conversation_id
+    }
+
+def model_error_frame(error: Exception, conversation_id: str) -> dict:
+    """WebSocket equivalent of a 400 (unknown model) or 503 (model failed to load) response"""
+    return {
+        "type": "error",
+        "error": str(error),
+        "status": 400 if isinstance(error, UnknownModelError) else 503,
+        "timestamp": datetime.now().isoformat(),
+        "conversation_id": conversation_id
+    }
 
 @app.get("/stats")
 async def get_stats():
@@ -221,6 +704,7 @@ async def get_stats():
         "llm_service": {
             "messages_processed": llm_service.get_message_count(),
             "average_response_time": llm_service.get_average_response_time(),
+            "average_time_to_first_token": llm_service.get_average_time_to_first_token(),
             "model_loaded": await llm_service.is_model_loaded(),
             "uptime_seconds": llm_service.get_uptime()
         },
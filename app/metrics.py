@@ -0,0 +1,347 @@
+import logging
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from prometheus_client import CollectorRegistry, ProcessCollector
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+from prometheus_client.utils import floatToGoString
+
+from .jobs import JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED
+from .resilience import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
+from .stats import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Requests that matched no route share one label so unknown paths cannot inflate cardinality
+UNMATCHED_ENDPOINT = "unmatched"
+
+
+class HTTPMetrics:
+    """
+    Request counts and latency per route. Recording is plain dict and list updates;
+    nothing is formatted until a scrape, so the per-request cost stays in the microseconds.
+    """
+
+    def __init__(self):
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.durations: Dict[Tuple[str, str], Histogram] = {}
+        self.in_flight = 0
+        self._route_paths: Dict[Callable, str] = {}
+
+    def endpoint_label(self, scope: dict) -> str:
+        """Route template (e.g. "/jobs/{job_id}") rather than the raw path"""
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ENDPOINT
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            app = scope.get("app")
+            for route in getattr(app, "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            else:
+                path = getattr(endpoint, "__name__", UNMATCHED_ENDPOINT)
+            self._route_paths[endpoint] = path
+        return path
+
+    def observe(self, method: str, endpoint: str, status: int, duration: float):
+        key = (method, endpoint, str(status))
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.durations.get((method, endpoint))
+        if histogram is None:
+            histogram = self.durations[(method, endpoint)] = Histogram()
+        histogram.observe(duration)
+
+
+class HTTPMetricsMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request until its response body is complete,
+    so streamed responses are measured end to end. WebSocket traffic passes through.
+    """
+
+    def __init__(self, app, metrics: HTTPMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics = self.metrics
+        metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.in_flight -= 1
+            metrics.observe(scope["method"], metrics.endpoint_label(scope), status, time.perf_counter() - start)
+
+
+def _histogram_family(name: str, documentation: str, labels: list, histograms) -> HistogramMetricFamily:
+    """Export (label values, Histogram) pairs as one Prometheus histogram family"""
+    family = HistogramMetricFamily(name, documentation, labels=labels)
+    for label_values, histogram in histograms:
+        family.add_metric(
+            list(label_values),
+            [(floatToGoString(bound), count) for bound, count in histogram.cumulative_buckets()],
+            histogram.sum
+        )
+    return family
+
+
+def _model_labels(key: str) -> Tuple[str, str]:
+    """Split a "provider:model" registry key; the model part may contain colons"""
+    provider, _, model = key.partition(":")
+    return provider, model
+
+
+class ServiceCollector:
+    """
+    Builds Prometheus metric families from the service's own counters and histograms at
+    scrape time, so the request path never touches prometheus_client.
+    """
+
+    def __init__(self, llm_service, http_metrics: HTTPMetrics, active_connections: Callable[[], int],
+                 job_stats: Optional[Callable[[], dict]] = None):
+        self.llm_service = llm_service
+        self.http_metrics = http_metrics
+        self.active_connections = active_connections
+        self.job_stats = job_stats
+
+    def collect(self):
+        http = self.http_metrics
+        requests = CounterMetricFamily(
+            "http_requests", "HTTP requests by method, route and status",
+            labels=["method", "endpoint", "status"]
+        )
+        for labels, count in list(http.requests.items()):
+            requests.add_metric(list(labels), count)
+        yield requests
+        yield _histogram_family(
+            "http_request_duration_seconds", "HTTP request duration until the response completes",
+            ["method", "endpoint"], list(http.durations.items())
+        )
+        yield GaugeMetricFamily("http_requests_in_flight", "HTTP requests being served", value=http.in_flight)
+        yield GaugeMetricFamily(
+            "websocket_connections", "Open WebSocket connections", value=self.active_connections()
+        )
+
+        service = self.llm_service
+        for name, documentation, family in (
+            ("llm_response_time_seconds", "Chat response time per model", service.model_response_time),
+            ("llm_time_to_first_token_seconds", "Streamed time to first token per model",
+             service.model_time_to_first_token),
+            ("llm_tokens_per_second", "Decode rate per model, as reported upstream or timed from the stream",
+             service.model_tokens_per_second),
+        ):
+            yield _histogram_family(
+                name, documentation, ["provider", "model"],
+                [(_model_labels(key), histogram) for key, histogram in list(family.items())]
+            )
+        yield _histogram_family(
+            "llm_generation_stage_seconds", "Upstream-reported model load, prefill and decode time per model",
+            ["provider", "model", "stage"],
+            [((*_model_labels(key), stage), histogram)
+             for stage, family in service.model_stage_times.items() for key, histogram in list(family.items())]
+        )
+        yield _histogram_family(
+            "llm_prefill_seconds", "Ollama prompt evaluation time by prompt mode", ["mode"],
+            [((mode,), histogram) for mode, histogram in service.prefill_histograms.items()]
+        )
+
+        admission = service.admission.get_stats()
+        queued = GaugeMetricFamily(
+            "llm_admission_queue_depth", "Requests waiting for a model slot", labels=["model", "priority"]
+        )
+        active = GaugeMetricFamily(
+            "llm_admission_in_flight", "Requests holding a model slot", labels=["model"]
+        )
+        for model, limiter in admission["models"].items():
+            active.add_metric([model], limiter["active"])
+            for priority, depth in limiter["queued"].items():
+                queued.add_metric([model, priority], depth)
+        yield queued
+        yield active
+        rejected = CounterMetricFamily(
+            "llm_admission_rejected", "Requests rejected by admission control", labels=["priority"]
+        )
+        for priority, count in admission["rejected"].items():
+            rejected.add_metric([priority], count)
+        yield rejected
+        yield _histogram_family(
+            "llm_admission_wait_seconds", "Time spent waiting for a model slot", ["priority"],
+            [((priority,), histogram) for priority, histogram in list(service.admission.wait_histograms.items())]
+        )
+
+        cancelled = CounterMetricFamily(
+            "llm_cancelled_requests", "Requests stopped early by reason", labels=["reason"]
+        )
+        for reason, count in service.cancelled_requests.items():
+            cancelled.add_metric([reason], count)
+        yield cancelled
+
+        breakers = GaugeMetricFamily(
+            "llm_circuit_breaker_state", "Circuit breaker state per provider (1 for the current state)",
+            labels=["provider", "state"]
+        )
+        for provider, breaker in list(service.breakers.items()):
+            for state in (STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN):
+                breakers.add_metric([provider, state], 1 if breaker.state == state else 0)
+        yield breakers
+
+        yield from self._upstream_families(service.get_pool_stats())
+        yield from self._coalescing_families(service.get_coalescing_stats())
+        yield from self._cache_families(service.get_cache_stats(), service.get_semantic_cache_stats())
+        yield from self._conversation_store_families(service.get_conversation_store_stats())
+        if service.hf_batcher is not None:
+            yield from self._batching_families(service.hf_batcher)
+        if self.job_stats is not None:
+            yield from self._job_families(self.job_stats())
+
+    def _upstream_families(self, pools: dict):
+        """Connection pool usage per upstream endpoint, and routing state for balanced pools"""
+        labels = ["upstream", "endpoint"]
+        connections = GaugeMetricFamily(
+            "llm_upstream_connections", "Upstream HTTP connections by state", labels=labels + ["state"]
+        )
+        pool_waits = CounterMetricFamily(
+            "llm_upstream_pool_waits", "Requests that found every pooled connection busy", labels=labels
+        )
+        upstream_requests = CounterMetricFamily("llm_upstream_requests", "Upstream HTTP requests", labels=labels)
+        upstream_errors = CounterMetricFamily("llm_upstream_errors", "Failed upstream HTTP requests", labels=labels)
+        outstanding = GaugeMetricFamily(
+            "llm_upstream_outstanding_requests", "Requests outstanding per balanced endpoint", labels=labels
+        )
+        latency = GaugeMetricFamily(
+            "llm_upstream_ewma_latency_seconds", "Smoothed latency per balanced endpoint", labels=labels
+        )
+        ejected = GaugeMetricFamily(
+            "llm_upstream_ejected", "1 while a balanced endpoint is ejected for failures", labels=labels
+        )
+        ejections = CounterMetricFamily(
+            "llm_upstream_ejections", "Times a balanced endpoint was ejected", labels=labels
+        )
+        for upstream, stats in pools.items():
+            endpoints = stats.get("endpoints", [stats])
+            for endpoint in endpoints:
+                label_values = [upstream, endpoint["base_url"]]
+                connections.add_metric(label_values + ["in_use"], endpoint["in_use"])
+                connections.add_metric(label_values + ["idle"], endpoint["idle_connections"])
+                connections.add_metric(label_values + ["open"], endpoint["open_connections"])
+                pool_waits.add_metric(label_values, endpoint["pool_waits"])
+                upstream_requests.add_metric(label_values, endpoint["requests_total"])
+                upstream_errors.add_metric(label_values, endpoint["errors_total"])
+                if "outstanding" in endpoint:
+                    outstanding.add_metric(label_values, endpoint["outstanding"])
+                    latency.add_metric(label_values, endpoint["ewma_latency_seconds"])
+                    ejected.add_metric(label_values, 0 if endpoint["healthy"] else 1)
+                    ejections.add_metric(label_values, endpoint["ejections"])
+        yield from (connections, pool_waits, upstream_requests, upstream_errors, outstanding, latency, ejected,
+                    ejections)
+
+    def _coalescing_families(self, stats: dict):
+        requests = CounterMetricFamily(
+            "llm_coalescing_requests", "Generations entering single-flight coalescing", labels=["kind"]
+        )
+        coalesced = CounterMetricFamily(
+            "llm_coalesced_requests", "Requests served by another request's upstream call or stream",
+            labels=["kind"]
+        )
+        in_flight = GaugeMetricFamily(
+            "llm_coalescing_in_flight", "Shared upstream calls and streams in progress", labels=["kind"]
+        )
+        for kind in ("calls", "streams"):
+            requests.add_metric([kind], stats[f"{kind}_total"])
+            coalesced.add_metric([kind], stats[f"{kind}_coalesced"])
+            in_flight.add_metric([kind], stats[f"in_flight_{kind}"])
+        yield from (requests, coalesced, in_flight)
+
+    def _cache_families(self, exact: Optional[dict], semantic: Optional[dict]):
+        """Exact-match and similarity response caches; a disabled cache exports nothing"""
+        lookups = CounterMetricFamily(
+            "llm_cache_lookups", "Response cache lookups by cache and result", labels=["cache", "result"]
+        )
+        evictions = CounterMetricFamily("llm_cache_evictions", "Response cache evictions", labels=["cache"])
+        entries = GaugeMetricFamily("llm_cache_entries", "Responses held per cache", labels=["cache"])
+        for cache, stats in (("exact", exact), ("semantic", semantic)):
+            if stats is None:
+                continue
+            lookups.add_metric([cache, "hit"], stats["hits"])
+            lookups.add_metric([cache, "miss"], stats["misses"])
+            evictions.add_metric([cache], stats["evictions"])
+            entries.add_metric([cache], stats["entries"])
+        yield from (lookups, evictions, entries)
+        if exact is not None:
+            yield GaugeMetricFamily("llm_cache_bytes", "Memory held by the exact-match cache", value=exact["bytes"])
+            yield CounterMetricFamily(
+                "llm_cache_expirations", "Exact-match cache entries dropped after their TTL",
+                value=exact["expirations"]
+            )
+
+    def _conversation_store_families(self, stats: dict):
+        """Memory-store size and evictions; the Redis store only holds a local read cache"""
+        if stats["backend"] != "memory":
+            yield GaugeMetricFamily(
+                "llm_conversation_store_cached_conversations", "Conversations in the local read cache",
+                value=stats["local_cache_entries"]
+            )
+            yield CounterMetricFamily(
+                "llm_conversation_store_backend_errors", "Failed shared conversation store operations",
+                value=stats["backend_errors"]
+            )
+            return
+        yield GaugeMetricFamily(
+            "llm_conversation_store_conversations", "Conversations held in memory", value=stats["conversations"]
+        )
+        yield GaugeMetricFamily(
+            "llm_conversation_store_bytes", "Approximate memory held by conversation history", value=stats["bytes"]
+        )
+        evictions = CounterMetricFamily(
+            "llm_conversation_store_evictions", "Conversations evicted from memory", labels=["reason"]
+        )
+        evictions.add_metric(["lru"], stats["lru_evictions"])
+        evictions.add_metric(["idle"], stats["idle_evictions"])
+        yield evictions
+        yield CounterMetricFamily(
+            "llm_conversation_store_messages_dropped", "Oldest messages dropped from full conversations",
+            value=stats["messages_dropped"]
+        )
+
+    def _batching_families(self, batcher):
+        yield _histogram_family(
+            "llm_microbatch_size", "Requests per micro-batch sent upstream", [], [((), batcher.batch_size_histogram)]
+        )
+        yield _histogram_family(
+            "llm_microbatch_wait_seconds", "Time a request waited for its micro-batch to be sent", [],
+            [((), batcher.wait_histogram)]
+        )
+
+    def _job_families(self, stats: dict):
+        jobs = GaugeMetricFamily("llm_jobs", "Retained background jobs by status", labels=["status"])
+        for status in (JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED):
+            jobs.add_metric([status], stats[status])
+        yield jobs
+        outcomes = CounterMetricFamily(
+            "llm_job_outcomes", "Background job submissions by outcome", labels=["outcome"]
+        )
+        for outcome in ("submitted", "rejected", "succeeded", "failed", "expired"):
+            outcomes.add_metric([outcome], stats[f"{outcome}_total"])
+        yield outcomes
+
+
+def create_registry(collector: ServiceCollector) -> CollectorRegistry:
+    """Dedicated registry so tests and reloads never clash with the global default registry"""
+    registry = CollectorRegistry()
+    registry.register(collector)
+    ProcessCollector(registry=registry)
+    return registry
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Weights of a 4-bit quantized model (Ollama's default) plus runtime overhead, per parameter
+DEFAULT_BYTES_PER_PARAMETER = 0.6
+
+_PARAMETER_COUNT = re.compile(r"^\s*([\d.]+)\s*([BM])\s*$", re.IGNORECASE)
+
+# (resolved model name, display info, resident bytes or None when unknown)
+LoadModel = Callable[[str, str], Awaitable[Tuple[str, dict, Optional[int]]]]
+UnloadModel = Callable[[str, str], Awaitable[None]]
+
+
+def model_key(provider: str, model: str) -> str:
+    return f"{provider}:{model}"
+
+
+def estimate_model_bytes(size_label: Optional[str], bytes_per_parameter: float = DEFAULT_BYTES_PER_PARAMETER) -> int:
+    """Memory estimate from a parameter-count label such as "7B" or "350M"; 0 if it has none"""
+    match = _PARAMETER_COUNT.match(size_label or "")
+    if not match:
+        return 0
+    scale = 1e9 if match.group(2).upper() == "B" else 1e6
+    return int(float(match.group(1)) * scale * bytes_per_parameter)
+
+
+class LoadedModel:
+    """One model the registry keeps ready to serve"""
+
+    __slots__ = ("provider", "model", "info", "size_bytes", "loaded_at", "last_used", "requests")
+
+    def __init__(self, provider: str, model: str, info: dict, size_bytes: int):
+        self.provider = provider
+        self.model = model
+        self.info = info
+        self.size_bytes = size_bytes
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.requests = 0
+
+
+class UnknownModelError(ValueError):
+    """Raised for a provider or model the service does not offer"""
+
+
+class ModelUnavailableError(Exception):
+    """Raised when a requested model could not be loaded"""
+
+
+class ModelRegistry:
+    """
+    Keeps several models warm at once under a memory budget.
+    Models are loaded on first use and evicted least recently used first when the
+    budget is exceeded. Pinned models (the service default) and models with requests
+    in flight are never evicted. Concurrent requests for a cold model share one load.
+    Entries are keyed by resolved name ("phi:latest"); requested names ("phi") are aliases.
+    """
+
+    def __init__(self, load: LoadModel, unload: UnloadModel, memory_budget_bytes: int = 4 * 1024 ** 3,
+                 is_busy: Optional[Callable[[str], bool]] = None,
+                 bytes_per_parameter: float = DEFAULT_BYTES_PER_PARAMETER):
+        self.load = load
+        self.unload = unload
+        self.memory_budget_bytes = memory_budget_bytes
+        self.is_busy = is_busy or (lambda model: False)
+        self.bytes_per_parameter = bytes_per_parameter
+        self._models: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._aliases: Dict[str, str] = {}
+        self._pinned: set = set()
+
+        # Metrics
+        self.loads = 0
+        self.load_failures = 0
+        self.evictions = 0
+        self.hits = 0
+
+    @classmethod
+    def from_env(cls, load: LoadModel, unload: UnloadModel,
+                 is_busy: Optional[Callable[[str], bool]] = None) -> "ModelRegistry":
+        return cls(
+            load,
+            unload,
+            memory_budget_bytes=int(os.getenv("LLM_MODEL_MEMORY_BUDGET_BYTES", str(4 * 1024 ** 3))),
+            is_busy=is_busy,
+            bytes_per_parameter=float(os.getenv("LLM_MODEL_BYTES_PER_PARAMETER", str(DEFAULT_BYTES_PER_PARAMETER)))
+        )
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self._models.values())
+
+    def _resolve(self, key: str) -> str:
+        return self._aliases.get(key, key)
+
+    def get(self, provider: str, model: str) -> Optional[LoadedModel]:
+        return self._models.get(self._resolve(model_key(provider, model)))
+
+    def register(self, provider: str, model: str, info: dict, size_bytes: Optional[int] = None,
+                 pin: bool = False) -> LoadedModel:
+        """Record a model that is already loaded, e.g. the one chosen at startup or by a switch"""
+        key = model_key(provider, model)
+        entry = self._models.get(key)
+        if entry is None:
+            if size_bytes is None:
+                size_bytes = self._estimate(provider, info)
+            entry = self._models[key] = LoadedModel(provider, model, info, size_bytes)
+        self._models.move_to_end(key)
+        if pin:
+            self._pinned.add(key)
+        return entry
+
+    def unpin(self, provider: str, model: str):
+        self._pinned.discard(self._resolve(model_key(provider, model)))
+
+    async def ensure(self, provider: str, model: str, info: Optional[dict] = None) -> LoadedModel:
+        """
+        Return the loaded model, loading it (and evicting others) if needed.
+        info is the catalogue entry, if any, used to estimate the size before loading.
+        """
+        key = self._resolve(model_key(provider, model))
+        entry = self._models.get(key)
+        if entry is None:
+            loading = self._loading.get(key)
+            if loading is None:
+                loading = self._loading[key] = asyncio.ensure_future(self._load(provider, model, info or {}))
+                loading.add_done_callback(lambda done, key=key: self._loading.pop(key, None))
+            try:
+                entry = await asyncio.shield(loading)
+            except Exception as e:
+                raise ModelUnavailableError(f"Model {provider}:{model} could not be loaded: {e}") from e
+        else:
+            self.hits += 1
+        self._models.move_to_end(model_key(entry.provider, entry.model))
+        entry.last_used = time.time()
+        entry.requests += 1
+        return entry
+
+    async def _load(self, provider: str, model: str, info: dict) -> LoadedModel:
+        # Make room for the expected size first, so two large models are never resident at once
+        await self._evict_to_fit(self._estimate(provider, info, model))
+        try:
+            resolved, info, size_bytes = await self.load(provider, model)
+        except Exception:
+            self.load_failures += 1
+            raise
+        key = model_key(provider, resolved)
+        if resolved != model:
+            self._aliases[model_key(provider, model)] = key
+        entry = self._models.get(key)
+        if entry is not None:
+            # Already loaded under its resolved name
+            return entry
+        if size_bytes is None:
+            size_bytes = self._estimate(provider, info, resolved)
+        entry = self._models[key] = LoadedModel(provider, resolved, info, size_bytes)
+        self.loads += 1
+        logger.info(f"Loaded {key} ({size_bytes / 1024 ** 2:.0f} MiB)")
+        await self._evict_to_fit(0, keep=key)
+        return entry
+
+    def _estimate(self, provider: str, info: dict, model: Optional[str] = None) -> int:
+        """Models served by remote APIs take no local memory"""
+        if provider != "ollama":
+            return 0
+        size_bytes = estimate_model_bytes(info.get("size"), self.bytes_per_parameter)
+        if not size_bytes and model is not None:
+            # Without a sized catalogue entry, try a tag such as "deepseek-coder:6.7b"
+            size_bytes = estimate_model_bytes(model.partition(":")[2], self.bytes_per_parameter)
+        return size_bytes
+
+    async def _evict_to_fit(self, extra_bytes: int, keep: Optional[str] = None):
+        """Unload idle, unpinned models, least recently used first, until extra_bytes fit"""
+        for key in list(self._models):
+            if self.used_bytes + extra_bytes <= self.memory_budget_bytes:
+                return
+            entry = self._models.get(key)
+            if (entry is None or key == keep or key in self._pinned
+                    or entry.size_bytes == 0 or self.is_busy(entry.model)):
+                continue
+            del self._models[key]
+            for alias in [alias for alias, target in self._aliases.items() if target == key]:
+                del self._aliases[alias]
+            self.evictions += 1
+            logger.info(f"Evicting {key} to stay within the model memory budget")
+            try:
+                await self.unload(entry.provider, entry.model)
+            except Exception as e:
+                logger.warning(f"Failed to unload {key}: {e}")
+        if self.used_bytes + extra_bytes > self.memory_budget_bytes:
+            logger.warning(
+                f"Model memory budget exceeded: {self.used_bytes + extra_bytes} bytes needed, "
+                f"{self.memory_budget_bytes} allowed, remaining models are pinned or busy"
+            )
+
+    async def enforce_budget(self):
+        """Evict idle models that no longer fit, e.g. after a model was unpinned"""
+        await self._evict_to_fit(0)
+
+    def get_stats(self) -> dict:
+        return {
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "used_bytes": self.used_bytes,
+            "loaded": {
+                key: {
+                    "size_bytes": entry.size_bytes,
+                    "pinned": key in self._pinned,
+                    "requests": entry.requests,
+                    "idle_seconds": time.time() - entry.last_used,
+                }
+                for key, entry in self._models.items()
+            },
+            "loading": sorted(self._loading),
+            "loads": self.loads,
+            "load_failures": self.load_failures,
+            "evictions": self.evictions,
+            "hits": self.hits,
+        }
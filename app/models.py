@@ -8,6 +8,14 @@ class ChatMessage(BaseModel):
     conversation_id: Optional[str] = Field(None, description="Conversation identifier")
     user_id: Optional[str] = Field(None, description="User identifier")
     metadata: Optional[dict] = Field(None, description="Additional metadata")
+    bypass_cache: bool = Field(False, description="Skip the response cache for this request")
+    provider: Optional[str] = Field(None, description="Provider for this message; defaults to the current provider")
+    model_name: Optional[str] = Field(None, description="Model for this message; defaults to the current model")
+
+class ChatBatchRequest(BaseModel):
+    """Model for bulk chat requests"""
+    messages: List[ChatMessage] = Field(..., min_length=1, description="Messages to process")
+    max_concurrency: Optional[int] = Field(None, ge=1, description="Messages processed at once (capped by the server)")
 
 class ChatResponse(BaseModel):
     """Model for chat responses"""
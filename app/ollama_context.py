@@ -0,0 +1,32 @@
+import struct
+import zlib
+from array import array
+from typing import List, Optional, Sequence
+
+# Header: crc32 of the assistant reply the context ends with
+_HEADER = struct.Struct("<I")
+
+
+def anchor_checksum(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def pack_context(anchor: str, tokens: Sequence[int]) -> bytes:
+    """
+    Pack an Ollama context token array as compact int32s.
+    The anchor is the assistant reply the context ends with; it lets the next
+    turn check that the stored context still matches the visible history.
+    """
+    return _HEADER.pack(anchor_checksum(anchor)) + array("i", tokens).tobytes()
+
+
+def unpack_context(data: Optional[bytes], anchor: str) -> Optional[List[int]]:
+    """Return the token array if it was produced for this anchor, else None"""
+    if not data or len(data) < _HEADER.size:
+        return None
+    (checksum,) = _HEADER.unpack_from(data)
+    if checksum != anchor_checksum(anchor):
+        return None
+    tokens = array("i")
+    tokens.frombytes(data[_HEADER.size:])
+    return tokens.tolist()
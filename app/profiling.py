@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileInProgressError(Exception):
+    """Raised when a profile is requested while another one is running"""
+
+
+def collapse_stack(frame, max_depth: int = 128) -> str:
+    """One stack in collapsed (flamegraph.pl / speedscope) form, outermost frame first"""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+class ProfileResult:
+    """Stack sample counts from one profiling run"""
+
+    __slots__ = ("stacks", "samples", "duration", "sampling_seconds")
+
+    def __init__(self):
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self.sampling_seconds = 0.0
+
+    @property
+    def overhead(self) -> float:
+        """Share of wall time the sampler held the GIL, i.e. time taken from the event loop"""
+        return self.sampling_seconds / self.duration if self.duration else 0.0
+
+    def collapsed(self) -> str:
+        """"frame;frame;frame count" lines, most frequent first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """
+    On-demand profiling of the running process, one run at a time.
+
+    CPU: a background thread wakes every interval seconds, reads the event loop thread's
+    current frame via sys._current_frames() and counts the collapsed stack. Nothing is
+    installed on the profiled thread, so the cost is only the sampler's own stack walks
+    (reported as overhead); an idle loop shows up as time in the selector.
+
+    Memory: tracemalloc snapshots before and after a window, compared by line. tracemalloc
+    slows every allocation while it traces, so it is only enabled for the window (unless
+    it was already tracing) and windows are capped at max_seconds like CPU profiles.
+    """
+
+    def __init__(self, interval: float = 0.005, max_seconds: float = 60.0, max_depth: int = 128):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.max_depth = max_depth
+        self._lock = asyncio.Lock()
+
+        # Metrics
+        self.profiles = 0
+        self.memory_profiles = 0
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        return cls(
+            interval=float(os.getenv("LLM_PROFILE_INTERVAL_MS", "5")) / 1000.0,
+            max_seconds=float(os.getenv("LLM_PROFILE_MAX_SECONDS", "60"))
+        )
+
+    def _window(self, seconds: float) -> float:
+        return max(0.0, min(seconds, self.max_seconds))
+
+    async def profile(self, seconds: float, all_threads: bool = False) -> ProfileResult:
+        """Sample the event loop thread (or every thread) for seconds, capped at max_seconds"""
+        if self._lock.locked():
+            raise ProfileInProgressError("A profile is already running")
+        async with self._lock:
+            seconds = self._window(seconds)
+            result = ProfileResult()
+            stop = threading.Event()
+            target = None if all_threads else threading.get_ident()
+            sampler = threading.Thread(
+                target=self._sample, args=(result, stop, target), name="profiler-sampler", daemon=True
+            )
+            logger.info(f"Profiling {'all threads' if all_threads else 'event loop'} for {seconds:.1f}s")
+            start = time.perf_counter()
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.get_running_loop().run_in_executor(None, sampler.join)
+                result.duration = time.perf_counter() - start
+            self.profiles += 1
+            logger.info(
+                f"Profile done: {result.samples} samples, {len(result.stacks)} stacks, "
+                f"overhead {result.overhead:.2%}"
+            )
+            return result
+
+    def _sample(self, result: ProfileResult, stop: threading.Event, target: Optional[int]):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        # Event.wait releases the GIL, so the profiled thread runs freely between samples
+        while not stop.wait(self.interval):
+            started = time.perf_counter()
+            frames = sys._current_frames()
+            if target is not None:
+                frame = frames.get(target)
+                if frame is not None:
+                    result.stacks[collapse_stack(frame, self.max_depth)] += 1
+            else:
+                for ident, frame in frames.items():
+                    if ident != own:
+                        thread = names.get(ident) or f"thread-{ident}"
+                        result.stacks[f"{thread};{collapse_stack(frame, self.max_depth)}"] += 1
+            result.samples += 1
+            result.sampling_seconds += time.perf_counter() - started
+
+    async def memory_diff(self, seconds: float, limit: int = 25, frames: int = 1) -> str:
+        """Top allocation growth by source line over a window of seconds, as text"""
+        if self._lock.locked():
+            raise ProfileInProgressError("A profile is already running")
+        async with self._lock:
+            seconds = self._window(seconds)
+            frames = min(max(1, frames), 32)
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(frames)
+            try:
+                before = tracemalloc.take_snapshot()
+                await asyncio.sleep(seconds)
+                after = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
+            self.memory_profiles += 1
+
+            ignore = (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+            key_type = "traceback" if frames > 1 else "lineno"
+            stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), key_type)
+            growth = sum(stat.size_diff for stat in stats)
+            lines = [
+                f"# {growth / 1024:+.1f} KiB allocated and still live over {seconds:.1f}s; "
+                f"traced {current / 1024:.1f} KiB (peak {peak / 1024:.1f} KiB)"
+            ]
+            for stat in stats[:limit]:
+                lines.append(str(stat))
+                if frames > 1:
+                    lines.extend(f"    {line}" for line in stat.traceback.format())
+            return "\n".join(lines) + "\n"
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self._lock.locked(),
+            "interval_ms": self.interval * 1000,
+            "max_seconds": self.max_seconds,
+            "profiles": self.profiles,
+            "memory_profiles": self.memory_profiles,
+        }
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+from typing import Any, List, Sequence
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class RedisError(Exception):
+    """Error reply or protocol failure from a Redis-compatible server"""
+
+
+def _encode_command(args: Sequence[Any]) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        else:
+            data = str(arg).encode("utf-8")
+        parts.append(f"${len(data)}\r\n".encode())
+        parts.append(data)
+        parts.append(b"\r\n")
+    return b"".join(parts)
+
+
+async def _read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readline()
+    if not line:
+        raise RedisError("Connection closed by server")
+    prefix, payload = line[:1], line[1:-2]
+    if prefix == b"+":
+        return payload.decode("utf-8")
+    if prefix == b"-":
+        # Error replies are returned, not raised, so one bad command does not
+        # desynchronize the rest of a pipeline
+        return RedisError(payload.decode("utf-8"))
+    if prefix == b":":
+        return int(payload)
+    if prefix == b"$":
+        length = int(payload)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if prefix == b"*":
+        count = int(payload)
+        if count == -1:
+            return None
+        return [await _read_reply(reader) for _ in range(count)]
+    raise RedisError(f"Unexpected reply prefix: {line!r}")
+
+
+class _Connection:
+    __slots__ = ("reader", "writer")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def execute_many(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        self.writer.write(b"".join(_encode_command(command) for command in commands))
+        await self.writer.drain()
+        return [await _read_reply(self.reader) for _ in commands]
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisClient:
+    """
+    Minimal asyncio client for the Redis protocol (RESP2) with a small
+    connection pool. Commands sent together via pipeline() share one round trip.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", pool_size: int = 4,
+                 timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle: "asyncio.LifoQueue[_Connection]" = asyncio.LifoQueue()
+        self._open = 0
+        self._slot_freed = asyncio.Condition()
+
+        # Metrics
+        self.round_trips = 0
+        self.commands_sent = 0
+        self.errors = 0
+
+    async def _connect(self) -> _Connection:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        connection = _Connection(reader, writer)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            try:
+                replies = await connection.execute_many(setup)
+            except BaseException:
+                connection.close()
+                raise
+            for reply in replies:
+                if isinstance(reply, RedisError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    async def _acquire(self) -> _Connection:
+        while True:
+            if not self._idle.empty():
+                return self._idle.get_nowait()
+            if self._open < self.pool_size:
+                self._open += 1
+                try:
+                    return await self._connect()
+                except BaseException:
+                    # Including cancellation, or the slot would be lost for good
+                    self._open -= 1
+                    raise
+            async with self._slot_freed:
+                await self._slot_freed.wait()
+
+    async def _release(self, connection: _Connection, broken: bool):
+        if broken:
+            connection.close()
+            self._open -= 1
+        else:
+            self._idle.put_nowait(connection)
+        async with self._slot_freed:
+            self._slot_freed.notify()
+
+    async def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        """Send several commands in one round trip and return their replies in order"""
+        connection = await self._acquire()
+        # Broken unless every reply was read: an error, timeout or cancellation (client
+        # disconnect, request deadline) can leave replies unread on the connection, and
+        # the next caller would read them as its own
+        broken = True
+        try:
+            replies = await asyncio.wait_for(connection.execute_many(commands), self.timeout)
+            broken = False
+            self.round_trips += 1
+            self.commands_sent += len(commands)
+            return replies
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            await self._release(connection, broken)
+
+    async def execute(self, *args: Any) -> Any:
+        reply = (await self.pipeline([args]))[0]
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    async def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+            self._open -= 1
+
+    def get_stats(self) -> dict:
+        return {
+            "host": f"{self.host}:{self.port}",
+            "open_connections": self._open,
+            "round_trips": self.round_trips,
+            "commands_sent": self.commands_sent,
+            "errors": self.errors,
+        }
@@ -0,0 +1,126 @@
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when every provider in the chain is short-circuited"""
+
+
+def parse_provider_chain(spec: Optional[str]) -> List[Tuple[str, Optional[str]]]:
+    """
+    Parse "provider[:model],..." e.g. "ollama,huggingface:gpt2,mock".
+    Only the first colon separates provider and model, so "ollama:phi:latest" works.
+    """
+    chain = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        provider, _, model = item.partition(":")
+        chain.append((provider, model or None))
+    return chain
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of the last window_size calls to one upstream.
+    Opens when the failure rate or the slow-call rate crosses its threshold
+    (after at least min_calls), rejects calls for open_seconds, then lets a
+    single trial call through: success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, name: str, window_size: int = 20, min_calls: int = 10,
+                 failure_rate_threshold: float = 0.5, slow_call_seconds: float = 60.0,
+                 slow_call_rate_threshold: float = 0.8, open_seconds: float = 30.0):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.state = STATE_CLOSED
+        self.opened_at = 0.0
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)  # (failed, slow)
+        self._trial_in_flight = False
+
+        # Metrics
+        self.trips = 0
+        self.short_circuited = 0
+
+    @classmethod
+    def from_env(cls, name: str) -> "CircuitBreaker":
+        return cls(
+            name,
+            window_size=int(os.getenv("LLM_BREAKER_WINDOW", "20")),
+            min_calls=int(os.getenv("LLM_BREAKER_MIN_CALLS", "10")),
+            failure_rate_threshold=float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5")),
+            slow_call_seconds=float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "60")),
+            slow_call_rate_threshold=float(os.getenv("LLM_BREAKER_SLOW_CALL_RATE", "0.8")),
+            open_seconds=float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+        )
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; every allowed call must be recorded or released"""
+        if self.state == STATE_OPEN:
+            if time.time() - self.opened_at < self.open_seconds:
+                self.short_circuited += 1
+                return False
+            self.state = STATE_HALF_OPEN
+        if self.state == STATE_HALF_OPEN:
+            if self._trial_in_flight:
+                self.short_circuited += 1
+                return False
+            self._trial_in_flight = True
+        return True
+
+    def record(self, failed: bool, duration: float):
+        slow = duration >= self.slow_call_seconds
+        if self.state == STATE_HALF_OPEN:
+            self._trial_in_flight = False
+            if failed or slow:
+                self._open()
+            else:
+                logger.info(f"Circuit for {self.name} closed after a successful trial call")
+                self.state = STATE_CLOSED
+                self._outcomes.clear()
+            return
+
+        self._outcomes.append((failed, slow))
+        if len(self._outcomes) < self.min_calls:
+            return
+        failures = sum(1 for failed_call, _ in self._outcomes if failed_call)
+        slow_calls = sum(1 for _, slow_call in self._outcomes if slow_call)
+        if (failures / len(self._outcomes) >= self.failure_rate_threshold
+                or slow_calls / len(self._outcomes) >= self.slow_call_rate_threshold):
+            self._open()
+
+    def release(self):
+        """Give back an allowed call that never reached the upstream"""
+        self._trial_in_flight = False
+
+    def _open(self):
+        logger.warning(f"Circuit for {self.name} opened for {self.open_seconds:.0f}s")
+        self.state = STATE_OPEN
+        self.opened_at = time.time()
+        self._outcomes.clear()
+        self._trial_in_flight = False
+        self.trips += 1
+
+    def get_stats(self) -> dict:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": sum(1 for failed, _ in self._outcomes if failed),
+            "recent_slow_calls": sum(1 for _, slow in self._outcomes if slow),
+            "trips": self.trips,
+            "short_circuited": self.short_circuited,
+        }
@@ -0,0 +1,100 @@
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost (entry object, OrderedDict node, key string header)
+ENTRY_OVERHEAD_BYTES = 200
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a prompt so trivially different spellings share a cache entry"""
+    return _WHITESPACE.sub(" ", message.strip().lower())
+
+
+class _CacheEntry:
+    __slots__ = ("value", "expires_at", "size")
+
+    def __init__(self, value: str, expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class ResponseCache:
+    """
+    In-memory response cache with per-entry TTL and LRU eviction under a byte budget.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 600.0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self.current_bytes = 0
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, or None on a miss or expired entry"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def set(self, key: str, value: str, ttl_seconds: Optional[float] = None):
+        """Store a response, evicting least recently used entries to stay within budget"""
+        size = len(key) + len(value.encode("utf-8")) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            logger.debug(f"Response of {size} bytes exceeds cache budget, not caching")
+            return
+        if key in self._entries:
+            self._remove(key)
+
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = _CacheEntry(value, time.monotonic() + ttl, size)
+        self.current_bytes += size
+
+        while self.current_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry.size
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
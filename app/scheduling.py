@@ -0,0 +1,121 @@
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = "interactive"  # WebSocket chat
+PRIORITY_BULK = "bulk"                # REST requests
+PRIORITY_BACKGROUND = "background"    # Asynchronous jobs
+
+DEFAULT_CLASS_WEIGHTS = {PRIORITY_INTERACTIVE: 8.0, PRIORITY_BULK: 1.0, PRIORITY_BACKGROUND: 0.5}
+
+
+def parse_weights(spec: Optional[str]) -> Dict[str, float]:
+    """Parse "name=weight,name=weight" into a dict"""
+    weights = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, weight = item.split("=", 1)
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+class _Flow:
+    """Queued items of one user within a priority class"""
+
+    __slots__ = ("items", "pass_value", "stride")
+
+    def __init__(self, stride: float):
+        self.items: Deque[Any] = deque()
+        self.pass_value = 0.0
+        self.stride = stride
+
+
+class _PriorityClass:
+    __slots__ = ("flows", "pass_value", "stride", "size")
+
+    def __init__(self, stride: float):
+        self.flows: Dict[Optional[str], _Flow] = {}
+        self.pass_value = 0.0
+        self.stride = stride
+        self.size = 0
+
+
+class FairQueue:
+    """
+    Two-level weighted fair queue using stride scheduling.
+    Priority classes share service in proportion to their weights, and within a
+    class each user gets service in proportion to their weight (1 by default),
+    so one heavy client cannot starve the others.
+    """
+
+    def __init__(self, class_weights: Optional[Dict[str, float]] = None,
+                 user_weights: Optional[Dict[str, float]] = None):
+        self.class_weights = dict(class_weights or DEFAULT_CLASS_WEIGHTS)
+        self.user_weights = dict(user_weights or {})
+        self._classes: Dict[str, _PriorityClass] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def class_size(self, priority: str) -> int:
+        priority_class = self._classes.get(priority)
+        return priority_class.size if priority_class else 0
+
+    def push(self, item: Any, priority: str, user_id: Optional[str] = None):
+        priority_class = self._classes.get(priority)
+        if priority_class is None:
+            weight = self.class_weights.get(priority, 1.0)
+            priority_class = self._classes[priority] = _PriorityClass(1.0 / weight)
+        if priority_class.size == 0:
+            # A class returning from idle starts level with the busy ones, with neither credit nor debt
+            priority_class.pass_value = min(
+                (c.pass_value for c in self._classes.values() if c.size), default=0.0
+            )
+
+        flow = priority_class.flows.get(user_id)
+        if flow is None:
+            weight = self.user_weights.get(user_id, 1.0) if user_id else 1.0
+            flow = priority_class.flows[user_id] = _Flow(1.0 / weight)
+            flow.pass_value = min((f.pass_value for f in priority_class.flows.values() if f.items), default=0.0)
+
+        flow.items.append(item)
+        priority_class.size += 1
+        self._size += 1
+
+    def pop(self) -> Optional[Tuple[Any, str]]:
+        """Remove and return (item, priority) with the smallest virtual finish time"""
+        if not self._size:
+            return None
+        priority, priority_class = min(
+            ((name, c) for name, c in self._classes.items() if c.size),
+            key=lambda entry: entry[1].pass_value + entry[1].stride
+        )
+        user_id, flow = min(
+            ((user, f) for user, f in priority_class.flows.items() if f.items),
+            key=lambda entry: entry[1].pass_value + entry[1].stride
+        )
+        item = flow.items.popleft()
+        flow.pass_value += flow.stride
+        priority_class.pass_value += priority_class.stride
+        if not flow.items:
+            del priority_class.flows[user_id]
+        priority_class.size -= 1
+        self._size -= 1
+        return item, priority
+
+    def remove(self, item: Any, priority: str, user_id: Optional[str] = None) -> bool:
+        """Drop a queued item (e.g. a waiter that gave up)"""
+        priority_class = self._classes.get(priority)
+        flow = priority_class.flows.get(user_id) if priority_class else None
+        if flow is None or item not in flow.items:
+            return False
+        flow.items.remove(item)
+        if not flow.items:
+            del priority_class.flows[user_id]
+        priority_class.size -= 1
+        self._size -= 1
+        return True
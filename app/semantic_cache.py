@@ -0,0 +1,171 @@
+import logging
+import re
+import time
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .response_cache import normalize_message
+
+logger = logging.getLogger(__name__)
+
+# Question framing that carries no topic, so "What is X?" and "Explain X" embed alike
+STOP_WORDS = frozenset((
+    "a", "an", "the", "is", "are", "was", "be", "what", "whats", "explain", "describe",
+    "tell", "me", "about", "please", "can", "could", "would", "you", "how", "does", "do",
+    "of", "in", "to", "for", "and", "concept", "define", "definition", "meaning", "i",
+))
+
+_NON_WORD = re.compile(r"[^\w\s-]")
+
+
+class HashedNgramVectorizer:
+    """
+    Offline text embedder: hashed character n-grams plus word unigrams,
+    L2-normalized so that a dot product is cosine similarity.
+    """
+
+    def __init__(self, dim: int = 1024, ngram_sizes: Tuple[int, ...] = (3, 4, 5)):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+
+    def _features(self, text: str) -> List[str]:
+        words = [word for word in _NON_WORD.sub("", normalize_message(text)).split() if word not in STOP_WORDS]
+        if not words:
+            # Nothing but framing words: fall back to the full text
+            words = normalize_message(text).split()
+        normalized = " ".join(words)
+        features = list(words)
+        padded = f" {normalized} "
+        for size in self.ngram_sizes:
+            features.extend(padded[i:i + size] for i in range(len(padded) - size + 1))
+        return features
+
+    async def embed(self, text: str) -> np.ndarray:
+        return self.vectorize(text)
+
+    def vectorize(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            # crc32 is stable across processes, unlike the salted built-in hash()
+            bucket = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if bucket & 0x80000000 else -1.0
+            vector[bucket % self.dim] += sign
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+class OllamaEmbedder:
+    """Text embedder backed by Ollama's /api/embeddings endpoint"""
+
+    def __init__(self, client, model: str):
+        self.client = client
+        self.model = model
+
+    async def embed(self, text: str) -> np.ndarray:
+        response = await self.client.post(
+            "/api/embeddings",
+            json={"model": self.model, "prompt": text},
+            timeout=30.0
+        )
+        if response.status_code != 200:
+            raise Exception(f"Ollama embeddings error: {response.status_code}")
+        vector = np.asarray(response.json()["embedding"], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+class SemanticCache:
+    """
+    Similarity cache over a fixed-capacity NumPy matrix of prompt embeddings.
+    A lookup is one matrix-vector product against every stored prompt; the
+    least recently used row is overwritten once the matrix is full.
+    """
+
+    def __init__(self, dim: int, capacity: int = 2048, threshold: float = 0.9,
+                 ttl_seconds: float = 600.0):
+        self.dim = dim
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._scopes = np.full(capacity, -1, dtype=np.int64)
+        self._expires_at = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._responses: List[Optional[str]] = [None] * capacity
+        self._scope_ids = {}
+        self.size = 0
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.inserts = 0
+        self.evictions = 0
+
+    def _scope_id(self, scope: str) -> int:
+        if scope not in self._scope_ids:
+            self._scope_ids[scope] = len(self._scope_ids)
+        return self._scope_ids[scope]
+
+    def lookup(self, vector: np.ndarray, scope: str) -> Optional[Tuple[str, float]]:
+        """Return (response, similarity) for the closest prompt above the threshold"""
+        if self.size == 0 or scope not in self._scope_ids:
+            self.misses += 1
+            return None
+
+        now = time.monotonic()
+        scores = self._vectors[:self.size] @ vector
+        valid = (self._scopes[:self.size] == self._scope_ids[scope]) & (self._expires_at[:self.size] > now)
+        scores = np.where(valid, scores, -np.inf)
+        best = int(np.argmax(scores))
+        similarity = float(scores[best])
+
+        if similarity < self.threshold:
+            self.misses += 1
+            return None
+
+        self._last_used[best] = now
+        self.hits += 1
+        return self._responses[best], similarity
+
+    def insert(self, vector: np.ndarray, scope: str, response: str):
+        """Store a prompt embedding and its response"""
+        now = time.monotonic()
+        if self.size < self.capacity:
+            row = self.size
+            self.size += 1
+        else:
+            expired = np.flatnonzero(self._expires_at <= now)
+            row = int(expired[0]) if len(expired) else int(np.argmin(self._last_used))
+            self.evictions += 1
+
+        self._vectors[row] = vector
+        self._scopes[row] = self._scope_id(scope)
+        self._expires_at[row] = now + self.ttl_seconds
+        self._last_used[row] = now
+        self._responses[row] = response
+        self.inserts += 1
+
+    def clear(self):
+        self._scopes[:] = -1
+        self._responses = [None] * self.capacity
+        self._scope_ids.clear()
+        self.size = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": self.size,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "inserts": self.inserts,
+            "evictions": self.evictions,
+            "index_bytes": int(self._vectors.nbytes),
+        }
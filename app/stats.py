@@ -0,0 +1,94 @@
+import bisect
+from typing import Dict, List, Optional, Sequence
+
+# Default latency buckets in seconds, from sub-millisecond up to the 180 s upstream timeout
+DEFAULT_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 180.0
+)
+
+# Streaming decode rate buckets in tokens per second
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram for cheap latency tracking on the hot path.
+    Bucket bounds are upper-inclusive, with an implicit +Inf bucket at the end.
+    """
+
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Optional[Sequence[float]] = None):
+        self.buckets: List[float] = sorted(buckets or DEFAULT_LATENCY_BUCKETS)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """Record one observation"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def mean(self) -> float:
+        if self.count == 0:
+            return 0.0
+        return self.sum / self.count
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation inside the matching bucket"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index >= len(self.buckets):
+                    return lower
+                upper = self.buckets[index]
+                return lower + (upper - lower) * ((rank - cumulative) / bucket_count)
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        """Summary suitable for JSON metrics"""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.mean(),
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+    def cumulative_buckets(self) -> List[tuple]:
+        """(upper_bound, cumulative_count) pairs including +Inf"""
+        result = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + [float("inf")], self.counts):
+            cumulative += bucket_count
+            result.append((bound, cumulative))
+        return result
+
+
+class HistogramFamily:
+    """Histograms sharing bucket bounds, one per label value (e.g. per model), created on first use"""
+
+    __slots__ = ("buckets", "histograms")
+
+    def __init__(self, buckets: Optional[Sequence[float]] = None):
+        self.buckets = buckets
+        self.histograms: Dict[str, Histogram] = {}
+
+    def labels(self, key: str) -> Histogram:
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        return histogram
+
+    def items(self):
+        return self.histograms.items()
+
+    def snapshot(self) -> dict:
+        return {key: histogram.snapshot() for key, histogram in self.histograms.items()}
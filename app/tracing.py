@@ -0,0 +1,348 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from .upstream import UpstreamClient
+
+logger = logging.getLogger(__name__)
+
+# W3C Trace Context: "00-<trace id>-<parent span id>-<flags>"
+TRACEPARENT_HEADER = "traceparent"
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# httpcore trace events that open a new connection (TCP, then TLS if any)
+_CONNECT_EVENTS = ("connection.connect_tcp", "connection.connect_unix_socket", "connection.start_tls")
+
+
+# Returned by traced_span for untraced requests; nullcontext is reusable
+_NOT_TRACED = nullcontext()
+
+
+def _new_id(bits: int) -> str:
+    # Trace Context only needs ids to be random enough to be unique, not unpredictable
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    """
+    One timed stage of a request; times are time.time() values.
+    Usable as a context manager that finishes the span on exit.
+    """
+
+    __slots__ = ("name", "span_id", "parent_id", "start", "end", "attributes")
+
+    def __init__(self, name: str, parent_id: Optional[str], start: Optional[float] = None,
+                 end: Optional[float] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.start = time.time() if start is None else start
+        self.end = end
+        self.attributes = attributes or {}
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.time()
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.finish()
+
+
+class Trace:
+    """
+    Spans of one request. Stage spans are children of the request's root span, which
+    continues the caller's trace when the request carried a traceparent header.
+    Spans are appended from concurrent tasks (hedged calls, coalesced work), so stages
+    never nest implicitly; pass parent to start_span for an explicit child.
+    """
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+                 sampled: bool = True):
+        self.trace_id = trace_id or _new_id(128)
+        self.sampled = sampled
+        self.root = Span(name, parent_id)
+        self.spans: List[Span] = [self.root]
+
+    @classmethod
+    def from_traceparent(cls, name: str, header: Optional[str], sampled: bool = True) -> "Trace":
+        """Continue the caller's trace, or start a new one if the header is missing or invalid"""
+        match = _TRACEPARENT.match((header or "").strip().lower())
+        if match and match.group(1) != "0" * 32 and match.group(2) != "0" * 16:
+            return cls(name, match.group(1), match.group(2), sampled=bool(int(match.group(3), 16) & 1))
+        return cls(name, sampled=sampled)
+
+    def child(self, name: str, **attributes) -> "Trace":
+        """
+        A separate trace in the same trace id whose root is a child of this trace's root,
+        for concurrent units of work (batch items) that each record their own stages
+        """
+        trace = Trace(name, self.trace_id, self.root.span_id, self.sampled)
+        trace.root.attributes.update(attributes)
+        return trace
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        span = Span(name, (parent or self.root).span_id, attributes=attributes)
+        self.spans.append(span)
+        return span
+
+    def span(self, name: str, **attributes) -> Span:
+        """A started child of the root span, for use in a with block"""
+        return self.start_span(name, **attributes)
+
+    def record(self, name: str, start: float, end: float, parent: Optional[Span] = None, **attributes) -> Span:
+        """Add a span for a stage timed elsewhere, e.g. from upstream-reported durations"""
+        span = Span(name, (parent or self.root).span_id, start, end, attributes)
+        self.spans.append(span)
+        return span
+
+    def last(self, name: str) -> Optional[Span]:
+        for span in reversed(self.spans):
+            if span.name == name:
+                return span
+        return None
+
+    def traceparent(self, span: Optional[Span] = None) -> str:
+        """Header value making span (default: the root) the parent of an upstream's work"""
+        return f"00-{self.trace_id}-{(span or self.root).span_id}-{'01' if self.sampled else '00'}"
+
+    def http_trace(self, parent: Optional[Span] = None) -> Callable:
+        """
+        httpcore trace callback (httpx's "trace" request extension) recording connection
+        setup and time to first byte of one upstream request. Reused connections add no
+        connect span; transports that emit no events (e.g. mocks) add nothing.
+        """
+        started: Dict[str, float] = {}
+
+        async def trace(event_name: str, info: dict):
+            now = time.time()
+            stage, _, phase = event_name.rpartition(".")
+            if phase == "started":
+                started[stage] = now
+            elif phase == "complete":
+                if stage in _CONNECT_EVENTS:
+                    self.record("connect", started.get(stage, now), now, parent)
+                elif stage.endswith("receive_response_headers"):
+                    request_sent = next(
+                        (at for name, at in started.items() if name.endswith("send_request_headers")), now
+                    )
+                    self.record("ttfb", request_sent, now, parent)
+
+        return trace
+
+    def finish(self):
+        for span in self.spans:
+            span.finish()
+
+    def timings(self) -> Dict[str, float]:
+        """Milliseconds per stage name (repeated stages are summed), plus the request total"""
+        totals: Dict[str, float] = {}
+        for span in self.spans[1:]:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration * 1000
+        totals["total"] = self.root.duration * 1000
+        return totals
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, e.g. "history;dur=0.4, queue;dur=12.0, total;dur=830.2" """
+        return ", ".join(f"{name};dur={milliseconds:.1f}" for name, milliseconds in self.timings().items())
+
+    def to_records(self) -> List[dict]:
+        """Finished spans in an OTLP-like JSON shape"""
+        return [
+            {
+                "trace_id": self.trace_id,
+                "span_id": span.span_id,
+                "parent_span_id": span.parent_id,
+                "name": span.name,
+                "start_time_unix_nano": int(span.start * 1e9),
+                "end_time_unix_nano": int((span.end or span.start) * 1e9),
+                "attributes": span.attributes,
+            }
+            for span in self.spans
+        ]
+
+
+def traced_span(trace: Optional[Trace], name: str, **attributes):
+    """trace.span(name), or a no-op context when the request is not traced"""
+    if trace is None:
+        return _NOT_TRACED
+    return trace.start_span(name, **attributes)
+
+
+def upstream_options(trace: Optional[Trace], parent: Optional[Span] = None, timing: bool = True) -> dict:
+    """
+    httpx request arguments propagating the trace to an upstream: a traceparent header
+    naming parent as the caller's span and, with timing, connect/TTFB recording.
+    """
+    if trace is None:
+        return {}
+    options = {"headers": {TRACEPARENT_HEADER: trace.traceparent(parent)}}
+    if timing:
+        options["extensions"] = {"trace": trace.http_trace(parent)}
+    return options
+
+
+class Tracer:
+    """
+    Starts request traces and exports finished, sampled ones in the background, as JSON
+    lines appended to trace_file and/or batches POSTed to collector_url ({"spans": [...]}).
+    Export never blocks a request: traces are queued and dropped when the queue is full.
+    With neither destination configured only Server-Timing headers are produced.
+    """
+
+    def __init__(self, trace_file: Optional[str] = None, collector_url: Optional[str] = None,
+                 sample_rate: float = 1.0, max_queue: int = 1000, flush_interval: float = 1.0,
+                 collector: Optional[UpstreamClient] = None):
+        self.trace_file = trace_file
+        self.collector = collector
+        self.collector_path = "/"
+        if collector_url:
+            # Pooled client for the origin; batches go to the URL's path
+            url = httpx.URL(collector_url)
+            self.collector_path = url.raw_path.decode("ascii")
+            if self.collector is None:
+                self.collector = UpstreamClient("trace-collector", str(url.copy_with(raw_path=b"/")))
+        self.sample_rate = sample_rate
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self._queue: List[Trace] = []
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.traces = 0
+        self.exported_spans = 0
+        self.dropped = 0
+        self.export_failures = 0
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        return cls(
+            trace_file=os.getenv("LLM_TRACE_FILE") or None,
+            collector_url=os.getenv("LLM_TRACE_COLLECTOR_URL") or None,
+            sample_rate=float(os.getenv("LLM_TRACE_SAMPLE_RATE", "1.0")),
+            max_queue=int(os.getenv("LLM_TRACE_MAX_QUEUE", "1000"))
+        )
+
+    @property
+    def exporting(self) -> bool:
+        return bool(self.trace_file or self.collector)
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None) -> Trace:
+        """The caller's sampling decision wins; new traces are sampled at sample_rate"""
+        self.traces += 1
+        return Trace.from_traceparent(name, traceparent, sampled=random.random() < self.sample_rate)
+
+    def export(self, trace: Trace):
+        if not self.exporting or not trace.sampled:
+            return
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append(trace)
+
+    def start(self):
+        if self.exporting and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self.collector is not None:
+            await self.collector.close()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Export everything queued so far"""
+        if not self._queue:
+            return
+        batch, self._queue = self._queue, []
+        records = [record for trace in batch for record in trace.to_records()]
+        try:
+            if self.trace_file:
+                lines = "".join(json.dumps(record) + "\n" for record in records)
+                await asyncio.get_running_loop().run_in_executor(None, self._append, lines)
+            if self.collector is not None:
+                response = await self.collector.post(self.collector_path, json={"spans": records}, timeout=5.0)
+                response.raise_for_status()
+            self.exported_spans += len(records)
+        except Exception as e:
+            self.export_failures += 1
+            logger.warning(f"Failed to export {len(records)} spans: {e}")
+
+    def _append(self, lines: str):
+        with open(self.trace_file, "a") as handle:
+            handle.write(lines)
+
+    def get_stats(self) -> dict:
+        return {
+            "traces": self.traces,
+            "sample_rate": self.sample_rate,
+            "exporting": self.exporting,
+            "queued": len(self._queue),
+            "exported_spans": self.exported_spans,
+            "dropped": self.dropped,
+            "export_failures": self.export_failures,
+        }
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware giving each HTTP request a Trace (request.state.trace) and a
+    Server-Timing response header summarizing the stages finished before the response
+    started. Time between the "handler" span ending and the response starting is
+    recorded as "serialize". For streamed responses later stages are only in the export.
+    """
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope.get("headers", ()):
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        trace = self.tracer.start_trace(f"{scope['method']} {scope['path']}", traceparent)
+        scope.setdefault("state", {})["trace"] = trace
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                handler = trace.last("handler")
+                if handler is not None and handler.end is not None:
+                    trace.record("serialize", handler.end, time.time())
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            trace.finish()
+            self.tracer.export(trace)
@@ -0,0 +1,428 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Set, Union
+
+import httpx
+
+from .stats import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamClient:
+    """
+    Long-lived, pooled HTTP client for a single upstream endpoint.
+    Keeps connections alive between calls and tracks pool usage for metrics.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 60.0,
+        headers: Optional[dict] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.headers = headers or {}
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # Pool metrics
+        self.in_flight = 0
+        self.requests_total = 0
+        self.errors_total = 0
+        self.pool_waits = 0
+
+    @property
+    def is_started(self) -> bool:
+        return self._client is not None and not self._client.is_closed
+
+    async def start(self):
+        """Create the underlying connection pool"""
+        if self.is_started:
+            return
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            limits=limits,
+            http2=False,
+            transport=self._transport,
+        )
+        logger.info(
+            f"Upstream client '{self.name}' started for {self.base_url} "
+            f"(max_connections={self.max_connections}, keepalive={self.max_keepalive_connections})"
+        )
+
+    async def close(self):
+        """Close all pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info(f"Upstream client '{self.name}' closed")
+
+    @asynccontextmanager
+    async def _track(self):
+        if not self.is_started:
+            await self.start()
+        if self.in_flight >= self.max_connections:
+            # Every connection is busy, so this request has to queue for one
+            self.pool_waits += 1
+        self.in_flight += 1
+        self.requests_total += 1
+        try:
+            yield self._client
+        except Exception:
+            self.errors_total += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request using a pooled connection"""
+        async with self._track() as client:
+            return await client.request(method, url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Stream a response using a pooled connection"""
+        async with self._track() as client:
+            async with client.stream(method, url, **kwargs) as response:
+                yield response
+
+    def get_stats(self) -> dict:
+        """Get connection pool statistics"""
+        open_connections = 0
+        idle_connections = 0
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        for connection in getattr(pool, "connections", []):
+            open_connections += 1
+            if connection.is_idle():
+                idle_connections += 1
+        return {
+            "base_url": self.base_url,
+            "in_use": self.in_flight,
+            "open_connections": open_connections,
+            "idle_connections": idle_connections,
+            "pool_waits": self.pool_waits,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+        }
+
+
+class _Endpoint:
+    """Routing state for one member of an UpstreamPool"""
+
+    __slots__ = ("client", "outstanding", "ewma_latency", "consecutive_failures",
+                 "ejected_until", "ejections", "probing")
+
+    def __init__(self, client: UpstreamClient, initial_latency: float):
+        self.client = client
+        self.outstanding = 0
+        self.ewma_latency = initial_latency
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.probing = False
+
+    @property
+    def ejected(self) -> bool:
+        return self.ejected_until > 0.0
+
+
+class UpstreamPool:
+    """
+    Several interchangeable endpoints behind the UpstreamClient interface.
+    Each request goes to the healthy endpoint with the lowest
+    (outstanding + 1) * EWMA latency. Endpoints that fail failure_threshold
+    times in a row are ejected; once the ejection period passes they are
+    probed and re-admitted if the probe succeeds.
+    Latency is the full request time, or the time to response headers for streams.
+    hedged_request() can additionally race a second endpoint once a request
+    outlives the pool's hedge_quantile latency.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_urls: List[str],
+        failure_threshold: int = 3,
+        ejection_seconds: float = 30.0,
+        ewma_alpha: float = 0.3,
+        probe_path: str = "/api/version",
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        **client_kwargs,
+    ):
+        self.name = name
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.failure_threshold = failure_threshold
+        self.ejection_seconds = ejection_seconds
+        self.ewma_alpha = ewma_alpha
+        self.probe_path = probe_path
+        self.endpoints = [
+            _Endpoint(UpstreamClient(f"{name}[{index}]", url, **client_kwargs), initial_latency=0.1)
+            for index, url in enumerate(base_urls)
+        ]
+        # Background probes of ejected endpoints, referenced until done so they are not collected
+        self._probes: Set[asyncio.Task] = set()
+
+        # Metrics
+        self.latency_histogram = Histogram()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    @property
+    def is_started(self) -> bool:
+        return all(endpoint.client.is_started for endpoint in self.endpoints)
+
+    async def start(self):
+        for endpoint in self.endpoints:
+            await endpoint.client.start()
+
+    async def close(self):
+        for task in list(self._probes):
+            task.cancel()
+        await asyncio.gather(*self._probes, return_exceptions=True)
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
+
+    def _choose(self, exclude: Optional[_Endpoint] = None) -> Optional[_Endpoint]:
+        now = time.time()
+        healthy = []
+        for endpoint in self.endpoints:
+            if endpoint is exclude:
+                continue
+            if not endpoint.ejected:
+                healthy.append(endpoint)
+            elif endpoint.ejected_until <= now and not endpoint.probing:
+                endpoint.probing = True
+                task = asyncio.ensure_future(self._probe(endpoint))
+                self._probes.add(task)
+                task.add_done_callback(self._probes.discard)
+        if not healthy:
+            if exclude is not None:
+                return None
+            # Everything is ejected: fail open to the endpoint due back soonest
+            return min(self.endpoints, key=lambda endpoint: endpoint.ejected_until)
+        return min(healthy, key=lambda endpoint: (endpoint.outstanding + 1) * endpoint.ewma_latency)
+
+    async def _probe(self, endpoint: _Endpoint):
+        try:
+            try:
+                response = await endpoint.client.get(self.probe_path, timeout=5.0)
+                healthy = response.status_code < 500
+            except Exception as e:
+                logger.debug(f"Probe of upstream {endpoint.client.base_url} failed: {e}")
+                healthy = False
+            if healthy:
+                endpoint.ejected_until = 0.0
+                endpoint.consecutive_failures = 0
+                logger.info(f"Upstream {endpoint.client.base_url} re-admitted to pool '{self.name}'")
+            else:
+                endpoint.ejected_until = time.time() + self.ejection_seconds
+        finally:
+            # Cleared even if the probe is cancelled, so the endpoint can be probed again
+            endpoint.probing = False
+
+    def _record(self, endpoint: _Endpoint, latency: float, failed: bool):
+        if failed:
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.failure_threshold and not endpoint.ejected:
+                endpoint.ejected_until = time.time() + self.ejection_seconds
+                endpoint.ejections += 1
+                logger.warning(
+                    f"Ejecting upstream {endpoint.client.base_url} from pool '{self.name}' "
+                    f"after {endpoint.consecutive_failures} consecutive failures"
+                )
+            return
+        endpoint.consecutive_failures = 0
+        endpoint.ewma_latency += self.ewma_alpha * (latency - endpoint.ewma_latency)
+
+    @asynccontextmanager
+    async def _route(self, endpoint: Optional[_Endpoint] = None):
+        endpoint = endpoint or self._choose()
+        endpoint.outstanding += 1
+        try:
+            yield endpoint
+        finally:
+            endpoint.outstanding -= 1
+
+    async def _send(self, endpoint: _Endpoint, method: str, url: str, **kwargs) -> httpx.Response:
+        async with self._route(endpoint):
+            start = time.time()
+            try:
+                response = await endpoint.client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                self._record(endpoint, time.time() - start, failed=True)
+                raise
+            latency = time.time() - start
+            self._record(endpoint, latency, failed=response.status_code >= 500)
+            if response.status_code < 500:
+                self.latency_histogram.observe(latency)
+            return response
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request to the best endpoint"""
+        return await self._send(self._choose(), method, url, **kwargs)
+
+    def hedge_delay(self) -> Optional[float]:
+        """How long to wait before hedging, or None until enough latencies are known"""
+        if self.latency_histogram.count < self.hedge_min_samples:
+            return None
+        return self.latency_histogram.quantile(self.hedge_quantile)
+
+    async def hedged_request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request to the best endpoint and, if it has not answered within the
+        hedge delay, a duplicate to the next best one. The first successful
+        response wins and the other request is cancelled.
+        """
+        primary_endpoint = self._choose()
+        primary = asyncio.ensure_future(self._send(primary_endpoint, method, url, **kwargs))
+        pending = {primary}
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, pending = await asyncio.wait(pending, timeout=delay)
+                if done:
+                    return primary.result()
+                secondary_endpoint = self._choose(exclude=primary_endpoint)
+                if secondary_endpoint is not None:
+                    self.hedges_sent += 1
+                    pending.add(asyncio.ensure_future(self._send(secondary_endpoint, method, url, **kwargs)))
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancelling the loser closes its connection, which stops the generation upstream
+            for task in pending:
+                task.cancel()
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Stream a response from the best endpoint"""
+        async with self._route() as endpoint:
+            start = time.time()
+            try:
+                async with endpoint.client.stream(method, url, **kwargs) as response:
+                    self._record(endpoint, time.time() - start, failed=response.status_code >= 500)
+                    yield response
+            except httpx.TransportError:
+                # Connection failures and streams broken mid-body both count against the endpoint
+                self._record(endpoint, time.time() - start, failed=True)
+                raise
+
+    def get_stats(self) -> dict:
+        """Per-endpoint load, latency and health, plus each endpoint's connection pool"""
+        return {
+            "endpoints": [
+                {
+                    **endpoint.client.get_stats(),
+                    "healthy": not endpoint.ejected,
+                    "outstanding": endpoint.outstanding,
+                    "ewma_latency_seconds": endpoint.ewma_latency,
+                    "consecutive_failures": endpoint.consecutive_failures,
+                    "ejections": endpoint.ejections,
+                }
+                for endpoint in self.endpoints
+            ],
+            "healthy_endpoints": sum(not endpoint.ejected for endpoint in self.endpoints),
+            "hedge_delay_seconds": self.hedge_delay(),
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+        }
+
+
+class UpstreamClientManager:
+    """Owns one UpstreamClient (or UpstreamPool) per upstream"""
+
+    def __init__(self):
+        self.max_connections = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+        self.keepalive_expiry = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+        self.clients: Dict[str, Union[UpstreamClient, UpstreamPool]] = {}
+
+    def register(self, name: str, base_url: str, headers: Optional[dict] = None) -> UpstreamClient:
+        """Register an endpoint; registering the same name twice returns the existing client"""
+        if name in self.clients:
+            return self.clients[name]
+        client = UpstreamClient(
+            name,
+            base_url,
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+            headers=headers,
+        )
+        self.clients[name] = client
+        return client
+
+    def register_pool(self, name: str, base_urls: List[str], headers: Optional[dict] = None) -> UpstreamPool:
+        """Register several interchangeable endpoints under one name"""
+        if name in self.clients:
+            return self.clients[name]
+        pool = UpstreamPool(
+            name,
+            base_urls,
+            failure_threshold=int(os.getenv("LLM_UPSTREAM_FAILURE_THRESHOLD", "3")),
+            ejection_seconds=float(os.getenv("LLM_UPSTREAM_EJECTION_SECONDS", "30")),
+            hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+            headers=headers,
+        )
+        self.clients[name] = pool
+        return pool
+
+    def get(self, name: str) -> Union[UpstreamClient, UpstreamPool]:
+        return self.clients[name]
+
+    async def start(self):
+        for client in self.clients.values():
+            await client.start()
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.close()
+
+    def get_stats(self) -> dict:
+        return {name: client.get_stats() for name, client in self.clients.items()}
@@ -0,0 +1,94 @@
+"""
+Benchmark: per-request cost of the Prometheus metrics path.
+
+Calls a minimal ASGI endpoint directly (no sockets) with and without
+HTTPMetricsMiddleware, compares the repo's Histogram.observe with
+prometheus_client's labelled Histogram, and times one full scrape.
+
+Usage:
+    python benchmarks/metrics_overhead_benchmark.py --requests 50000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client import Histogram as PrometheusHistogram
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.llm_service import LLMService  # noqa: E402
+from app.metrics import HTTPMetrics, HTTPMetricsMiddleware, ServiceCollector, create_registry  # noqa: E402
+from app.stats import Histogram  # noqa: E402
+
+SCOPE = {"type": "http", "method": "POST", "path": "/chat", "headers": []}
+
+
+async def endpoint(scope, receive, send):
+    """Stands in for a routed handler: sets the endpoint like Starlette's router and replies"""
+    scope["endpoint"] = endpoint
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def time_requests(app, total):
+    latencies = []
+    for _ in range(total):
+        start = time.perf_counter()
+        await app(dict(SCOPE), receive, send)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def time_observe(observe, total):
+    start = time.perf_counter()
+    for index in range(total):
+        observe((index % 1000) / 100.0)
+    return (time.perf_counter() - start) / total
+
+
+def report(name, seconds):
+    print(f"{name:<28} {seconds * 1e6:8.3f}us")
+
+
+async def main(args):
+    http_metrics = HTTPMetrics()
+    middleware = HTTPMetricsMiddleware(endpoint, http_metrics)
+    for name, app in (("bare endpoint", endpoint), ("with metrics middleware", middleware)):
+        await time_requests(app, 1000)  # Warm up
+        report(name, statistics.median(await time_requests(app, args.requests)))
+
+    histogram = Histogram()
+    report("stats.Histogram.observe", time_observe(histogram.observe, args.requests))
+    prometheus_histogram = PrometheusHistogram(
+        "bench_seconds", "Benchmark", ["model"], registry=CollectorRegistry()
+    ).labels("phi")
+    report("prometheus Histogram.observe", time_observe(prometheus_histogram.observe, args.requests))
+
+    # Scrape cost with a realistic number of label sets
+    for route in range(args.routes):
+        for status in (200, 429, 500):
+            http_metrics.observe("POST", f"/route/{route}", status, 0.2)
+    registry = create_registry(ServiceCollector(LLMService(), http_metrics, lambda: 0))
+    start = time.perf_counter()
+    body = generate_latest(registry)
+    print(f"{'scrape':<28} {(time.perf_counter() - start) * 1000:8.3f}ms ({len(body)} bytes)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Metrics hot-path overhead benchmark")
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--routes", type=int, default=20,
+                        help="Routes with recorded traffic when timing the scrape")
+    asyncio.run(main(parser.parse_args()))
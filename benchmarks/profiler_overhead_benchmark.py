@@ -0,0 +1,91 @@
+"""
+Benchmark: event loop slowdown while the sampling profiler runs.
+
+Runs a CPU-bound asyncio workload (many concurrent coroutines serializing
+JSON between awaits, roughly the request path's shape) for a fixed time,
+first unprofiled and then under the profiler at several sampling intervals,
+and reports the throughput lost next to the overhead the profiler reports.
+The last row is the same workload during a tracemalloc memory diff.
+
+Usage:
+    python benchmarks/profiler_overhead_benchmark.py --seconds 3 --intervals 1,5,10 --rounds 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.profiling import Profiler  # noqa: E402
+
+PAYLOAD = {"message": "What is Kubernetes?", "history": [{"role": "user", "content": "x" * 200}] * 20}
+
+
+async def nested(depth: int) -> int:
+    """Recurse so sampled stacks are as deep as a real handler's"""
+    if depth == 0:
+        return len(json.dumps(PAYLOAD))
+    return await nested(depth - 1)
+
+
+async def worker(stop_at: float, counter: list):
+    while time.perf_counter() < stop_at:
+        await nested(20)
+        counter[0] += 1
+        await asyncio.sleep(0)
+
+
+async def run(seconds: float, concurrency: int, measure=None):
+    """Workload throughput while measure (a profiler call, if any) runs alongside"""
+    counter = [0]
+    stop_at = time.perf_counter() + seconds
+    workers = asyncio.gather(*(worker(stop_at, counter) for _ in range(concurrency)))
+    result = None
+    if measure is not None:
+        result = await measure(seconds)
+    await workers
+    return counter[0] / seconds, result
+
+
+async def main(args):
+    # Interleave unprofiled and profiled runs and take medians; single runs are noisy
+    intervals = [float(value) for value in args.intervals.split(",")]
+    throughputs = {None: [], **{interval_ms: [] for interval_ms in intervals}}
+    overheads = {interval_ms: [] for interval_ms in intervals}
+    samples = {interval_ms: [] for interval_ms in intervals}
+    tracemalloc_throughputs = []
+    for _ in range(args.rounds):
+        throughputs[None].append((await run(args.seconds, args.concurrency))[0])
+        for interval_ms in intervals:
+            profiler = Profiler(interval=interval_ms / 1000.0)
+            throughput, result = await run(args.seconds, args.concurrency, profiler.profile)
+            throughputs[interval_ms].append(throughput)
+            overheads[interval_ms].append(result.overhead)
+            samples[interval_ms].append(result.samples / result.duration)
+        tracemalloc_throughputs.append((await run(args.seconds, args.concurrency, Profiler().memory_diff))[0])
+
+    baseline = statistics.median(throughputs[None])
+    print(f"{'unprofiled':<16} {baseline:10.0f} ops/s")
+    for interval_ms in intervals:
+        throughput = statistics.median(throughputs[interval_ms])
+        print(
+            f"{f'every {interval_ms:g}ms':<16} {throughput:10.0f} ops/s "
+            f"slowdown={1 - throughput / baseline:6.2%} "
+            f"reported_overhead={statistics.median(overheads[interval_ms]):6.2%} "
+            f"samples/s={statistics.median(samples[interval_ms]):5.0f}"
+        )
+    throughput = statistics.median(tracemalloc_throughputs)
+    print(f"{'tracemalloc':<16} {throughput:10.0f} ops/s slowdown={1 - throughput / baseline:6.2%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sampling profiler overhead benchmark")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--intervals", default="1,5,10", help="Sampling intervals in milliseconds")
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,136 @@
+"""
+Minimal Ollama-compatible stub server for local benchmarks.
+
+Speaks just enough HTTP/1.1 (with keep-alive) to answer /api/version,
+/api/tags and /api/generate, so client-side overhead can be measured
+without a real model behind it.
+
+Usage:
+    python benchmarks/stub_upstream.py --port 11435 --delay-ms 5
+"""
+import argparse
+import asyncio
+import json
+from typing import Optional
+
+
+class StubUpstream:
+    """Tiny asyncio HTTP server that mimics the Ollama API"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay_ms: float = 0.0,
+                 tokens: int = 8):
+        self.host = host
+        self.port = port
+        self.delay = delay_ms / 1000.0
+        self.tokens = tokens
+        self.connections_accepted = 0
+        self.requests_served = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections_accepted += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = b""
+                if "content-length" in headers:
+                    body = await reader.readexactly(int(headers["content-length"]))
+                await self._respond(writer, method, path, body)
+                self.requests_served += 1
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes):
+        if path == "/api/version":
+            await self._write_json(writer, {"version": "stub"})
+        elif path == "/api/tags":
+            await self._write_json(writer, {"models": [{"name": "phi:latest"}]})
+        elif path == "/api/generate":
+            payload = json.loads(body or b"{}")
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            words = [f"token{i} " for i in range(self.tokens)]
+            # Mimic Ollama's context array and timing fields (durations in nanoseconds)
+            prompt_tokens = max(1, len(payload.get("prompt", "")) // 4)
+            final = {
+                "response": "",
+                "done": True,
+                "context": list(payload.get("context", [])) + list(range(prompt_tokens + len(words))),
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": prompt_tokens * 1_000_000,
+                "eval_count": len(words),
+                "eval_duration": int(self.delay * 1e9) or len(words) * 1_000_000,
+            }
+            if payload.get("stream", True):
+                await self._write_ndjson(writer, words, final)
+            else:
+                await self._write_json(writer, {**final, "response": "".join(words)})
+        else:
+            await self._write_json(writer, {"error": "not found"}, status=404)
+
+    async def _write_json(self, writer: asyncio.StreamWriter, data: dict, status: int = 200):
+        payload = json.dumps(data).encode()
+        reason = "OK" if status == 200 else "Not Found"
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+
+    async def _write_ndjson(self, writer: asyncio.StreamWriter, words: list, final: dict):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        chunks = [{"response": word, "done": False} for word in words]
+        chunks.append(final)
+        for chunk in chunks:
+            line = json.dumps(chunk).encode() + b"\n"
+            writer.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+async def _serve(args):
+    stub = StubUpstream(args.host, args.port, args.delay_ms, args.tokens)
+    await stub.start()
+    print(f"Stub upstream listening on {stub.base_url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ollama-compatible stub upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--delay-ms", type=float, default=0.0)
+    parser.add_argument("--tokens", type=int, default=8)
+    asyncio.run(_serve(parser.parse_args()))
@@ -0,0 +1,91 @@
+"""
+Benchmark: per-request cost of request tracing.
+
+Calls a minimal ASGI endpoint directly (no sockets) that opens as many
+stage spans as a traced /chat request, with and without TracingMiddleware,
+then times queuing the traces and exporting them to a JSON lines file.
+
+Usage:
+    python benchmarks/tracing_overhead_benchmark.py --requests 50000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.tracing import Tracer, TracingMiddleware, traced_span, upstream_options  # noqa: E402
+
+SCOPE = {
+    "type": "http",
+    "method": "POST",
+    "path": "/chat",
+    "headers": [(b"traceparent", b"00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01")],
+}
+# Spans a non-streamed Ollama request records, besides the root and "serialize"
+STAGES = ("cache", "history", "queue", "context", "upstream", "load", "prefill", "decode", "history")
+
+
+async def endpoint(scope, receive, send):
+    """Stands in for the /chat handler: opens the service's spans, then replies"""
+    trace = scope.get("state", {}).get("trace")
+    with traced_span(trace, "handler"):
+        for stage in STAGES:
+            with traced_span(trace, stage):
+                pass
+        upstream_options(trace)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def time_requests(app, total):
+    latencies = []
+    for _ in range(total):
+        start = time.perf_counter()
+        await app({**SCOPE, "state": {}}, receive, send)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name, seconds):
+    print(f"{name:<32} {seconds * 1e6:8.3f}us")
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        trace_file = os.path.join(directory, "spans.jsonl")
+        tracers = (
+            ("headers only", Tracer()),
+            ("exporting", Tracer(trace_file=trace_file, max_queue=args.requests + 1000)),
+        )
+        report("untraced endpoint", statistics.median(await time_requests(endpoint, args.requests)))
+        for name, tracer in tracers:
+            app = TracingMiddleware(endpoint, tracer)
+            await time_requests(app, 1000)  # Warm up
+            report(f"traced ({name})", statistics.median(await time_requests(app, args.requests)))
+
+        # Export happens off the request path; this is its cost per request
+        tracer = tracers[1][1]
+        queued = len(tracer._queue)
+        start = time.perf_counter()
+        await tracer.flush()
+        report("file export per request", (time.perf_counter() - start) / queued)
+        print(f"{'exported':<32} {tracer.exported_spans} spans, {os.path.getsize(trace_file) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Request tracing overhead benchmark")
+    parser.add_argument("--requests", type=int, default=50000)
+    asyncio.run(main(parser.parse_args()))
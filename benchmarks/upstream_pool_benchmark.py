@@ -0,0 +1,101 @@
+"""
+Benchmark: fresh httpx.AsyncClient per call vs. the pooled UpstreamClient.
+
+Runs the same /api/generate workload against a local stub upstream and
+reports p50/p99 latency plus how many TCP connections were opened.
+
+Usage:
+    python benchmarks/upstream_pool_benchmark.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.upstream import UpstreamClient  # noqa: E402
+from benchmarks.stub_upstream import StubUpstream  # noqa: E402
+
+PAYLOAD = {"model": "phi", "prompt": "What is Kubernetes?", "stream": False}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_fresh(base_url, total, concurrency):
+    """Baseline: one client (and one TCP handshake) per request"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            async with httpx.AsyncClient(timeout=30.0) as client:
+                response = await client.post(f"{base_url}/api/generate", json=PAYLOAD)
+                response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(total)))
+    return latencies
+
+
+async def run_pooled(base_url, total, concurrency):
+    """Pooled: a single long-lived client with keep-alive"""
+    client = UpstreamClient("bench", base_url, max_connections=concurrency,
+                            max_keepalive_connections=concurrency)
+    await client.start()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/api/generate", json=PAYLOAD, timeout=30.0)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        await asyncio.gather(*(one() for _ in range(total)))
+    finally:
+        await client.close()
+    return latencies
+
+
+def report(name, latencies, connections, elapsed):
+    print(
+        f"{name:<8} requests={len(latencies):<6} "
+        f"p50={percentile(latencies, 50) * 1000:7.2f}ms "
+        f"p99={percentile(latencies, 99) * 1000:7.2f}ms "
+        f"mean={statistics.mean(latencies) * 1000:7.2f}ms "
+        f"rps={len(latencies) / elapsed:8.1f} "
+        f"tcp_connections={connections}"
+    )
+
+
+async def main(args):
+    for name, runner in (("fresh", run_fresh), ("pooled", run_pooled)):
+        stub = StubUpstream(delay_ms=args.delay_ms)
+        await stub.start()
+        try:
+            start = time.perf_counter()
+            latencies = await runner(stub.base_url, args.requests, args.concurrency)
+            report(name, latencies, stub.connections_accepted, time.perf_counter() - start)
+        finally:
+            await stub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upstream connection pool benchmark")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--delay-ms", type=float, default=2.0,
+                        help="Simulated upstream processing time")
+    asyncio.run(main(parser.parse_args()))
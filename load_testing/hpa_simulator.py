@@ -0,0 +1,431 @@
+"""
+Offline HPA policy simulator.
+
+Replays recorded Locust traffic (a *_stats_history.csv) through a queueing
+model of backend pods and evaluates many HorizontalPodAutoscaler policies
+at once. Every policy is one column of NumPy arrays, so a sweep of thousands
+of variants costs about as much as a single run per simulated second.
+
+Pod model: each ready pod serves LLM_ADMISSION_MAX_CONCURRENCY requests at a
+time and queues up to LLM_ADMISSION_MAX_QUEUE more; the excess is rejected.
+Waiting time is the fluid backlog drained at full capacity plus the
+Allen-Cunneen/Sakasegawa approximation of G/G/m queueing below saturation.
+New pods become ready after --pod-startup seconds.
+
+HPA model (autoscaling/v2): every --sync-period seconds each metric proposes
+ceil(currentReplicas * usage / target), with not-yet-ready pods counted as
+idle and a 10% tolerance; the largest proposal is stabilized over the
+scale-up/scale-down windows, then limited by the Pods/Percent rate policies
+and clamped to min/max replicas. Metrics are averaged over --metric-window
+seconds like metrics-server does. Defaults mirror k8s/hpa.yaml; that policy
+is always evaluated as the baseline.
+
+Usage:
+    python load_testing/hpa_simulator.py locust_results_stats_history.csv
+    python load_testing/hpa_simulator.py poster_load_test_stats_history.csv --load-scale 20 \\
+        --cpu-targets 50,60,70,80 --queue-targets none,2,8 --scale-down-windows 0,120,300
+    python load_testing/hpa_simulator.py locust_results_stats_history.csv \\
+        --service-times benchmarks/service_times.txt --timeline best_policy.csv
+"""
+import argparse
+import csv
+import itertools
+import math
+import sys
+import time
+
+import numpy as np
+
+METRICS = ("cpu", "memory", "queue")
+
+# k8s/hpa.yaml
+BASELINE = {
+    "cpu": 70.0,
+    "memory": 80.0,
+    "queue": math.nan,
+    "scale_up_window": 60.0,
+    "scale_down_window": 300.0,
+    "scale_down_percent": 50.0,
+    "min_replicas": 2,
+    "max_replicas": 10,
+}
+
+
+def load_arrival_rate(path, name="Aggregated", load_scale=1.0):
+    """Requests per second for every second of a Locust stats history, from its Requests/s column"""
+    times, rates = [], []
+    with open(path, newline="") as handle:
+        for row in csv.DictReader(handle):
+            if row["Name"] != name:
+                continue
+            times.append(float(row["Timestamp"]))
+            value = row["Requests/s"]
+            rates.append(float(value) if value not in ("", "N/A") else 0.0)
+    if not times:
+        raise ValueError(f"No '{name}' rows in {path}")
+    times = np.asarray(times) - times[0]
+    seconds = np.arange(0, times[-1] + 1)
+    return np.interp(seconds, times, np.asarray(rates)) * load_scale
+
+
+def service_time_from_samples(path):
+    """Mean and coefficient of variation of per-request service times (seconds, one per line)"""
+    samples = []
+    with open(path) as handle:
+        for line in handle:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                samples.append(float(line.split(",")[0]))
+    if not samples:
+        raise ValueError(f"No service time samples in {path}")
+    samples = np.asarray(samples)
+    return float(samples.mean()), float(samples.std() / samples.mean())
+
+
+def parse_values(spec, cast=float):
+    """"50,70,none" -> [50.0, 70.0, nan]; none disables a metric"""
+    values = []
+    for item in spec.split(","):
+        item = item.strip().lower()
+        if item in ("none", "off", ""):
+            values.append(math.nan)
+        else:
+            values.append(cast(item))
+    return values
+
+
+class Policies:
+    """HPA policy variants as parallel arrays, one entry per policy; policy 0 is the baseline"""
+
+    FIELDS = tuple(BASELINE)
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.size = len(rows)
+        for field in self.FIELDS:
+            setattr(self, field, np.array([row[field] for row in rows], dtype=float))
+
+    @classmethod
+    def grid(cls, **values):
+        """Baseline plus the cartesian product of the given per-field value lists"""
+        fields = [field for field in cls.FIELDS if values.get(field)]
+        rows = [dict(BASELINE)]
+        for combination in itertools.product(*(values[field] for field in fields)):
+            row = {**BASELINE, **dict(zip(fields, combination))}
+            if row["min_replicas"] <= row["max_replicas"] and row not in rows:
+                rows.append(row)
+        return cls(rows)
+
+    def describe(self, index):
+        row = self.rows[index]
+        targets = " ".join(
+            f"{metric}={row[metric]:g}" for metric in METRICS if not math.isnan(row[metric])
+        ) or "no metrics"
+        return (
+            f"{targets} up_window={row['scale_up_window']:g}s down_window={row['scale_down_window']:g}s "
+            f"down_percent={row['scale_down_percent']:g} replicas={row['min_replicas']:g}-{row['max_replicas']:g}"
+        )
+
+
+class PodModel:
+    """Capacity and resource usage of one backend pod"""
+
+    def __init__(self, service_time_mean=2.0, service_time_cv=1.0, slots=4, max_queue=64,
+                 startup_seconds=60.0, cpu_idle=0.05, cpu_busy=1.5, memory_base=0.4, memory_busy=0.3):
+        self.service_time_mean = service_time_mean
+        self.service_time_cv = service_time_cv
+        self.slots = slots
+        self.max_queue = max_queue
+        self.startup_seconds = startup_seconds
+        # Fractions of the pod's resource requests, idle and with every slot busy
+        self.cpu_idle = cpu_idle
+        self.cpu_busy = cpu_busy
+        self.memory_base = memory_base
+        self.memory_busy = memory_busy
+
+
+class Simulation:
+    """Per-second replicas and latency for every policy, plus per-policy totals"""
+
+    def __init__(self, arrival_rate, spec, ready, wait, latency, rejected, scale_events):
+        self.arrival_rate = arrival_rate
+        self.spec = spec
+        self.ready = ready
+        self.wait = wait
+        self.latency = latency
+        self.rejected = rejected
+        self.scale_events = scale_events
+
+    def summary(self, slo_seconds):
+        """Per-policy totals; SLO violations are weighted by the requests arriving in each second"""
+        arrivals = self.arrival_rate[:, None]
+        total = max(float(self.arrival_rate.sum()), 1e-9)
+        violated = self.latency > slo_seconds
+        order = np.argsort(self.latency, axis=0)
+        sorted_latency = np.take_along_axis(self.latency, order, axis=0)
+        weights = np.take_along_axis(np.broadcast_to(arrivals, self.latency.shape), order, axis=0)
+        p95_index = np.minimum((np.cumsum(weights, axis=0) / total < 0.95).sum(axis=0), len(self.arrival_rate) - 1)
+        return {
+            "pod_seconds": self.spec.sum(axis=0),
+            "mean_replicas": self.spec.mean(axis=0),
+            "max_replicas": self.spec.max(axis=0),
+            "mean_wait": (self.wait * arrivals).sum(axis=0) / total,
+            "p95_latency": sorted_latency[p95_index, np.arange(self.latency.shape[1])],
+            "slo_violation_seconds": violated.sum(axis=0),
+            "slo_violation_share": (violated * arrivals).sum(axis=0) / total,
+            "rejected_share": self.rejected / total,
+            "scale_events": self.scale_events,
+        }
+
+
+def _stationary_wait(rho, servers, pod):
+    """Sakasegawa's G/G/m mean queueing delay with Poisson arrivals; zero at or above saturation"""
+    below = rho < 1.0
+    safe_rho = np.where(below, rho, 0.0)
+    variability = (1.0 + pod.service_time_cv ** 2) / 2.0
+    wait = (safe_rho ** (np.sqrt(2.0 * (servers + 1.0)) - 1.0) / (servers * (1.0 - safe_rho))
+            * variability * pod.service_time_mean)
+    return np.where(below, wait, 0.0)
+
+
+def simulate(arrival_rate, policies, pod, sync_period=15.0, metric_window=30.0, tolerance=0.1,
+             rate_period=60.0, scale_up_percent=100.0, scale_up_pods=4, scale_down_pods=2):
+    """Replay arrival_rate (requests/s, one entry per second) against every policy at once"""
+    steps = len(arrival_rate)
+    size = policies.size
+    startup_steps = int(round(pod.startup_seconds))
+    ring = max(1, startup_steps)
+
+    spec = policies.min_replicas.copy()
+    ready = spec.copy()
+    pending = np.zeros((size, ring))
+    backlog = np.zeros(size)
+    averaged = {metric: np.zeros(size) for metric in METRICS}
+    alpha = min(1.0, 1.0 / metric_window) if metric_window > 0 else 1.0
+    targets = {metric: getattr(policies, metric) for metric in METRICS}
+
+    # Recommendations and scale changes at past sync ticks, newest last
+    history = int(max(policies.scale_up_window.max(), policies.scale_down_window.max(), rate_period)
+                  // sync_period) + 1
+    recommendations = np.full((size, history), np.nan)
+    added = np.zeros((size, history))
+    removed = np.zeros((size, history))
+    tick_age = (history - 1 - np.arange(history)) * sync_period
+    up_mask = tick_age[None, :] <= policies.scale_up_window[:, None]
+    down_mask = tick_age[None, :] <= policies.scale_down_window[:, None]
+    in_period = tick_age < rate_period
+
+    spec_out = np.empty((steps, size), dtype=np.int16)
+    ready_out = np.empty((steps, size), dtype=np.int16)
+    wait_out = np.empty((steps, size), dtype=np.float32)
+    rejected = np.zeros(size)
+    scale_events = np.zeros(size, dtype=np.int64)
+
+    for step in range(steps):
+        slot = step % ring
+        ready += pending[:, slot]
+        pending[:, slot] = 0.0
+
+        # Serve for one second
+        rate = arrival_rate[step]
+        servers = ready * pod.slots
+        capacity = servers / pod.service_time_mean
+        offered = backlog + rate
+        served = np.minimum(offered, capacity)
+        backlog = offered - served
+        overflow = np.maximum(backlog - ready * pod.max_queue, 0.0)
+        rejected += overflow
+        backlog -= overflow
+        rho = rate / capacity
+        queueing = _stationary_wait(rho, servers, pod)
+        wait = queueing + backlog / capacity
+        busy = served / capacity
+        waiting = backlog + rate * queueing
+
+        usage = {
+            "cpu": 100.0 * (pod.cpu_idle + (pod.cpu_busy - pod.cpu_idle) * busy),
+            "memory": 100.0 * (pod.memory_base + pod.memory_busy * busy),
+            "queue": waiting / ready,
+        }
+        for metric in METRICS:
+            averaged[metric] += alpha * (usage[metric] - averaged[metric])
+
+        spec_out[step] = spec
+        ready_out[step] = ready
+        wait_out[step] = wait
+
+        if step % sync_period:
+            continue
+
+        # Each metric's proposal; pending pods count as idle, as the HPA controller assumes
+        recommendation = np.full(size, -np.inf)
+        for metric in METRICS:
+            target = targets[metric]
+            ratio = averaged[metric] * ready / (spec * target)
+            proposal = np.where(np.abs(ratio - 1.0) <= tolerance, spec, np.ceil(spec * ratio))
+            recommendation = np.fmax(recommendation, np.where(np.isnan(target), -np.inf, proposal))
+        recommendation = np.where(np.isinf(recommendation), spec, recommendation)
+
+        recommendations = np.roll(recommendations, -1, axis=1)
+        recommendations[:, -1] = recommendation
+        filled = ~np.isnan(recommendations)
+        up = np.where(up_mask & filled, recommendations, np.inf).min(axis=1)
+        down = np.where(down_mask & filled, recommendations, -np.inf).max(axis=1)
+        desired = np.minimum(np.maximum(spec, up), down)
+
+        # Rate limits relative to the replica count at the start of the period
+        start_up = spec - added[:, in_period].sum(axis=1)
+        up_limit = np.maximum(np.ceil(start_up * (1.0 + scale_up_percent / 100.0)), start_up + scale_up_pods)
+        start_down = spec + removed[:, in_period].sum(axis=1)
+        down_limit = np.maximum(np.floor(start_down * (1.0 - policies.scale_down_percent / 100.0)),
+                                start_down - scale_down_pods)
+        desired = np.clip(desired, down_limit, up_limit)
+        desired = np.clip(desired, policies.min_replicas, policies.max_replicas)
+
+        delta = desired - spec
+        added = np.roll(added, -1, axis=1)
+        removed = np.roll(removed, -1, axis=1)
+        added[:, -1] = np.maximum(delta, 0.0)
+        removed[:, -1] = np.maximum(-delta, 0.0)
+        scale_events += delta != 0
+        spec = desired
+
+        if startup_steps:
+            pending[:, slot] += np.maximum(delta, 0.0)
+        else:
+            ready += np.maximum(delta, 0.0)
+        # Scale-down removes the newest pending pods first, then ready ones
+        remove = np.maximum(-delta, 0.0)
+        if remove.any():
+            for offset in range(ring):
+                newest = (slot - offset) % ring
+                taken = np.minimum(pending[:, newest], remove)
+                pending[:, newest] -= taken
+                remove -= taken
+            ready -= remove
+
+    wait_out = wait_out.astype(np.float32)
+    latency = wait_out + np.float32(pod.service_time_mean)
+    return Simulation(arrival_rate, spec_out, ready_out, wait_out, latency, rejected, scale_events)
+
+
+def report(policies, summary, slo_seconds, top):
+    """Baseline first, then the best policies: fewest SLO violations, fewest rejections, fewest pod-seconds"""
+    ranking = np.lexsort((summary["pod_seconds"], summary["rejected_share"], summary["slo_violation_share"]))
+    print(f"{'rank':>4} {'slo_viol':>8} {'rejected':>8} {'p95_lat':>8} {'wait':>7} "
+          f"{'pods':>5} {'max':>4} {'scales':>6} {'pod_s':>8}  policy (SLO {slo_seconds:g}s)")
+    shown = [0] + [index for index in ranking[:top] if index != 0]
+    for index in shown:
+        rank = "base" if index == 0 else str(int(np.nonzero(ranking == index)[0][0]) + 1)
+        print(
+            f"{rank:>4} {summary['slo_violation_share'][index]:8.2%} {summary['rejected_share'][index]:8.2%} "
+            f"{summary['p95_latency'][index]:7.1f}s {summary['mean_wait'][index]:6.1f}s "
+            f"{summary['mean_replicas'][index]:5.2f} {summary['max_replicas'][index]:4d} "
+            f"{summary['scale_events'][index]:6d} {summary['pod_seconds'][index]:8.0f}  {policies.describe(index)}"
+        )
+    return ranking
+
+
+def write_summary(path, policies, summary):
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["policy", *Policies.FIELDS, *summary])
+        for index in range(policies.size):
+            writer.writerow([index, *(policies.rows[index][field] for field in Policies.FIELDS),
+                             *(summary[key][index] for key in summary)])
+
+
+def write_timeline(path, simulation, index, slo_seconds):
+    """Second-by-second replicas, waiting time and SLO state for one policy"""
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["second", "arrival_rate", "replicas", "ready_replicas", "wait_seconds",
+                         "latency_seconds", "slo_violated"])
+        for second in range(len(simulation.arrival_rate)):
+            latency = float(simulation.latency[second, index])
+            writer.writerow([second, f"{simulation.arrival_rate[second]:.3f}", simulation.spec[second, index],
+                             simulation.ready[second, index], f"{simulation.wait[second, index]:.3f}",
+                             f"{latency:.3f}", int(latency > slo_seconds)])
+
+
+def main(args):
+    arrival_rate = load_arrival_rate(args.history, args.name, args.load_scale)
+    if args.service_times:
+        service_time_mean, service_time_cv = service_time_from_samples(args.service_times)
+    else:
+        service_time_mean, service_time_cv = args.service_time_mean, args.service_time_cv
+    pod = PodModel(service_time_mean, service_time_cv, slots=args.slots, max_queue=args.max_queue,
+                   startup_seconds=args.pod_startup, cpu_idle=args.cpu_idle, cpu_busy=args.cpu_busy,
+                   memory_base=args.memory_base, memory_busy=args.memory_busy)
+    policies = Policies.grid(
+        cpu=parse_values(args.cpu_targets),
+        memory=parse_values(args.memory_targets),
+        queue=parse_values(args.queue_targets),
+        scale_up_window=parse_values(args.scale_up_windows),
+        scale_down_window=parse_values(args.scale_down_windows),
+        scale_down_percent=parse_values(args.scale_down_percents),
+        min_replicas=parse_values(args.min_replicas, int),
+        max_replicas=parse_values(args.max_replicas, int),
+    )
+    print(f"Replaying {len(arrival_rate)}s of traffic (peak {arrival_rate.max():.2f} req/s, "
+          f"mean {arrival_rate.mean():.2f} req/s) against {policies.size} policies; "
+          f"service time {service_time_mean:.2f}s (cv {service_time_cv:.2f}), {args.slots} slots per pod")
+
+    start = time.perf_counter()
+    simulation = simulate(arrival_rate, policies, pod, sync_period=args.sync_period,
+                          metric_window=args.metric_window, tolerance=args.tolerance)
+    summary = simulation.summary(args.slo)
+    print(f"Simulated in {time.perf_counter() - start:.2f}s\n")
+
+    ranking = report(policies, summary, args.slo, args.top)
+    if args.output:
+        write_summary(args.output, policies, summary)
+        print(f"\nPer-policy summary written to {args.output}")
+    if args.timeline:
+        index = int(ranking[0]) if args.timeline_policy is None else args.timeline_policy
+        write_timeline(args.timeline, simulation, index, args.slo)
+        print(f"Timeline of policy {index} written to {args.timeline}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded load against candidate HPA policies")
+    parser.add_argument("history", help="Locust *_stats_history.csv")
+    parser.add_argument("--name", default="Aggregated", help="Row name to replay from the history")
+    parser.add_argument("--load-scale", type=float, default=1.0, help="Multiply the recorded request rate")
+    parser.add_argument("--slo", type=float, default=10.0, help="Latency objective in seconds")
+    parser.add_argument("--top", type=int, default=10, help="Policies to list after the baseline")
+    parser.add_argument("--output", help="Write every policy's summary to this CSV")
+    parser.add_argument("--timeline", help="Write one policy's second-by-second timeline to this CSV")
+    parser.add_argument("--timeline-policy", type=int, help="Policy index for --timeline (default: best)")
+
+    pod_group = parser.add_argument_group("pod model")
+    pod_group.add_argument("--service-times", help="File of measured service times in seconds, one per line")
+    pod_group.add_argument("--service-time-mean", type=float, default=2.0)
+    pod_group.add_argument("--service-time-cv", type=float, default=1.0)
+    pod_group.add_argument("--slots", type=int, default=4, help="LLM_ADMISSION_MAX_CONCURRENCY")
+    pod_group.add_argument("--max-queue", type=int, default=64, help="LLM_ADMISSION_MAX_QUEUE")
+    pod_group.add_argument("--pod-startup", type=float, default=60.0, help="Seconds until a new pod is ready")
+    pod_group.add_argument("--cpu-idle", type=float, default=0.05, help="CPU use of an idle pod, fraction of request")
+    pod_group.add_argument("--cpu-busy", type=float, default=1.5, help="CPU use with every slot busy")
+    pod_group.add_argument("--memory-base", type=float, default=0.4, help="Memory use of an idle pod")
+    pod_group.add_argument("--memory-busy", type=float, default=0.3, help="Extra memory with every slot busy")
+
+    hpa_group = parser.add_argument_group("HPA controller")
+    hpa_group.add_argument("--sync-period", type=int, default=15)
+    hpa_group.add_argument("--metric-window", type=float, default=30.0)
+    hpa_group.add_argument("--tolerance", type=float, default=0.1)
+
+    sweep = parser.add_argument_group("policy sweep (comma-separated values; 'none' disables a metric)")
+    sweep.add_argument("--cpu-targets", default="50,60,70,80,90", help="CPU utilization %%")
+    sweep.add_argument("--memory-targets", default="none,80", help="Memory utilization %%")
+    sweep.add_argument("--queue-targets", default="none,2,4,8",
+                       help="Queued requests per pod (llm_admission_queue_depth)")
+    sweep.add_argument("--scale-up-windows", default="0,60")
+    sweep.add_argument("--scale-down-windows", default="0,60,120,300")
+    sweep.add_argument("--scale-down-percents", default="10,50,100")
+    sweep.add_argument("--min-replicas", default="1,2,3")
+    sweep.add_argument("--max-replicas", default="10")
+    args = parser.parse_args()
+    if args.timeline_policy is not None and args.timeline_policy < 0:
+        sys.exit("--timeline-policy must be a policy index")
+    main(args)
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from app.admission import AdmissionController, OverloadedError
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_admitted_in_fifo_order():
+    admission = AdmissionController(max_concurrency=1, max_queue=4, max_wait=5)
+    order = []
+    release = asyncio.Event()
+
+    async def worker(name):
+        async with admission.admit("phi"):
+            order.append(name)
+            await release.wait()
+
+    tasks = [asyncio.create_task(worker(i)) for i in range(3)]
+    await asyncio.sleep(0.01)
+    assert admission.get_stats()["queue_depth"] == 2
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert order == [0, 1, 2]
+    assert admission.get_stats()["active"] == 0
+
+
+
+@pytest.mark.asyncio
+async def test_zero_queue_serves_free_slots_and_rejects_only_when_busy():
+    admission = AdmissionController(max_concurrency=1, max_queue=0, max_wait=5)
+    admission.check("phi")
+    release = asyncio.Event()
+
+    async def worker():
+        async with admission.admit("phi"):
+            await release.wait()
+
+    task = asyncio.create_task(worker())
+    await asyncio.sleep(0.01)
+    with pytest.raises(OverloadedError):
+        admission.check("phi")
+    release.set()
+    await task
+    admission.check("phi")
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_with_retry_hint():
+    admission = AdmissionController(max_concurrency=1, max_queue=1, max_wait=5)
+    release = asyncio.Event()
+
+    async def worker():
+        async with admission.admit("phi"):
+            await release.wait()
+
+    tasks = [asyncio.create_task(worker()) for _ in range(2)]
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(OverloadedError) as excinfo:
+        async with admission.admit("phi"):
+            pass
+    assert excinfo.value.retry_after >= 1
+    assert admission.get_stats()["rejected"] == {"bulk": 1}
+
+    # Other models have their own slots
+    async with admission.admit("mistral"):
+        pass
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio
+async def test_max_wait_and_cancellation_free_the_queue():
+    admission = AdmissionController(max_concurrency=1, max_queue=4, max_wait=0.05)
+    release = asyncio.Event()
+
+    async def holder():
+        async with admission.admit("phi"):
+            await release.wait()
+
+    task = asyncio.create_task(holder())
+    await asyncio.sleep(0.01)
+    with pytest.raises(OverloadedError):
+        async with admission.admit("phi"):
+            pass
+    assert admission.get_stats()["timeouts"] == 1
+
+    waiter = asyncio.create_task(holder())
+    await asyncio.sleep(0.01)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    assert admission.get_stats()["queue_depth"] == 0
+
+    release.set()
+    await task
+    assert admission.get_stats()["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_interactive_waiters_overtake_bulk_backlog():
+    admission = AdmissionController(max_concurrency=1, max_queue=16, max_wait=5)
+    order = []
+    release = asyncio.Event()
+
+    async def worker(name, priority, user_id):
+        async with admission.admit("phi", priority, user_id):
+            order.append(name)
+            await release.wait()
+
+    tasks = [asyncio.create_task(worker("first", "bulk", "stress"))]
+    await asyncio.sleep(0.01)
+    tasks += [asyncio.create_task(worker(f"bulk{i}", "bulk", "stress")) for i in range(4)]
+    await asyncio.sleep(0.01)
+    tasks.append(asyncio.create_task(worker("chat", "interactive", "alice")))
+    await asyncio.sleep(0.01)
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert order[:2] == ["first", "chat"]
+    assert set(admission.get_stats()["wait_seconds"]) == {"bulk", "interactive"}
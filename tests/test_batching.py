@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.batching import MicroBatcher
+from app.llm_service import LLMService
+from app.upstream import UpstreamClient
+
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_without_waiting_for_window():
+    calls = []
+
+    async def send_batch(key, items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(send_batch, max_batch_size=3, window_ms=10_000)
+    results = await asyncio.wait_for(asyncio.gather(*(batcher.submit("k", i) for i in range(3))), 1)
+
+    assert results == [0, 2, 4]
+    assert calls == [[0, 1, 2]]
+    assert batcher.get_stats()["batch_size"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_window_flushes_partial_batches_per_key():
+    calls = []
+
+    async def send_batch(key, items):
+        calls.append((key, list(items)))
+        return items
+
+    batcher = MicroBatcher(send_batch, max_batch_size=8, window_ms=5)
+    results = await asyncio.gather(batcher.submit("a", 1), batcher.submit("b", 2), batcher.submit("a", 3))
+
+    assert results == [1, 2, 3]
+    assert sorted(calls) == [("a", [1, 3]), ("b", [2])]
+
+
+@pytest.mark.asyncio
+async def test_batch_errors_reach_every_caller():
+    async def send_batch(key, items):
+        raise RuntimeError("upstream down")
+
+    batcher = MicroBatcher(send_batch, window_ms=1)
+    results = await asyncio.gather(batcher.submit("k", 1), batcher.submit("k", 2), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert batcher.get_stats()["batch_errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_huggingface_requests_are_batched(monkeypatch):
+    bodies = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        bodies.append(body)
+        return httpx.Response(200, json=[[{"generated_text": text.upper()}] for text in body["inputs"]])
+
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "huggingface")
+    monkeypatch.setenv("LLM_MODEL_NAME", "gpt2")
+    monkeypatch.setenv("LLM_MICROBATCH_ENABLED", "true")
+    monkeypatch.setenv("LLM_MICROBATCH_WINDOW_MS", "20")
+    service = LLMService()
+    service.upstreams.clients["huggingface"] = UpstreamClient(
+        "huggingface", "http://hf.local", transport=httpx.MockTransport(handler)
+    )
+
+    responses = await asyncio.gather(*(service.process_message(f"q{i}", f"conv{i}") for i in range(3)))
+
+    assert len(bodies) == 1
+    assert len(bodies[0]["inputs"]) == 3
+    assert responses == [f"USER: Q{i}\nASSISTANT:" for i in range(3)]
+    assert service.get_batching_stats()["batches_sent"] == 1
+
+
+@pytest.mark.asyncio
+async def test_full_batch_beyond_model_concurrency_is_one_upstream_call(monkeypatch):
+    bodies = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        bodies.append(body)
+        return httpx.Response(200, json=[[{"generated_text": text}] for text in body["inputs"]])
+
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "huggingface")
+    monkeypatch.setenv("LLM_MODEL_NAME", "gpt2")
+    monkeypatch.setenv("LLM_MICROBATCH_ENABLED", "true")
+    monkeypatch.setenv("LLM_MICROBATCH_WINDOW_MS", "10000")
+    service = LLMService()
+    service.upstreams.clients["huggingface"] = UpstreamClient(
+        "huggingface", "http://hf.local", transport=httpx.MockTransport(handler)
+    )
+    max_batch_size = service.hf_batcher.max_batch_size
+    assert max_batch_size > service.admission.max_concurrency
+
+    # A full batch flushes at once, long before the window, and holds a single model slot
+    await asyncio.wait_for(
+        asyncio.gather(*(service.process_message(f"q{i}", f"conv{i}") for i in range(max_batch_size))), 1
+    )
+
+    assert len(bodies) == 1
+    assert len(bodies[0]["inputs"]) == max_batch_size
+    assert service.admission.get_stats()["admitted"] == {"bulk": 1}
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from app.coalescing import SingleFlight, generation_key
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_generation():
+    """N concurrent callers with the same key trigger a single upstream call"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def generate():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "shared answer"
+
+    results = await asyncio.gather(*(flight.do("key", generate) for _ in range(10)))
+    assert results == ["shared answer"] * 10
+    assert calls == 1
+    assert flight.get_stats()["calls_coalesced"] == 9
+    assert flight.get_stats()["in_flight_calls"] == 0
+
+
+@pytest.mark.asyncio
+async def test_coalesced_failure_reaches_every_caller():
+    flight = SingleFlight()
+
+    async def generate():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(*(flight.do("key", generate) for _ in range(3)),
+                                   return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_stream_fans_out_to_all_subscribers():
+    """One upstream stream is replayed to every concurrent subscriber"""
+    flight = SingleFlight()
+    opened = 0
+
+    async def token_stream():
+        nonlocal opened
+        opened += 1
+        for token in ("a", "b", "c"):
+            await asyncio.sleep(0.01)
+            yield token
+
+    async def collect():
+        return [token async for token in flight.stream("key", token_stream)]
+
+    results = await asyncio.gather(*(collect() for _ in range(5)))
+    assert results == [["a", "b", "c"]] * 5
+    assert opened == 1
+    assert flight.get_stats()["streams_coalesced"] == 4
+
+
+def test_generation_key_depends_on_context():
+    assert generation_key("ollama", "phi", "hi", "ctx") == generation_key("ollama", "phi", "hi", "ctx")
+    assert generation_key("ollama", "phi", "hi", "ctx") != generation_key("ollama", "phi", "hi", "other")
+
+
+@pytest.mark.asyncio
+async def test_shared_call_is_cancelled_when_every_caller_leaves():
+    flight = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def generate():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    callers = [asyncio.ensure_future(flight.do("key", generate)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    callers[0].cancel()
+    await asyncio.sleep(0.01)
+    assert not cancelled.is_set()   # One caller is still waiting
+
+    callers[1].cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert flight.get_stats()["calls_abandoned"] == 1
+    assert flight.get_stats()["in_flight_calls"] == 0
+
+
+@pytest.mark.asyncio
+async def test_shared_stream_is_cancelled_when_last_subscriber_leaves():
+    flight = SingleFlight()
+    closed = asyncio.Event()
+
+    async def token_stream():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "token"
+        finally:
+            closed.set()
+
+    stream = flight.stream("key", token_stream)
+    assert await stream.__anext__() == "token"
+    await stream.aclose()
+    await asyncio.wait_for(closed.wait(), 1)
+    assert flight.get_stats()["streams_abandoned"] == 1
+    assert flight.get_stats()["in_flight_streams"] == 0
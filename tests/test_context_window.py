@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.context_window import ContextWindow, approx_token_count
+from app.conversation_store import Message
+from app.llm_service import LLMService
+from app.upstream import UpstreamClient
+
+
+def test_select_keeps_newest_messages_within_budget():
+    messages = [Message("user", "x" * 400), Message("assistant", "y" * 40), Message("user", "z" * 40)]
+    window, overflow = ContextWindow.select(messages, budget=30)
+
+    assert [m.content[0] for m in window] == ["y", "z"]
+    assert [m.content[0] for m in overflow] == ["x"]
+    assert approx_token_count("abcde") == 2
+
+
+def test_newest_message_is_kept_even_when_over_budget():
+    window, overflow = ContextWindow.select([Message("user", "x" * 4000)], budget=10)
+    assert len(window) == 1 and overflow == []
+
+
+def test_budget_follows_model_context_size():
+    window = ContextWindow(response_reserve=512)
+    assert window.budget_for("mistral:7b") == 8192 - 512
+    assert window.budget_for("unknown-model") == 2048 - 512
+    assert ContextWindow(budget_override=100).budget_for("mistral") == 100
+
+
+@pytest.mark.asyncio
+async def test_overflow_is_summarized_in_background(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "mock")
+    monkeypatch.setenv("LLM_CONTEXT_TOKEN_BUDGET", "60")
+    service = LLMService()
+    for i in range(6):
+        await service.conversation_store.append("conv", "user", f"Question {i}. " + "detail " * 10)
+
+    context = await service._get_conversation_context("conv")
+    assert "Question 0" not in context
+    assert "Question 5" in context
+
+    while service.summarizer.get_stats()["pending"]:
+        await asyncio.sleep(0.01)
+    assert service.summarizer.get_stats()["completed"] == 1
+
+    context = await service._get_conversation_context("conv")
+    assert context.startswith("Summary of earlier conversation:")
+    assert "Question 0" in context
+    await service.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_summaries_use_the_conversations_model_and_budget(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "ollama")
+    monkeypatch.setenv("LLM_MODEL_NAME", "phi")
+    service = LLMService()
+    service.model_loaded = True
+    service.model_registry.register("ollama", "mistral", {"name": "mistral", "size": "7B"})
+    summarized_with = []
+
+    def handler(request):
+        summarized_with.append(json.loads(request.content)["model"])
+        return httpx.Response(200, json={"response": "They talked about pods."})
+
+    service.upstreams.clients["ollama"] = UpstreamClient(
+        "ollama", "http://ollama.local", transport=httpx.MockTransport(handler)
+    )
+    # About 9000 tokens: over mistral's 7680-token budget, far over phi's 1536
+    for i in range(10):
+        await service.conversation_store.append("conv", "user", f"Question {i}. " + "x" * 3600)
+
+    await service._get_conversation_context("conv", "mistral")
+    while service.summarizer.get_stats()["pending"]:
+        await asyncio.sleep(0.01)
+
+    assert summarized_with == ["mistral"]
+    # Only what overflows mistral's budget (less the summary reserve) is folded in, not phi's
+    through, _ = await service._load_summary("conv")
+    messages = await service.conversation_store.recent("conv")
+    assert through == messages[1].timestamp
+    await service.cleanup()
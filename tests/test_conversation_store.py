@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+from app.conversation_store import ConversationStore
+
+
+@pytest.mark.asyncio
+async def test_history_is_capped_per_conversation():
+    store = ConversationStore(max_messages=3)
+    for i in range(5):
+        await store.append("c1", "user", f"message {i}")
+
+    history = await store.recent("c1")
+    assert [m.content for m in history] == ["message 2", "message 3", "message 4"]
+    assert [m.content for m in await store.recent("c1", 2)] == ["message 3", "message 4"]
+    assert store.get_stats()["messages_dropped"] == 2
+
+
+@pytest.mark.asyncio
+async def test_lru_conversations_evicted_under_memory_cap():
+    store = ConversationStore(max_messages=10, max_bytes=4000)
+    await store.append("old", "user", "x" * 1000)
+    await store.append("new", "user", "x" * 1000)
+    await store.recent("old")  # "new" becomes least recently used
+    await store.append("newest", "user", "x" * 1000)
+
+    assert not await store.has_history("new")
+    assert await store.has_history("old")
+    assert store.current_bytes <= store.max_bytes
+    assert store.get_stats()["lru_evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_idle_conversations_evicted(monkeypatch):
+    store = ConversationStore(idle_timeout=60)
+    await store.append("idle", "user", "hello")
+
+    later = time.monotonic() + 120
+    monkeypatch.setattr(time, "monotonic", lambda: later)
+    await store.append("active", "user", "hello")
+
+    assert not await store.has_history("idle")
+    assert store.get_stats()["idle_evictions"] == 1
+    assert len(store) == 1
+
+
+@pytest.mark.asyncio
+async def test_message_records_serialize():
+    store = ConversationStore()
+    await store.append("c1", "assistant", "hi")
+    message = (await store.recent("c1"))[0]
+    assert not hasattr(message, "__dict__")
+    assert message.to_dict()["role"] == "assistant"
@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.deadlines import DeadlineExceededError, DeadlinePolicy, iterate_within, run_within, timeout_for
+from app.llm_service import LLMService
+from app.upstream import UpstreamClient
+
+
+def test_policy_uses_header_default_and_cap():
+    policy = DeadlinePolicy(default_timeout=30, max_timeout=60)
+    now = time.time()
+    assert policy.deadline("5") == pytest.approx(now + 5, abs=0.5)
+    assert policy.deadline(None) == pytest.approx(now + 30, abs=0.5)
+    assert policy.deadline("not a number") == pytest.approx(now + 30, abs=0.5)
+    assert policy.deadline("3600") == pytest.approx(now + 60, abs=0.5)
+
+
+def test_upstream_timeout_follows_remaining_budget():
+    assert timeout_for(None, 180.0) == 180.0
+    assert timeout_for(time.time() + 5, 180.0) == pytest.approx(5, abs=0.5)
+    assert timeout_for(time.time() + 500, 180.0) == 180.0
+    with pytest.raises(DeadlineExceededError):
+        timeout_for(time.time() - 1, 180.0)
+
+
+@pytest.mark.asyncio
+async def test_run_within_cancels_work_at_the_deadline():
+    cancelled = False
+
+    async def slow():
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    with pytest.raises(DeadlineExceededError):
+        await run_within(slow(), time.time() + 0.05)
+    assert cancelled
+
+
+@pytest.mark.asyncio
+async def test_iterate_within_stops_a_stalled_stream():
+    async def stalls():
+        yield "first"
+        await asyncio.sleep(10)
+        yield "never"
+
+    received = []
+    with pytest.raises(DeadlineExceededError):
+        async for item in iterate_within(stalls(), time.time() + 0.05):
+            received.append(item)
+    assert received == ["first"]
+
+
+@pytest.mark.asyncio
+async def test_expired_deadline_cancels_ollama_call_without_tripping_breaker(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "ollama")
+    monkeypatch.setenv("LLM_MODEL_NAME", "phi")
+    service = LLMService()
+
+    async def handler(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200, json={"response": "too late"})
+
+    service.upstreams.clients["ollama"] = UpstreamClient(
+        "ollama", "http://ollama.local", transport=httpx.MockTransport(handler)
+    )
+
+    start = time.time()
+    with pytest.raises(DeadlineExceededError):
+        await service.process_message("Hello", "conv-deadline", deadline=time.time() + 0.1)
+    assert time.time() - start < 1
+
+    stats = service.get_cancellation_stats()
+    assert stats["deadline_exceeded"] == 1
+    assert stats["upstream_calls_abandoned"] == 1
+    assert service.get_circuit_breaker_stats()["ollama"]["recent_failures"] == 0
+    assert service.admission.get_stats()["active"] == 0
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from app.admission import AdmissionController
+from app.health import HealthProber
+
+
+@pytest.mark.asyncio
+async def test_readiness_follows_cached_checks():
+    results = [True, False, False, True]
+    calls = 0
+
+    async def check():
+        nonlocal calls
+        calls += 1
+        return results.pop(0)
+
+    prober = HealthProber(check, lambda: True, failure_threshold=2)
+    assert not prober.started and not prober.ready()
+
+    await prober.probe()
+    assert prober.started and prober.ready()
+    await prober.probe()
+    assert prober.ready()           # One failure is tolerated
+    await prober.probe()
+    assert not prober.ready()
+    assert prober.started           # Startup is never revoked
+    await prober.probe()
+    assert prober.ready()
+
+    # Reading the state does not call the upstream
+    prober.ready()
+    prober.get_stats()
+    assert calls == 4
+
+
+@pytest.mark.asyncio
+async def test_saturation_takes_pod_out_of_rotation_with_hysteresis():
+    saturation = 0.0
+
+    async def check():
+        return True
+
+    prober = HealthProber(check, lambda: True, saturation=lambda: saturation,
+                          saturation_high=0.8, saturation_low=0.5)
+    await prober.probe()
+    assert prober.ready()
+    saturation = 0.9
+    assert not prober.ready()
+    saturation = 0.6
+    assert not prober.ready()       # Still above the low-water mark
+    saturation = 0.4
+    assert prober.ready()
+
+
+@pytest.mark.asyncio
+async def test_background_loop_keeps_liveness():
+    async def check():
+        raise RuntimeError("upstream down")
+
+    prober = HealthProber(check, lambda: True, interval=0.01)
+    assert not prober.live()
+    prober.start()
+    await asyncio.sleep(0.05)
+    assert prober.live()            # Upstream failures do not fail liveness
+    assert prober.healthy is False and prober.checks >= 2
+    await prober.close()
+
+
+@pytest.mark.asyncio
+async def test_admission_saturation_reflects_fullest_queue():
+    admission = AdmissionController(max_concurrency=1, max_queue=4)
+    assert admission.saturation() == 0.0
+    async with admission.admit("phi"):
+        waiters = [asyncio.ensure_future(admission.admit("phi").__aenter__()) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert admission.saturation() == 0.5
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
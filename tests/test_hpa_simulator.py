@@ -0,0 +1,57 @@
+import csv
+import math
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "load_testing"))
+
+from hpa_simulator import Policies, PodModel, load_arrival_rate, simulate  # noqa: E402
+
+
+def changes(timeline):
+    """(second, replicas) at the start and wherever the replica count changes"""
+    return [(second, int(timeline[second])) for second in range(len(timeline))
+            if second == 0 or timeline[second] != timeline[second - 1]]
+
+
+def write_history(path, rates):
+    """A Locust stats history with one Aggregated row per second, plus rows the replay must skip"""
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["Timestamp", "Name", "Requests/s"])
+        for second, rate in enumerate(rates):
+            writer.writerow([1700000000 + second, "/chat", "N/A"])
+            writer.writerow([1700000000 + second, "Aggregated", rate])
+
+
+def test_burst_replays_into_known_replica_timeline_and_slo_violations(tmp_path):
+    # One minute at 1 req/s, a two-minute burst at 6 req/s, then four quiet minutes
+    history = tmp_path / "burst_stats_history.csv"
+    write_history(history, [1.0] * 60 + [6.0] * 120 + [1.0] * 240)
+    arrival_rate = load_arrival_rate(str(history))
+    assert len(arrival_rate) == 420 and arrival_rate[59] == 1.0 and arrival_rate[60] == 6.0
+
+    # Policy 0 is always k8s/hpa.yaml; policy 1 scales on queue depth with a short scale-down window
+    policies = Policies.grid(cpu=[math.nan], memory=[math.nan], queue=[2.0], scale_down_window=[60.0],
+                             min_replicas=[1], max_replicas=[6])
+    assert policies.size == 2
+    pod = PodModel(service_time_mean=1.0, service_time_cv=1.0, slots=2, max_queue=8, startup_seconds=30)
+    simulation = simulate(arrival_rate, policies, pod)
+    summary = simulation.summary(slo_seconds=3.0)
+
+    # The baseline starts at its two-replica floor and its 300s scale-down window keeps it scaled up
+    assert changes(simulation.spec[:, 0]) == [(0, 2), (136, 3), (151, 4), (196, 5)]
+    # The queue policy steps up once per sync period (after the 60s scale-up window sees the
+    # burst), then steps back down a minute after the burst has drained out of the metric
+    assert changes(simulation.spec[:, 1]) == [(0, 1), (136, 2), (151, 3), (166, 4), (301, 3), (316, 2), (376, 1)]
+    # New pods serve 30s after the decision; removed pods stop at once
+    assert changes(simulation.ready[:, 1]) == [(0, 1), (165, 2), (180, 3), (195, 4), (301, 3), (316, 2), (376, 1)]
+
+    assert list(summary["slo_violation_seconds"]) == [116, 119]
+    assert list(summary["scale_events"]) == [3, 6]
+    assert list(summary["max_replicas"]) == [5, 4]
+    # Scaling lags the burst, so both policies shed load; the smaller floor sheds more
+    assert 0.0 < summary["rejected_share"][0] < summary["rejected_share"][1]
+    assert np.all(simulation.latency[:60] <= 3.0)
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.admission import OverloadedError
+from app.jobs import JOB_FAILED, JOB_SUCCEEDED, JobManager
+
+
+def _runner(release=None):
+    async def run(job):
+        for token in job.message.split():
+            if release is not None:
+                await release.wait()
+            yield {"type": "token", "token": token + " "}
+        yield {"type": "done", "response": job.message + " "}
+    return run
+
+
+@pytest.mark.asyncio
+async def test_job_events_replay_then_follow_progress():
+    release = asyncio.Event()
+    manager = JobManager(_runner(release))
+    job = manager.submit("hello there world", "conv")
+    await asyncio.sleep(0.01)
+    assert manager.get(job.id).to_dict()["status"] == "running"
+
+    async def collect():
+        return [event async for event in job.events()]
+
+    follower = asyncio.create_task(collect())
+    await asyncio.sleep(0.01)
+    release.set()
+    events = await follower
+
+    assert [event["type"] for event in events][0] == "status"
+    assert events[-1]["type"] == "done"
+    assert "".join(event["token"] for event in events if event["type"] == "token") == "hello there world "
+    assert events[-1]["response"] == "hello there world "
+    assert events[-1]["tokens"] == 3
+    assert manager.get_stats()["succeeded_total"] == 1
+
+
+@pytest.mark.asyncio
+async def test_retention_and_capacity_are_bounded():
+    release = asyncio.Event()
+    manager = JobManager(_runner(release), max_jobs=2, max_running=1)
+    first = manager.submit("one")
+    manager.submit("two")
+    with pytest.raises(OverloadedError):
+        manager.submit("three")
+    assert manager.get_stats()["rejected_total"] == 1
+
+    release.set()
+    await asyncio.sleep(0.05)
+    assert first.status == JOB_SUCCEEDED
+
+    # A finished job makes room for a new one
+    manager.submit("four")
+    assert manager.get(first.id) is None
+    manager.retention_seconds = 0
+    await asyncio.sleep(0.05)
+    assert manager.get_stats()["retained"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_jobs_report_the_error():
+    async def run(job):
+        raise RuntimeError("model exploded")
+        yield
+
+    manager = JobManager(run)
+    job = manager.submit("hi")
+    await asyncio.sleep(0.01)
+    assert job.status == JOB_FAILED
+    assert job.to_dict()["error"] == "model exploded"
+    await manager.close()
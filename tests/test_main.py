@@ -1,5 +1,6 @@
 import pytest
 import asyncio
+import json
 from fastapi.testclient import TestClient
 from app.main import app
 
@@ -23,9 +24,17 @@ def test_root_endpoint():
     assert data["version"] == "1.0.0"
 
 def test_metrics_endpoint():
-    """Test the metrics endpoint"""
+    """Test the Prometheus metrics endpoint"""
+    client.get("/stats")
     response = client.get("/metrics")
     assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{endpoint="/stats",method="GET",status="200"}' in response.text
+
+def test_metrics_json_endpoint():
+    """Test the JSON metrics endpoint"""
+    response = client.get("/metrics/json")
+    assert response.status_code == 200
     data = response.json()
     assert "active_connections" in data
     assert "total_messages_processed" in data
@@ -72,6 +81,47 @@ def test_chat_endpoint_no_conversation_id():
     data = response.json()
     assert "response" in data
 
+def test_chat_stream_endpoint(monkeypatch):
+    """Test the NDJSON streaming chat endpoint"""
+    from app.main import llm_service
+    monkeypatch.setattr(llm_service, "model_provider", "mock")
+    
+    response = client.post("/chat/stream", json={
+        "message": "Hello, how are you?",
+        "conversation_id": "test-stream"
+    })
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    
+    events = [json.loads(line) for line in response.text.splitlines() if line]
+    tokens = [event["token"] for event in events if event["type"] == "token"]
+    done = events[-1]
+    assert len(tokens) > 1
+    assert done["type"] == "done"
+    assert done["response"] == "".join(tokens)
+    assert done["conversation_id"] == "test-stream"
+    assert done["metadata"]["time_to_first_token"] <= done["metadata"]["total_time"]
+
+def test_websocket_streaming(monkeypatch):
+    """Test incremental token frames over WebSocket"""
+    from app.main import llm_service
+    monkeypatch.setattr(llm_service, "model_provider", "mock")
+    
+    with client.websocket_connect("/ws/test-ws-stream") as websocket:
+        welcome = websocket.receive_json()
+        assert welcome["type"] == "system"
+        
+        websocket.send_text(json.dumps({"message": "Hello", "stream": True}))
+        frames = []
+        while True:
+            frame = websocket.receive_json()
+            frames.append(frame)
+            if frame["type"] == "done":
+                break
+        
+        assert frames[0]["type"] == "token"
+        assert frames[-1]["response"] == "".join(f["token"] for f in frames[:-1])
+
 @pytest.mark.asyncio
 async def test_websocket_connection():
     """Test WebSocket connection (basic test)"""
@@ -83,5 +133,155 @@ async def test_websocket_connection():
     # For now, we just test that the endpoint exists
     pass
 
+def test_chat_overloaded_returns_429(monkeypatch):
+    """Test that a full admission queue is rejected with Retry-After once every slot is taken"""
+    from app.admission import AdmissionController
+    from app.main import llm_service
+    monkeypatch.setattr(llm_service, "model_provider", "mock")
+    admission = AdmissionController(max_concurrency=1, max_queue=0)
+    monkeypatch.setattr(llm_service, "admission", admission)
+    
+    # With a free slot a request is served even though nothing may queue
+    response = client.post("/chat", json={"message": "Hello", "conversation_id": "test-overload", "bypass_cache": True})
+    assert response.status_code == 200
+    
+    # Take the only slot, as an in-flight generation would
+    admission._limiter(llm_service.model_name).active = 1
+    response = client.post("/chat", json={"message": "Hello", "conversation_id": "test-overload"})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+    
+    response = client.post("/chat/stream", json={"message": "Hello", "conversation_id": "test-overload"})
+    assert response.status_code == 429
+
+def test_chat_deadline_returns_504(monkeypatch):
+    """Test that a request outliving its X-Request-Timeout budget is cancelled with a 504"""
+    from app.main import llm_service
+    monkeypatch.setattr(llm_service, "model_provider", "mock")
+    
+    response = client.post(
+        "/chat",
+        json={"message": "Hello", "conversation_id": "test-deadline", "bypass_cache": True},
+        headers={"X-Request-Timeout": "0.05"}
+    )
+    assert response.status_code == 504
+    assert llm_service.get_cancellation_stats()["deadline_exceeded"] >= 1
+
+def test_chat_unknown_model_returns_400():
+    """Test that naming a model the service does not offer is a client error"""
+    response = client.post("/chat", json={"message": "Hello", "provider": "bogus", "model_name": "none"})
+    assert response.status_code == 400
+
+def test_probe_endpoints(monkeypatch):
+    """Test that probe endpoints answer from the cached prober state"""
+    from app.main import health_prober, llm_service
+    monkeypatch.setattr(health_prober, "started", False)
+    monkeypatch.setattr(health_prober, "saturated", False)
+    assert client.get("/startupz").status_code == 503
+    assert client.get("/readyz").status_code == 503
+    
+    monkeypatch.setattr(health_prober, "started", True)
+    monkeypatch.setattr(health_prober, "consecutive_failures", 0)
+    assert client.get("/startupz").status_code == 200
+    assert client.get("/readyz").status_code == 200
+    
+    monkeypatch.setattr(llm_service, "get_saturation", lambda: 1.0)
+    monkeypatch.setattr(health_prober, "saturation", llm_service.get_saturation)
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["detail"]["saturated"] is True
+
+def test_admin_profile_requires_token(monkeypatch):
+    """Test that the profiler is off without a token and needs the bearer token when on"""
+    monkeypatch.delenv("LLM_ADMIN_TOKEN", raising=False)
+    assert client.get("/admin/profile?seconds=0.1").status_code == 403
+    
+    monkeypatch.setenv("LLM_ADMIN_TOKEN", "secret")
+    assert client.get("/admin/profile?seconds=0.1").status_code == 401
+    assert client.get("/admin/profile?seconds=0.1", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    
+    response = client.get("/admin/profile?seconds=0.1", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert int(response.headers["X-Profile-Samples"]) > 0
+    
+    response = client.get("/admin/profile/memory?seconds=0.1", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.text.startswith("#")
+
+def test_chat_batch_endpoint(monkeypatch):
+    """Test that bulk results stream back as NDJSON, one line per message"""
+    from app.main import llm_service
+    monkeypatch.setattr(llm_service, "model_provider", "mock")
+    
+    response = client.post("/chat/batch", json={
+        "messages": [{"message": f"Question {i}", "conversation_id": f"batch-{i}"} for i in range(4)],
+        "max_concurrency": 2
+    })
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    
+    results = [json.loads(line) for line in response.text.splitlines() if line]
+    assert sorted(result["index"] for result in results) == [0, 1, 2, 3]
+    assert all(result["conversation_id"] == f"batch-{result['index']}" for result in results)
+    assert all(result["response"] for result in results)
+
+def test_job_endpoints(monkeypatch):
+    """Test submitting a background job, following its events and polling it"""
+    from app.main import llm_service
+    monkeypatch.setattr(llm_service, "model_provider", "mock")
+    
+    # Jobs outlive the request, so keep one event loop for the whole exchange
+    with TestClient(app) as session:
+        response = session.post("/jobs", json={"message": "Hello", "conversation_id": "test-job"})
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        assert response.headers["location"] == f"/jobs/{job_id}"
+        
+        events = session.get(f"/jobs/{job_id}/events")
+        done = [json.loads(line) for line in events.text.splitlines() if line][-1]
+        assert done["type"] == "done"
+        assert done["status"] == "succeeded"
+        
+        polled = session.get(f"/jobs/{job_id}").json()
+        assert polled["response"] == done["response"]
+        assert session.get("/jobs/unknown").status_code == 404
+
+def test_batch_items_jobs_and_websocket_messages_are_traced(monkeypatch, tmp_path):
+    """Work done outside the request's own handler is exported as traces under the caller's"""
+    from app.main import llm_service, tracer
+    monkeypatch.setattr(llm_service, "model_provider", "mock")
+    trace_file = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(tracer, "trace_file", str(trace_file))
+    caller = {"traceparent": "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"}
+    
+    with TestClient(app) as session:
+        session.post("/chat/batch", json={
+            "messages": [{"message": f"Question {i}", "conversation_id": f"traced-batch-{i}"} for i in range(2)]
+        }, headers=caller)
+        job_id = session.post("/jobs", json={"message": "Hello", "conversation_id": "traced-job"},
+                              headers=caller).json()["job_id"]
+        session.get(f"/jobs/{job_id}/events")
+        with session.websocket_connect("/ws/test-ws-trace", headers=caller) as websocket:
+            websocket.receive_json()
+            websocket.send_text(json.dumps({"message": "Hello"}))
+            websocket.receive_json()
+    
+    records = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    records = [record for record in records if record["trace_id"] == "4bf92f3577b34da6a3ce929d0e0e4736"]
+    roots = {record["name"]: record for record in records if record["parent_span_id"] == "00f067aa0ba902b7"}
+    items = [record for record in records if record["name"] == "batch item"]
+    assert sorted(item["attributes"]["index"] for item in items) == [0, 1]
+    assert {item["parent_span_id"] for item in items} == {roots["POST /chat/batch"]["span_id"]}
+    job = next(record for record in records if record["name"] == "job")
+    assert job["parent_span_id"] == roots["POST /jobs"]["span_id"]
+    assert job["attributes"]["job_id"] == job_id
+    assert roots["WS message"]["attributes"]["client_id"] == "test-ws-trace"
+    
+    # Each unit of work records its own stages under its own root
+    for root in items + [job, roots["WS message"]]:
+        stages = {record["name"] for record in records if record["parent_span_id"] == root["span_id"]}
+        assert {"cache", "history", "queue"} <= stages
+
 if __name__ == "__main__":
-    pytest.main([__file__]) 
\ No newline at end of file
+    pytest.main([__file__])
@@ -0,0 +1,134 @@
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import generate_latest
+from prometheus_client.parser import text_string_to_metric_families
+
+from app.jobs import JobManager
+from app.llm_service import LLMService
+from app.metrics import HTTPMetrics, HTTPMetricsMiddleware, ServiceCollector, create_registry
+from app.upstream import UpstreamPool
+
+
+async def _runner(job):
+    yield {"type": "done", "response": job.message}
+
+
+def scrape(registry) -> dict:
+    """Samples by (name, sorted labels)"""
+    samples = {}
+    for family in text_string_to_metric_families(generate_latest(registry).decode()):
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return samples
+
+
+def test_middleware_labels_requests_by_route_template():
+    http_metrics = HTTPMetrics()
+    app = FastAPI()
+    app.add_middleware(HTTPMetricsMiddleware, metrics=http_metrics)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        return {"item_id": item_id}
+
+    client = TestClient(app)
+    client.get("/items/a")
+    client.get("/items/b")
+    client.get("/missing")
+
+    assert http_metrics.requests == {
+        ("GET", "/items/{item_id}", "200"): 2,
+        ("GET", "unmatched", "404"): 1,
+    }
+    assert http_metrics.durations[("GET", "/items/{item_id}")].count == 2
+    assert http_metrics.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_collector_exports_model_histograms_and_gauges(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "mock")
+    monkeypatch.setenv("LLM_MODEL_NAME", "mock-model")
+    service = LLMService()
+    http_metrics = HTTPMetrics()
+    http_metrics.observe("POST", "/chat", 200, 0.3)
+    registry = create_registry(ServiceCollector(service, http_metrics, lambda: 2))
+
+    async for _ in service.stream_message("Hello there", "conv-1", use_cache=False):
+        pass
+    async with service.admission.admit("mock-model"):
+        samples = scrape(registry)
+
+    assert samples[("http_requests_total", (("endpoint", "/chat"), ("method", "POST"), ("status", "200")))] == 1
+    assert samples[("http_request_duration_seconds_bucket",
+                    (("endpoint", "/chat"), ("le", "0.5"), ("method", "POST")))] == 1
+    assert samples[("websocket_connections", ())] == 2
+
+    model = (("model", "mock-model"), ("provider", "mock"))
+    assert samples[("llm_response_time_seconds_count", model)] == 1
+    assert samples[("llm_time_to_first_token_seconds_count", model)] == 1
+    assert samples[("llm_tokens_per_second_count", model)] == 1
+    assert samples[("llm_admission_in_flight", (("model", "mock-model"),))] == 1
+    assert samples[("llm_admission_queue_depth", (("model", "mock-model"), ("priority", "interactive")))] == 0
+
+
+@pytest.mark.asyncio
+async def test_collector_exports_pool_cache_coalescing_store_batching_and_job_metrics(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "mock")
+    monkeypatch.setenv("LLM_MODEL_NAME", "mock-model")
+    monkeypatch.setenv("LLM_RESPONSE_CACHE_ENABLED", "true")
+    monkeypatch.setenv("LLM_SEMANTIC_CACHE_ENABLED", "true")
+    monkeypatch.setenv("LLM_MICROBATCH_ENABLED", "true")
+    service = LLMService()
+    service.upstreams.clients["ollama"] = UpstreamPool(
+        "ollama", ["http://a.local", "http://b.local"],
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json={}))
+    )
+    await service.upstreams.clients["ollama"].request("GET", "/api/version")
+    ejected = service.upstreams.clients["ollama"].endpoints[1]
+    ejected.ejected_until, ejected.ejections = time.monotonic() + 30, 1
+    service.hf_batcher.batch_size_histogram.observe(3)
+    manager = JobManager(_runner)
+    manager.submit("hello", "conv-job")
+    registry = create_registry(ServiceCollector(service, HTTPMetrics(), lambda: 0, manager.get_stats))
+
+    for conversation_id in ("conv-1", "conv-2"):
+        await service.process_message("Hello there", conversation_id)
+    samples = scrape(registry)
+
+    pool = [("endpoint", "http://a.local"), ("upstream", "ollama")]
+    ejected_endpoint = (("endpoint", "http://b.local"), ("upstream", "ollama"))
+    requests = sum(
+        samples[("llm_upstream_requests_total", (("endpoint", url), ("upstream", "ollama")))]
+        for url in ("http://a.local", "http://b.local")
+    )
+    assert requests == 1
+    assert samples[("llm_upstream_connections", tuple(sorted(pool + [("state", "in_use")])))] == 0
+    assert ("llm_upstream_pool_waits_total", tuple(pool)) in samples
+    assert ("llm_upstream_ewma_latency_seconds", tuple(pool)) in samples
+    assert samples[("llm_upstream_outstanding_requests", tuple(pool))] == 0
+    assert samples[("llm_upstream_ejected", ejected_endpoint)] == 1
+    assert samples[("llm_upstream_ejections_total", ejected_endpoint)] == 1
+
+    assert samples[("llm_cache_lookups_total", (("cache", "exact"), ("result", "hit")))] == 1
+    assert samples[("llm_cache_lookups_total", (("cache", "exact"), ("result", "miss")))] == 1
+    assert samples[("llm_cache_entries", (("cache", "exact"),))] == 1
+    assert ("llm_cache_evictions_total", (("cache", "semantic"),)) in samples
+    assert samples[("llm_coalescing_requests_total", (("kind", "calls"),))] >= 1
+    assert ("llm_coalesced_requests_total", (("kind", "streams"),)) in samples
+
+    assert samples[("llm_conversation_store_conversations", ())] == 2
+    assert samples[("llm_conversation_store_bytes", ())] > 0
+    assert samples[("llm_conversation_store_evictions_total", (("reason", "lru"),))] == 0
+
+    assert samples[("llm_microbatch_size_count", ())] == 1
+    assert samples[("llm_microbatch_size_bucket", (("le", "4.0"),))] == 1
+    assert samples[("llm_microbatch_wait_seconds_count", ())] == 0
+
+    assert samples[("llm_jobs", (("status", "succeeded"),))] == 1
+    assert samples[("llm_jobs", (("status", "queued"),))] == 0
+    assert samples[("llm_job_outcomes_total", (("outcome", "submitted"),))] == 1
+    await manager.close()
@@ -0,0 +1,151 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.llm_service import LLMService
+from app.model_registry import ModelRegistry, ModelUnavailableError, UnknownModelError, estimate_model_bytes
+from app.upstream import UpstreamClient
+
+GIB = 1024 ** 3
+
+
+def test_estimate_from_parameter_count():
+    assert estimate_model_bytes("7B", 0.5) == 3_500_000_000
+    assert estimate_model_bytes("350M", 1.0) == 350_000_000
+    assert estimate_model_bytes("Large") == 0
+    assert estimate_model_bytes(None) == 0
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_idle_model_is_evicted():
+    unloaded = []
+    busy = set()
+
+    async def load(provider, model):
+        return f"{model}:latest", {"name": model}, 2 * GIB
+
+    async def unload(provider, model):
+        unloaded.append(model)
+
+    registry = ModelRegistry(load, unload, memory_budget_bytes=5 * GIB, is_busy=lambda model: model in busy)
+    registry.register("ollama", "phi:latest", {}, size_bytes=1 * GIB, pin=True)
+    await registry.ensure("ollama", "llama2")
+    await registry.ensure("ollama", "mistral")
+    await registry.ensure("ollama", "llama2")     # llama2 is now more recent than mistral
+
+    await registry.ensure("ollama", "codellama")
+    assert unloaded == ["mistral:latest"]
+    assert set(registry.get_stats()["loaded"]) == {"ollama:phi:latest", "ollama:llama2:latest",
+                                                    "ollama:codellama:latest"}
+
+    # Busy and pinned models stay, even over budget
+    busy.add("llama2:latest")
+    busy.add("codellama:latest")
+    await registry.ensure("ollama", "tinyllama")
+    assert unloaded == ["mistral:latest"]
+    assert registry.used_bytes > registry.memory_budget_bytes
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_load_and_failures_surface():
+    loads = 0
+
+    async def load(provider, model):
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.02)
+        if model == "broken":
+            raise RuntimeError("pull failed")
+        return model, {}, 0
+
+    async def unload(provider, model):
+        pass
+
+    registry = ModelRegistry(load, unload)
+    entries = await asyncio.gather(*(registry.ensure("ollama", "llama2") for _ in range(5)))
+    assert loads == 1
+    assert all(entry is entries[0] for entry in entries)
+    assert registry.get_stats()["hits"] == 0
+
+    with pytest.raises(ModelUnavailableError):
+        await registry.ensure("ollama", "broken")
+    assert registry.get_stats()["load_failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_messages_can_name_their_own_model(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "ollama")
+    monkeypatch.setenv("LLM_MODEL_NAME", "phi:latest")
+    service = LLMService()
+
+    async def handler(request):
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [
+                {"name": "phi:latest", "size": 1_600_000_000},
+                {"name": "llama2:latest", "size": 3_800_000_000},
+            ]})
+        body = json.loads(request.content)
+        return httpx.Response(200, json={"response": f"from {body['model']}", "done": True})
+
+    service.upstreams.clients["ollama"] = UpstreamClient(
+        "ollama", "http://ollama.local", transport=httpx.MockTransport(handler)
+    )
+
+    assert await service.process_message("Hello", "conv-a", model="llama2") == "from llama2:latest"
+    assert await service.process_message("Hello", "conv-b") == "from phi:latest"
+    assert service.model_name == "phi:latest"
+
+    stats = service.get_model_stats()
+    assert stats["registry"]["loaded"]["ollama:llama2:latest"]["size_bytes"] == 3_800_000_000
+    assert set(stats["response_time_seconds"]) == {"ollama:llama2:latest", "ollama:phi:latest"}
+
+    with pytest.raises(UnknownModelError):
+        await service.process_message("Hello", "conv-c", provider="bogus")
+
+
+@pytest.mark.asyncio
+async def test_messages_may_only_name_catalogue_models(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "ollama")
+    service = LLMService()
+    requests = []
+
+    async def handler(request):
+        requests.append(request.url.path)
+        return httpx.Response(200, json={"models": []})
+
+    service.upstreams.clients["ollama"] = UpstreamClient(
+        "ollama", "http://ollama.local", transport=httpx.MockTransport(handler)
+    )
+
+    for model in ("llama2:70b", "phi-anything-at-all", "mistral-large:123b"):
+        with pytest.raises(UnknownModelError):
+            await service.process_message("Hello", "conv", model=model)
+    assert requests == []
+    assert service._validate_model("ollama", "deepseek-coder:6.7b")["size"] == "6.7B"
+    assert service._validate_model("ollama", "llama2:latest")["size"] == "7B"
+
+
+@pytest.mark.asyncio
+async def test_admin_switch_to_another_tag_is_sized_from_the_tag(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "ollama")
+    monkeypatch.setenv("LLM_MODEL_NAME", "phi")
+    service = LLMService()
+
+    async def handler(request):
+        if request.url.path == "/api/tags":
+            # The endpoint has only the 7B tag; the switch must pull 13b, not reuse it
+            return httpx.Response(200, json={"models": [{"name": "llama2:latest", "size": 3_800_000_000}]})
+        return httpx.Response(200, json={"status": "success", "response": "Hi", "done": True})
+
+    service.upstreams.clients["ollama"] = UpstreamClient(
+        "ollama", "http://ollama.local", transport=httpx.MockTransport(handler)
+    )
+
+    assert service._validate_model("ollama", "llama2:13b", allow_unlisted_tags=True) == {}
+    assert await service.switch_model("ollama", "llama2:13b")
+    assert service.model_name == "llama2:13b"
+    loaded = service.get_model_stats()["registry"]["loaded"]["ollama:llama2:13b"]
+    assert loaded["size_bytes"] == estimate_model_bytes("13B", service.model_registry.bytes_per_parameter)
+    assert not await service.switch_model("ollama", "phi-anything-at-all")
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.llm_service import LLMService
+from app.upstream import UpstreamClient
+
+
+def make_service(monkeypatch, handler) -> LLMService:
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "ollama")
+    monkeypatch.setenv("LLM_MODEL_NAME", "phi")
+    monkeypatch.setenv("LLM_COALESCE_REQUESTS", "false")
+    service = LLMService()
+    service.upstreams.clients["ollama"] = UpstreamClient(
+        "ollama", "http://ollama.local", transport=httpx.MockTransport(handler)
+    )
+    service.model_loaded = True
+    return service
+
+
+@pytest.mark.asyncio
+async def test_switch_warms_new_model_and_drains_old_one(monkeypatch):
+    events = []
+
+    async def handler(request):
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": "phi:latest"}]})
+        if request.url.path == "/api/pull":
+            events.append("pull")
+            return httpx.Response(200, json={"status": "success"})
+        body = json.loads(request.content)
+        if body.get("keep_alive") == 0:
+            events.append(f"unload {body['model']}")
+            return httpx.Response(200, json={"done": True})
+        if body.get("options", {}).get("num_predict") == 1:
+            events.append(f"warm {body['model']}")
+            return httpx.Response(200, json={"response": "Hi", "done": True})
+        await asyncio.sleep(0.2)
+        events.append(f"answer {body['model']}")
+        return httpx.Response(200, json={"response": f"from {body['model']}", "done": True})
+
+    service = make_service(monkeypatch, handler)
+    in_flight = asyncio.ensure_future(service.process_message("Hello", "conv-old"))
+    await asyncio.sleep(0.05)
+
+    assert await service.switch_model("ollama", "llama2")
+    assert (service.model_provider, service.model_name) == ("ollama", "llama2")
+    assert service.model_loaded
+
+    # The request that started on phi finishes on phi, and phi is unloaded only afterwards
+    assert await in_flight == "from phi"
+    while service._retiring:
+        await asyncio.sleep(0.01)
+    assert events == ["pull", "warm llama2", "answer phi", "unload phi"]
+
+    assert await service.process_message("Hello", "conv-new") == "from llama2"
+    assert (await service.get_model_status())["switches"] == {"succeeded": 1, "failed": 0}
+
+
+@pytest.mark.asyncio
+async def test_failed_warm_up_leaves_current_model_serving(monkeypatch):
+    async def handler(request):
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": []})
+        if request.url.path == "/api/pull":
+            return httpx.Response(500, text="disk full")
+        return httpx.Response(200, json={"response": "still phi", "done": True})
+
+    service = make_service(monkeypatch, handler)
+    assert not await service.switch_model("ollama", "llama2")
+    assert (service.model_name, service.model_loaded) == ("phi", True)
+    assert await service.process_message("Hello", "conv") == "still phi"
+    assert (await service.get_model_status())["switches"]["failed"] == 1
@@ -0,0 +1,119 @@
+import json
+
+import httpx
+import pytest
+
+from app.llm_service import LLMService
+from app.ollama_context import pack_context, unpack_context
+from app.upstream import UpstreamClient
+
+
+def test_context_round_trip_requires_matching_anchor():
+    packed = pack_context("Hello there!", [1, 2, 3, 40000])
+    assert unpack_context(packed, "Hello there!") == [1, 2, 3, 40000]
+    assert unpack_context(packed, "A different reply") is None
+    assert unpack_context(None, "Hello there!") is None
+
+
+@pytest.mark.asyncio
+async def test_second_turn_reuses_kv_context(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "ollama")
+    monkeypatch.setenv("LLM_COALESCE_REQUESTS", "false")
+    requests = []
+
+    def handler(request):
+        payload = json.loads(request.content)
+        requests.append(payload)
+        return httpx.Response(200, json={
+            "response": f"reply {len(requests)}",
+            "context": list(payload.get("context", [])) + [len(requests)] * 10,
+            "prompt_eval_count": len(payload["prompt"]) // 4,
+            "prompt_eval_duration": 5_000_000,
+        })
+
+    service = LLMService()
+    service.upstreams.clients["ollama"] = UpstreamClient(
+        "ollama", "http://ollama.local", transport=httpx.MockTransport(handler)
+    )
+
+    await service.process_message("What is Kubernetes?", "conv")
+    await service.process_message("And what is a pod?", "conv")
+
+    assert "context" not in requests[0]
+    assert requests[1]["context"] == [1] * 10
+    assert "Context:" not in requests[1]["prompt"]
+    assert requests[1]["keep_alive"] == service.ollama_keep_alive
+    stats = service.get_prefill_stats()
+    assert stats["text"]["count"] == 1
+    assert stats["kv_context"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_text_when_context_is_lost(monkeypatch):
+    monkeypatch.setenv("LLM_COALESCE_REQUESTS", "false")
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json={"response": "reply", "context": [7, 7, 7]})
+
+    service = LLMService()
+    service.upstreams.clients["ollama"] = UpstreamClient(
+        "ollama", "http://ollama.local", transport=httpx.MockTransport(handler)
+    )
+    service.model_provider = "ollama"
+
+    await service.process_message("first", "conv")
+    await service.conversation_store.set_state("conv", service._ollama_context_state_key(service.model_name), None)
+    await service.process_message("second", "conv")
+
+    assert "context" not in requests[1]
+    assert requests[1]["prompt"].startswith("Context:")
+
+
+@pytest.mark.asyncio
+async def test_generation_stages_are_returned_and_aggregated(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "ollama")
+    monkeypatch.setenv("LLM_COALESCE_REQUESTS", "false")
+    timing = {
+        "load_duration": 2_000_000_000,
+        "prompt_eval_count": 40,
+        "prompt_eval_duration": 400_000_000,
+        "eval_count": 50,
+        "eval_duration": 1_000_000_000,
+        "total_duration": 3_500_000_000,
+    }
+
+    def handler(request):
+        if json.loads(request.content)["stream"]:
+            lines = [{"response": "Hi", "done": False}, {"response": "!", "done": True, **timing}]
+            return httpx.Response(200, content="\n".join(json.dumps(line) for line in lines))
+        return httpx.Response(200, json={"response": "Hello", **timing})
+
+    service = LLMService()
+    service.upstreams.clients["ollama"] = UpstreamClient(
+        "ollama", "http://ollama.local", transport=httpx.MockTransport(handler)
+    )
+
+    metadata = {}
+    await service.process_message("What is Kubernetes?", "conv", metadata=metadata)
+    assert metadata["model"] == service.model_name
+    assert metadata["generation"] == {
+        "load_seconds": 2.0,
+        "prefill_seconds": 0.4,
+        "prompt_tokens": 40,
+        "decode_seconds": 1.0,
+        "completion_tokens": 50,
+        "tokens_per_second": 50.0,
+        "upstream_seconds": 3.5,
+    }
+
+    events = [event async for event in service.stream_message("And a pod?", "conv")]
+    assert events[-1]["metadata"]["generation"]["tokens_per_second"] == 50.0
+
+    stats = service.get_model_stats()
+    key = f"ollama:{service.model_name}"
+    assert stats["stage_seconds"]["load"][key]["count"] == 2
+    assert stats["stage_seconds"]["decode"][key]["sum"] == 2.0
+    # Upstream-reported rates replace the stream-timed estimate
+    assert stats["tokens_per_second"][key]["count"] == 2
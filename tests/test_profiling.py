@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+
+from app.profiling import ProfileInProgressError, Profiler
+
+retained = []
+
+
+async def busy_loop(stop: asyncio.Event):
+    while not stop.is_set():
+        deadline = time.perf_counter() + 0.01
+        while time.perf_counter() < deadline:
+            pass
+        await asyncio.sleep(0)
+
+
+async def hoard(stop: asyncio.Event):
+    while not stop.is_set():
+        retained.append(bytearray(64 * 1024))
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_profile_samples_event_loop_stacks():
+    profiler = Profiler(interval=0.001)
+    stop = asyncio.Event()
+    task = asyncio.ensure_future(busy_loop(stop))
+    try:
+        result = await profiler.profile(0.3)
+    finally:
+        stop.set()
+        await task
+
+    assert result.samples > 10
+    assert result.duration >= 0.3
+    assert 0 < result.overhead < 0.5
+    collapsed = result.collapsed()
+    assert "busy_loop (test_profiling.py:" in collapsed
+    # Collapsed format: semicolon-separated frames, outermost first, then a count
+    stack, count = collapsed.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0 and ";" in stack
+
+
+@pytest.mark.asyncio
+async def test_one_profile_at_a_time_and_windows_are_capped():
+    profiler = Profiler(interval=0.001, max_seconds=0.2)
+    running = asyncio.ensure_future(profiler.profile(10))
+    await asyncio.sleep(0.05)
+    with pytest.raises(ProfileInProgressError):
+        await profiler.memory_diff(0.1)
+    result = await running
+    assert result.duration < 1.0
+    assert profiler.get_stats()["profiles"] == 1
+
+
+@pytest.mark.asyncio
+async def test_memory_diff_reports_growth_by_line():
+    profiler = Profiler()
+    stop = asyncio.Event()
+    task = asyncio.ensure_future(hoard(stop))
+    try:
+        report = await profiler.memory_diff(0.2, limit=5)
+    finally:
+        stop.set()
+        await task
+        retained.clear()
+
+    assert report.startswith("# +")
+    assert "test_profiling.py" in report
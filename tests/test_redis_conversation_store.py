@@ -0,0 +1,198 @@
+import asyncio
+
+import pytest
+
+from app.conversation_store import RedisConversationStore
+from app.redis_client import RedisClient
+
+
+class FakeRedisServer:
+    """Local stand-in speaking just enough RESP for the conversation store"""
+
+    def __init__(self):
+        self.lists = {}
+        self.strings = {}
+        self.hashes = {}
+        self.expiries = {}
+        self.delays = {}
+        self.reads = 0
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _read_command(self, reader):
+        header = await reader.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def _handle(self, reader, writer):
+        while True:
+            args = await self._read_command(reader)
+            if args is None:
+                break
+            if len(args) > 1 and args[1] in self.delays:
+                await asyncio.sleep(self.delays[args[1]])
+            writer.write(self._dispatch(args))
+            await writer.drain()
+        writer.close()
+
+    def _dispatch(self, args):
+        command, key = args[0].upper(), args[1] if len(args) > 1 else None
+        items = self.lists.setdefault(key, [])
+        if command == b"RPUSH":
+            items.extend(args[2:])
+            return f":{len(items)}\r\n".encode()
+        if command == b"LTRIM":
+            start, stop = int(args[2]), int(args[3])
+            self.lists[key] = items[start:] if stop == -1 else items[start:stop + 1]
+            return b"+OK\r\n"
+        if command == b"EXPIRE":
+            self.expiries[key] = int(args[2])
+            return b":1\r\n"
+        if command == b"LRANGE":
+            self.reads += 1
+            start, stop = int(args[2]), int(args[3])
+            selected = items[max(start, -len(items)):] if stop == -1 else items[start:stop + 1]
+            reply = [f"*{len(selected)}\r\n".encode()]
+            for item in selected:
+                reply.append(f"${len(item)}\r\n".encode() + item + b"\r\n")
+            return b"".join(reply)
+        if command == b"HSET":
+            self.hashes.setdefault(key, {})[args[2]] = args[3]
+            return b":1\r\n"
+        if command == b"HDEL":
+            self.hashes.get(key, {}).pop(args[2], None)
+            return b":1\r\n"
+        if command == b"HGETALL":
+            fields = self.hashes.get(key, {})
+            reply = [f"*{len(fields) * 2}\r\n".encode()]
+            for field, value in fields.items():
+                for item in (field, value):
+                    reply.append(f"${len(item)}\r\n".encode() + item + b"\r\n")
+            return b"".join(reply)
+        if command == b"SET":
+            self.strings[key] = args[2]
+            return b"+OK\r\n"
+        if command == b"GET":
+            value = self.strings.get(key)
+            return b"$-1\r\n" if value is None else f"${len(value)}\r\n".encode() + value + b"\r\n"
+        if command == b"DEL":
+            self.lists.pop(key, None)
+            self.strings.pop(key, None)
+            self.hashes.pop(key, None)
+            return b":1\r\n"
+        return b"-ERR unknown command\r\n"
+
+
+@pytest.mark.asyncio
+async def test_history_is_shared_between_replicas():
+    server = FakeRedisServer()
+    await server.start()
+    url = f"redis://127.0.0.1:{server.port}/0"
+    pod_a = RedisConversationStore(RedisClient(url), max_messages=3, local_cache_ttl=0)
+    pod_b = RedisConversationStore(RedisClient(url), max_messages=3, local_cache_ttl=0)
+    try:
+        for i in range(4):
+            await pod_a.append("conv", "user", f"message {i}")
+
+        history = await pod_b.recent("conv")
+        assert [m.content for m in history] == ["message 1", "message 2", "message 3"]
+        assert [m.content for m in await pod_b.recent("conv", 1)] == ["message 3"]
+        # RPUSH, LTRIM and EXPIRE go out together in one round trip per append
+        assert pod_a.client.round_trips == 4
+        assert server.expiries[b"llm-chatbot:conv:conv"] == 1800
+    finally:
+        await pod_a.close()
+        await pod_b.close()
+        await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_local_cache_serves_repeated_reads():
+    server = FakeRedisServer()
+    await server.start()
+    store = RedisConversationStore(RedisClient(f"redis://127.0.0.1:{server.port}"), local_cache_ttl=60)
+    try:
+        await store.append("conv", "user", "hello")
+        await store.recent("conv")
+        await store.append("conv", "assistant", "hi there")
+        history = await store.recent("conv")
+
+        assert [m.content for m in history] == ["hello", "hi there"]
+        assert server.reads == 1
+        assert store.get_stats()["local_cache_hits"] == 1
+    finally:
+        await store.close()
+        await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_context_build_reads_history_and_state_in_one_round_trip():
+    server = FakeRedisServer()
+    await server.start()
+    url = f"redis://127.0.0.1:{server.port}"
+    writer = RedisConversationStore(RedisClient(url), local_cache_ttl=0)
+    reader = RedisConversationStore(RedisClient(url), local_cache_ttl=60)
+    try:
+        await writer.append("conv", "user", "hello")
+        await writer.set_state("conv", "summary", b"earlier turns")
+        await writer.set_state("conv", "ollama_context:phi", b"tokens")
+
+        # What a context build asks for: history, the summary and the KV context
+        history = await reader.recent("conv")
+        summary = await reader.get_state("conv", "summary")
+        context = await reader.get_state("conv", "ollama_context:phi")
+
+        assert [m.content for m in history] == ["hello"]
+        assert (summary, context) == (b"earlier turns", b"tokens")
+        assert reader.client.round_trips == 1
+
+        # State writes go through the local cache and are visible to other replicas
+        await reader.set_state("conv", "summary", None)
+        assert await reader.get_state("conv", "summary") is None
+        assert await writer.get_state("conv", "summary") is None
+        assert server.expiries[b"llm-chatbot:conv:conv:state"] == 1800
+    finally:
+        await writer.close()
+        await reader.close()
+        await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_unreachable_backend_degrades_to_local_history():
+    store = RedisConversationStore(RedisClient("redis://127.0.0.1:1", timeout=0.5))
+    await store.append("conv", "user", "hello")
+    assert [m.content for m in await store.recent("conv")] == ["hello"]
+    assert store.get_stats()["backend_errors"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_command_does_not_leave_its_reply_for_the_next_caller():
+    server = FakeRedisServer()
+    await server.start()
+    server.strings = {b"slow": b"SLOW", b"fast": b"FAST"}
+    server.delays[b"slow"] = 0.2
+    client = RedisClient(f"redis://127.0.0.1:{server.port}", pool_size=1)
+    try:
+        pending = asyncio.ensure_future(client.execute("GET", "slow"))
+        await asyncio.sleep(0.05)
+        pending.cancel()
+        await asyncio.gather(pending, return_exceptions=True)
+
+        assert await client.execute("GET", "fast") == b"FAST"
+        assert client.get_stats()["open_connections"] == 1
+    finally:
+        await client.close()
+        await server.stop()
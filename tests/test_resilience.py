@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.llm_service import LLMService
+from app.resilience import CircuitBreaker, parse_provider_chain
+from app.upstream import UpstreamClient, UpstreamPool
+
+
+def test_breaker_opens_on_failures_and_closes_after_trial():
+    breaker = CircuitBreaker("ollama", window_size=4, min_calls=4, open_seconds=0.05)
+    for failed in (False, True, True, False):
+        assert breaker.allow()
+        breaker.record(failed, 0.1)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()          # The single trial call
+    assert not breaker.allow()      # Others wait for its verdict
+    breaker.record(False, 0.1)
+    assert breaker.state == "closed"
+    assert breaker.get_stats()["short_circuited"] == 2
+
+
+def test_breaker_opens_on_slow_calls():
+    breaker = CircuitBreaker("ollama", min_calls=3, slow_call_seconds=1.0, slow_call_rate_threshold=0.6)
+    for duration in (2.0, 0.1, 3.0):
+        breaker.record(False, duration)
+    assert breaker.state == "open"
+
+
+def test_provider_chain_parsing():
+    assert parse_provider_chain("ollama:phi:latest, huggingface:gpt2,mock") == [
+        ("ollama", "phi:latest"), ("huggingface", "gpt2"), ("mock", None)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_failover_to_next_provider_is_not_cached(monkeypatch):
+    def handler(request):
+        return httpx.Response(500, json={"error": "model crashed"})
+
+    monkeypatch.setenv("LLM_PROVIDER_CHAIN", "mock")
+    monkeypatch.setenv("LLM_RESPONSE_CACHE_ENABLED", "true")
+    service = LLMService()
+    service.upstreams.clients["ollama"] = UpstreamClient(
+        "ollama", "http://ollama.local", transport=httpx.MockTransport(handler)
+    )
+
+    response = await service.process_message("hello", "conv")
+    assert "hello" in response  # The mock provider echoes the message
+    assert service.get_circuit_breaker_stats()["ollama"]["recent_failures"] == 1
+    assert service.get_cache_stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_cancels_the_stalled_endpoint():
+    cancelled = []
+
+    async def handler(request):
+        if request.url.host == "stalled.local":
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(request.url.host)
+                raise
+        return httpx.Response(200, json={"host": request.url.host})
+
+    pool = UpstreamPool(
+        "ollama", ["http://stalled.local", "http://healthy.local"],
+        hedge_min_samples=5, transport=httpx.MockTransport(handler)
+    )
+    for _ in range(5):
+        pool.latency_histogram.observe(0.02)
+    pool.endpoints[1].ewma_latency = 1.0  # Make the stalled endpoint the first choice
+
+    start = time.time()
+    response = await pool.hedged_request("POST", "/api/generate", json={})
+    await asyncio.sleep(0.01)
+
+    assert response.json()["host"] == "healthy.local"
+    assert time.time() - start < 1
+    assert cancelled == ["stalled.local"]
+    assert pool.get_stats()["hedges_won"] == 1
+    await pool.close()
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from app.llm_service import LLMService
+from app.response_cache import ENTRY_OVERHEAD_BYTES, ResponseCache, normalize_message
+
+
+def test_cache_hit_and_miss_counters():
+    cache = ResponseCache(max_bytes=10_000, ttl_seconds=60)
+    assert cache.get("k") is None
+    cache.set("k", "value")
+    assert cache.get("k") == "value"
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_cache_entries_expire(monkeypatch):
+    cache = ResponseCache(max_bytes=10_000, ttl_seconds=1)
+    cache.set("k", "value")
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 2)
+    assert cache.get("k") is None
+    assert cache.get_stats()["expirations"] == 1
+    assert cache.current_bytes == 0
+
+
+def test_lru_eviction_respects_byte_budget():
+    entry_size = 1 + 100 + ENTRY_OVERHEAD_BYTES
+    cache = ResponseCache(max_bytes=entry_size * 2, ttl_seconds=60)
+    cache.set("a", "x" * 100)
+    cache.set("b", "x" * 100)
+    cache.get("a")  # "b" is now least recently used
+    cache.set("c", "x" * 100)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get_stats()["evictions"] == 1
+    assert cache.current_bytes <= cache.max_bytes
+
+
+def test_normalize_message():
+    assert normalize_message("  What is   Kubernetes? ") == normalize_message("what is kubernetes?")
+
+
+@pytest.mark.asyncio
+async def test_process_message_serves_repeats_from_cache(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "mock")
+    monkeypatch.setenv("LLM_RESPONSE_CACHE_ENABLED", "true")
+    service = LLMService()
+    calls = 0
+    original = service._process_mock_message
+
+    async def counting(message, conversation_id):
+        nonlocal calls
+        calls += 1
+        return await original(message, conversation_id)
+
+    monkeypatch.setattr(service, "_process_mock_message", counting)
+
+    first = await service.process_message("What is Kubernetes?", "conv-a")
+    second = await service.process_message("what is  kubernetes?", "conv-b")
+    assert first == second
+    assert calls == 1
+
+    await service.process_message("What is Kubernetes?", "conv-c", use_cache=False)
+    assert calls == 2
+    assert service.get_cache_stats()["hits"] == 1
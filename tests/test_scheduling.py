@@ -0,0 +1,39 @@
+from app.scheduling import FairQueue, parse_weights
+
+
+def drain(queue):
+    order = []
+    while len(queue):
+        item, _ = queue.pop()
+        order.append(item)
+    return order
+
+
+def test_heavy_user_does_not_starve_others():
+    queue = FairQueue()
+    for i in range(4):
+        queue.push(f"heavy{i}", "bulk", "heavy")
+    queue.push("light0", "bulk", "light")
+    queue.push("light1", "bulk", "light")
+
+    assert drain(queue)[:4] == ["heavy0", "light0", "heavy1", "light1"]
+
+
+def test_class_weights_share_service():
+    queue = FairQueue({"interactive": 3, "bulk": 1})
+    for i in range(8):
+        queue.push(f"b{i}", "bulk", "batch")
+        queue.push(f"i{i}", "interactive", "chat")
+
+    first_eight = drain(queue)[:8]
+    assert sum(item.startswith("i") for item in first_eight) == 6
+
+
+def test_remove_and_user_weights():
+    queue = FairQueue(user_weights=parse_weights("vip=2, other=1"))
+    queue.push("a", "bulk", "other")
+    queue.push("b", "bulk", "other")
+    assert queue.remove("a", "bulk", "other")
+    assert not queue.remove("a", "bulk", "other")
+    assert len(queue) == 1 and queue.class_size("bulk") == 1
+    assert queue.user_weights == {"vip": 2.0, "other": 1.0}
@@ -0,0 +1,46 @@
+import pytest
+
+from app.llm_service import LLMService
+from app.semantic_cache import HashedNgramVectorizer, SemanticCache
+
+vectorizer = HashedNgramVectorizer(dim=256)
+
+
+def test_paraphrase_hits_and_unrelated_prompt_misses():
+    cache = SemanticCache(dim=256, capacity=8, threshold=0.9)
+    cache.insert(vectorizer.vectorize("What is Kubernetes?"), "ollama:phi", "Kubernetes is...")
+
+    hit = cache.lookup(vectorizer.vectorize("Explain Kubernetes"), "ollama:phi")
+    assert hit is not None and hit[0] == "Kubernetes is..."
+    assert cache.lookup(vectorizer.vectorize("What is Docker?"), "ollama:phi") is None
+    # Answers never leak across models
+    assert cache.lookup(vectorizer.vectorize("Explain Kubernetes"), "ollama:mistral") is None
+
+
+def test_capacity_is_bounded():
+    cache = SemanticCache(dim=256, capacity=2, threshold=0.9)
+    for topic in ("docker", "kubernetes", "helm"):
+        cache.insert(vectorizer.vectorize(f"What is {topic}?"), "scope", topic)
+    stats = cache.get_stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_process_message_reuses_answer_for_paraphrase(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "mock")
+    monkeypatch.setenv("LLM_SEMANTIC_CACHE_ENABLED", "true")
+    service = LLMService()
+    calls = 0
+
+    async def generate(message, conversation_id):
+        nonlocal calls
+        calls += 1
+        return f"answer {calls}"
+
+    monkeypatch.setattr(service, "_process_mock_message", generate)
+
+    first = await service.process_message("What is Kubernetes?", "conv-1")
+    second = await service.process_message("Explain Kubernetes", "conv-2")
+    assert first == second == "answer 1"
+    assert service.get_semantic_cache_stats()["hits"] == 1
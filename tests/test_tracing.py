@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.llm_service import LLMService
+from app.tracing import Trace, Tracer, TracingMiddleware
+from app.upstream import UpstreamClient
+
+CALLER = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+
+def test_traceparent_continues_valid_headers_only():
+    trace = Trace.from_traceparent("POST /chat", CALLER)
+    assert trace.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+    assert trace.root.parent_id == "00f067aa0ba902b7"
+    assert trace.traceparent() == f"00-{trace.trace_id}-{trace.root.span_id}-01"
+
+    assert not Trace.from_traceparent("POST /chat", CALLER[:-2] + "00").sampled
+    for header in (None, "garbage", "00-" + "0" * 32 + "-00f067aa0ba902b7-01"):
+        fresh = Trace.from_traceparent("POST /chat", header)
+        assert fresh.root.parent_id is None and len(fresh.trace_id) == 32
+
+
+@pytest.mark.asyncio
+async def test_service_records_stages_and_propagates_to_upstream(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_PROVIDER", "ollama")
+    monkeypatch.setenv("LLM_COALESCE_REQUESTS", "false")
+    headers = []
+
+    def handler(request):
+        headers.append(request.headers.get("traceparent"))
+        return httpx.Response(200, json={
+            "response": "reply",
+            "load_duration": 1_000_000,
+            "prompt_eval_count": 10,
+            "prompt_eval_duration": 2_000_000,
+            "eval_count": 5,
+            "eval_duration": 3_000_000,
+            "total_duration": 7_000_000,
+        })
+
+    service = LLMService()
+    service.upstreams.clients["ollama"] = UpstreamClient(
+        "ollama", "http://ollama.local", transport=httpx.MockTransport(handler)
+    )
+
+    trace = Trace.from_traceparent("POST /chat", CALLER)
+    await service.process_message("What is Kubernetes?", "conv", trace=trace)
+    trace.finish()
+
+    upstream = trace.last("upstream")
+    assert headers == [f"00-{trace.trace_id}-{upstream.span_id}-01"]
+    assert {"cache", "history", "queue", "context", "upstream", "load", "prefill", "decode"} <= set(trace.timings())
+    decode = trace.last("decode")
+    assert decode.parent_id == upstream.span_id
+    assert decode.end == upstream.end
+    assert abs(decode.duration - 0.003) < 1e-6
+
+
+def test_middleware_sets_server_timing_and_exports_to_file(tmp_path):
+    trace_file = tmp_path / "spans.jsonl"
+    tracer = Tracer(trace_file=str(trace_file))
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+
+    @app.get("/work")
+    async def work(request: Request):
+        with request.state.trace.span("handler"):
+            await asyncio.sleep(0.01)
+        return {"ok": True}
+
+    response = TestClient(app).get("/work", headers={"traceparent": CALLER})
+
+    timing = dict(entry.split(";dur=") for entry in response.headers["server-timing"].split(", "))
+    assert set(timing) == {"handler", "serialize", "total"}
+    assert float(timing["handler"]) >= 10.0
+    assert float(timing["total"]) >= float(timing["handler"])
+
+    asyncio.run(tracer.flush())
+    records = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    assert [record["name"] for record in records] == ["GET /work", "handler", "serialize"]
+    assert {record["trace_id"] for record in records} == {"4bf92f3577b34da6a3ce929d0e0e4736"}
+    assert records[0]["parent_span_id"] == "00f067aa0ba902b7"
+    assert tracer.get_stats()["exported_spans"] == 3
+
+
+@pytest.mark.asyncio
+async def test_collector_export_batches_and_drops_when_full():
+    batches = []
+
+    def handler(request):
+        batches.append(json.loads(request.content)["spans"])
+        return httpx.Response(200)
+
+    tracer = Tracer(
+        collector=UpstreamClient("trace-collector", "http://collector.local", transport=httpx.MockTransport(handler)),
+        max_queue=2
+    )
+    for index in range(3):
+        trace = Trace(f"request {index}")
+        trace.finish()
+        tracer.export(trace)
+    tracer.export(Trace("unsampled", sampled=False))
+    await tracer.close()
+
+    assert len(batches) == 1 and len(batches[0]) == 2
+    stats = tracer.get_stats()
+    assert stats["exported_spans"] == 2
+    assert stats["dropped"] == 1
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+import httpx
+
+from app.upstream import UpstreamClient, UpstreamClientManager, UpstreamPool
+
+
+def _echo_transport():
+    def handler(request):
+        return httpx.Response(200, json={"path": request.url.path})
+    return httpx.MockTransport(handler)
+
+
+@pytest.mark.asyncio
+async def test_upstream_client_reuses_one_client():
+    """The pooled client should be created once and reused across requests"""
+    client = UpstreamClient("test", "http://upstream.local", transport=_echo_transport())
+    await client.start()
+    underlying = client._client
+
+    for _ in range(3):
+        response = await client.get("/api/version")
+        assert response.json() == {"path": "/api/version"}
+
+    assert client._client is underlying
+    stats = client.get_stats()
+    assert stats["requests_total"] == 3
+    assert stats["in_use"] == 0
+    await client.close()
+    assert not client.is_started
+
+
+@pytest.mark.asyncio
+async def test_upstream_client_counts_errors():
+    """Transport errors are counted and re-raised"""
+    def handler(request):
+        raise httpx.ConnectError("refused")
+
+    client = UpstreamClient("test", "http://upstream.local", transport=httpx.MockTransport(handler))
+    with pytest.raises(httpx.ConnectError):
+        await client.get("/api/version")
+    assert client.get_stats()["errors_total"] == 1
+    await client.close()
+
+
+def test_manager_registers_each_endpoint_once():
+    """Registering the same provider twice returns the same client"""
+    manager = UpstreamClientManager()
+    first = manager.register("ollama", "http://localhost:11434")
+    second = manager.register("ollama", "http://localhost:11434")
+    assert first is second
+    assert set(manager.get_stats()) == {"ollama"}
+
+
+@pytest.mark.asyncio
+async def test_pool_prefers_idle_and_faster_endpoints():
+    """Requests spread by outstanding load and settle on the lower-latency endpoint"""
+    delays = {"slow.local": 0.1, "fast.local": 0.0}
+
+    async def handler(request):
+        await asyncio.sleep(delays[request.url.host])
+        return httpx.Response(200, json={"host": request.url.host})
+
+    pool = UpstreamPool("ollama", ["http://slow.local", "http://fast.local"], transport=httpx.MockTransport(handler))
+    hosts = await asyncio.gather(*(pool.get("/api/version") for _ in range(2)))
+    assert sorted(r.json()["host"] for r in hosts) == ["fast.local", "slow.local"]
+
+    hosts = [(await pool.get("/api/version")).json()["host"] for _ in range(5)]
+    assert hosts.count("fast.local") == 5
+    endpoints = pool.get_stats()["endpoints"]
+    assert endpoints[0]["ewma_latency_seconds"] > endpoints[1]["ewma_latency_seconds"]
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_ejects_failing_endpoint_and_readmits_after_probe():
+    """Consecutive failures eject an endpoint; a successful probe brings it back"""
+    down = {"a.local"}
+
+    def handler(request):
+        if request.url.host in down:
+            raise httpx.ConnectError("refused")
+        return httpx.Response(200, json={"host": request.url.host})
+
+    pool = UpstreamPool(
+        "ollama", ["http://a.local", "http://b.local"],
+        failure_threshold=2, ejection_seconds=0.05, transport=httpx.MockTransport(handler)
+    )
+    failures = 0
+    for _ in range(4):
+        try:
+            await pool.get("/api/generate")
+        except httpx.ConnectError:
+            failures += 1
+    assert failures == 2
+    assert pool.get_stats()["healthy_endpoints"] == 1
+
+    down.clear()
+    await asyncio.sleep(0.06)
+    await pool.get("/api/version")  # Triggers the probe of the ejected endpoint
+    await asyncio.sleep(0.01)
+    stats = pool.get_stats()
+    assert stats["healthy_endpoints"] == 2
+    assert stats["endpoints"][0]["ejections"] == 1
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_probe_survives_unexpected_errors_and_is_cancelled_on_close():
+    """A probe failing with a non-HTTP error keeps the endpoint ejected but probe-able; close stops probes"""
+    state = {"a.local": "down"}
+    hang = asyncio.Event()
+
+    async def handler(request):
+        mode = state.get(request.url.host)
+        if mode == "down":
+            raise httpx.ConnectError("refused")
+        if mode == "broken":
+            raise RuntimeError("unexpected")
+        if mode == "hang":
+            await hang.wait()
+        return httpx.Response(200)
+
+    pool = UpstreamPool(
+        "ollama", ["http://a.local", "http://b.local"],
+        failure_threshold=1, ejection_seconds=0.02, transport=httpx.MockTransport(handler)
+    )
+    with pytest.raises(httpx.ConnectError):
+        await pool.get("/api/generate")
+    ejected = pool.endpoints[0]
+    assert ejected.ejected
+
+    state["a.local"] = "broken"
+    await asyncio.sleep(0.03)
+    await pool.get("/api/version")
+    await asyncio.sleep(0.01)
+    assert ejected.ejected and not ejected.probing and not pool._probes
+
+    state["a.local"] = "hang"
+    await asyncio.sleep(0.03)
+    await pool.get("/api/version")
+    await asyncio.sleep(0.01)
+    assert ejected.probing and len(pool._probes) == 1
+    await pool.close()
+    assert not ejected.probing and not pool._probes